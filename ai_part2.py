@@ -1,104 +1,143 @@
 import os
 import sys
-from PIL import Image
-import matplotlib.pyplot as plt
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.platypus import (
-    SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer,
-    Image as RLImage
-)
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from openai import OpenAI
-
-# --- OpenAI Setup ---
-def make_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY", "")
-    if not api_key:
-        return None
-    try:
-        return OpenAI(api_key=api_key)
-    except Exception:
-        return None
+from concurrent.futures import Future, TimeoutError
+
+from ai_service import get_service
+
+# Pillow, matplotlib, the compositing engine and ReportLab are imported inside the functions that use
+# them, so the prompts come up without waiting on the plotting/PDF stacks.
+
+ASK_WAIT = float(os.getenv("TECHPACK_ASK_WAIT", 2.0))  # seconds a prompt waits for its rephrase
+SUMMARY_WAIT = float(os.getenv("TECHPACK_SUMMARY_WAIT", 5.0))  # grace once the report is laid out
 
-client = make_openai_client()
+# The fixed questions main() asks; rephrased once per process, in the background
+PROMPTS = {
+    "logo": "🖼️ Please enter the path to your logo image: ",
+    "cap": "🧢 Enter path to the cap/base image: ",
+    "size": "👉 Enter logo width and height (cm, separated by space): ",
+    "placement": "📍 Where should I place the logo? (front, side, back, etc.): ",
+    "another": "➕ Do you want to add another logo? (yes/no): ",
+}
+
+_asked = {}  # question -> Future with its rephrasing
 
 # --- AI helpers ---
-def ai_generate_description(placement: str, size_cm: tuple, image_name: str) -> str:
+def submit_description(placement: str, size_cm: tuple, image_name: str):
+    """Start generating a placement description; returns a Future with the text."""
     fallback = f"Logo placed on the {placement}, approximately {size_cm[0]:.1f}×{size_cm[1]:.1f} cm."
-    if client is None:
-        return fallback
-    try:
-        prompt = (
-            "You are a tech pack maker. Write a precise, professional one-sentence description "
-            f"for this placement.\nPlacement: {placement}\nSize: {size_cm[0]}×{size_cm[1]} cm\nFile: {image_name}"
-        )
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You write brief production notes for apparel tech packs."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.4,
-            max_tokens=80,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception:
-        return fallback
+    prompt = (
+        "You are a tech pack maker. Write a precise, professional one-sentence description "
+        f"for this placement.\nPlacement: {placement}\nSize: {size_cm[0]}×{size_cm[1]} cm\nFile: {image_name}"
+    )
+    return get_service().submit(
+        [
+            {"role": "system", "content": "You write brief production notes for apparel tech packs."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.4,
+        max_tokens=80,
+        fallback=fallback,
+    )
 
-def ai_generate_summary(items: list) -> str:
+def ai_generate_description(placement: str, size_cm: tuple, image_name: str) -> str:
+    return submit_description(placement, size_cm, image_name).result()
+
+def _done(text: str) -> Future:
+    future = Future()
+    future.set_result(text)
+    return future
+
+def _summary_fallback(items: list) -> str:
     if not items:
         return "No items were processed."
-    fallback = "\n".join(
+    return "Report summary:\n" + "\n".join(
         f"- {os.path.basename(i['image'])}: {i['placement']} @ {i['size_cm'][0]}×{i['size_cm'][1]} cm"
         for i in items
     )
-    if client is None:
-        return "Report summary:\n" + fallback
-    try:
-        bullet = "\n".join(
-            f"- File: {os.path.basename(i['image'])}, Placement: {i['placement']}, Size: {i['size_cm'][0]}×{i['size_cm'][1]} cm"
-            for i in items
-        )
-        prompt = (
-            "You are a tech pack maker. Write a short professional summary (2–4 sentences) for this report. Which should include what we want to make based on the data and dont include name of the images\n"
-        )
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You write summaries for apparel tech packs."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.4,
-            max_tokens=200,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception:
-        return fallback
-
-def ai_ask(question: str) -> str:
-    """Ask user a question as if AI is conducting the conversation."""
-    if client:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
+
+def submit_summary(items: list) -> Future:
+    """Start generating the report summary; returns a Future with the text."""
+    service = get_service()
+    if not items or service.backend is None:
+        return _done(_summary_fallback(items))
+    details = "\n".join(f"- {i['placement']}: {i['size_cm'][0]}×{i['size_cm'][1]} cm" for i in items)
+    prompt = (
+        "You are a tech pack maker. Write a short professional summary (2–4 sentences) for this report. Which should include what we want to make based on the data and dont include name of the images\n"
+        f"Logo placements:\n{details}"
+    )
+    return service.submit(
+        [
+            {"role": "system", "content": "You write summaries for apparel tech packs."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.4,
+        max_tokens=200,
+        fallback=_summary_fallback(items),
+    )
+
+def ai_generate_summary(items: list) -> str:
+    return submit_summary(items).result()
+
+class SummaryPrefetcher:
+    """
+    Keeps the report summary generating in the background while results
+    accumulate. update() after each new result re-submits only when the
+    placements, sizes or images the summary is written from have changed,
+    so by the time the report is built the text is usually already there.
+    """
+
+    def __init__(self):
+        self._key = None
+        self._future = None
+
+    def update(self, items: list) -> Future:
+        key = tuple((os.path.basename(i["image"]), i["placement"], tuple(i["size_cm"])) for i in items)
+        if key != self._key:
+            self._key, self._future = key, submit_summary(items)
+        return self._future
+
+def _ask_future(question: str) -> Future:
+    future = _asked.get(question)
+    if future is None:
+        future = _asked[question] = get_service().submit(
+            [
                 {"role": "system", "content": "You are a tech pack maker. Ask questions to collect logo, cap, size, and placement."},
                 {"role": "user", "content": question},
             ],
             temperature=0.5,
             max_tokens=50,
+            fallback=question,
         )
-        return resp.choices[0].message.content.strip()
-    else:
+    return future
+
+def prefetch_prompts(questions=PROMPTS.values()):
+    """Start rephrasing the fixed questions concurrently, before the first one is asked."""
+    for question in questions:
+        _ask_future(question)
+
+def ai_ask(question: str, timeout: float = ASK_WAIT) -> str:
+    """
+    Ask user a question as if AI is conducting the conversation. Each
+    question is rephrased once per process; if the rephrasing is not back
+    within timeout seconds, the plain question is asked instead and the
+    rephrasing keeps running for the next time it comes up.
+    """
+    try:
+        return _ask_future(question).result(timeout)
+    except TimeoutError:
         return question
 
 # --- Image helpers ---
 def resize_logo(logo_path, width_px, height_px):
+    from PIL import Image
+
     logo_img = Image.open(logo_path).convert("RGBA")
     return logo_img.resize((width_px, height_px))
 
 def get_click_coordinates(image_path):
+    import matplotlib.pyplot as plt
+    from PIL import Image
+
     coords = {}
     img = Image.open(image_path).convert("RGBA")
 
@@ -116,47 +155,61 @@ def get_click_coordinates(image_path):
     return coords.get("center")
 
 def apply_logo(cap_path, logo_path, width_px, height_px, out_path):
-    logo_resized = resize_logo(logo_path, width_px, height_px)
+    from compositing import render
+
     center = get_click_coordinates(cap_path)
     if not center:
         print("⚠️ No click registered, skipping.")
         return None
-    cx, cy = center
-    w, h = logo_resized.size
-    pos = (int(cx - w/2), int(cy - h/2))
-    cap_img = Image.open(cap_path).convert("RGBA")
-    composite = cap_img.copy()
-    composite.paste(logo_resized, pos, logo_resized)
-    composite.save(out_path)
+    try:
+        render(cap_path, [{"logo": logo_path, "center": center, "size": (width_px, height_px)}], out_path)
+    except Exception as e:
+        print(f"❌ Error applying logo: {e}")
+        return None
     print(f"✅ Saved {out_path}")
     return out_path
 
 # --- PDF Report ---
-def generate_pdf_report(results, pdf_path="logo_report.pdf"):
+def generate_pdf_report(results, pdf_path="logo_report.pdf", image_dpi=None, image_format="png", jpeg_quality=None,
+                        summary=None):
+    """
+    Builds the placement report. summary is the summary text or a Future
+    for it (e.g. from SummaryPrefetcher); by default it is requested here.
+    Either way it is only awaited once every image is prepared, for at most
+    SUMMARY_WAIT seconds, before the plain summary is used instead.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    from report_images import JPEG_QUALITY, REPORT_DPI, ReportImages, without_a85
+    from report_tables import DataTable
+
     doc = SimpleDocTemplate(pdf_path, pagesize=A4)
+    images = ReportImages(
+        dpi=image_dpi or REPORT_DPI, image_format=image_format, jpeg_quality=jpeg_quality or JPEG_QUALITY
+    )
     styles = getSampleStyleSheet()
     normal = ParagraphStyle("NormalWrap", parent=styles["Normal"], fontSize=9, wordWrap="CJK")
     story = []
     story.append(Paragraph("<b>Logo Placement Report</b>", styles["Title"]))
     story.append(Spacer(1, 6))
 
-    ai_summary = ai_generate_summary(results)
+    if summary is None:
+        summary = submit_summary(results)
     story.append(Paragraph("<b>Summary</b>", styles["Heading3"]))
-    story.append(Paragraph(ai_summary.replace("\n", "<br/>"), normal))
+    summary_index = len(story)
+    story.append(None)  # filled in once the images below are prepared
     story.append(Spacer(1, 12))
 
     table_data = [["Logo", "Size (cm)", "Placement", "AI Description"]]
     for item in results:
         size_cm = f"{item['size_cm'][0]}×{item['size_cm'][1]} cm"
-        logo_preview = RLImage(item["logo"], width=2*cm, height=2*cm)
-        table_data.append([
-            logo_preview,
-            Paragraph(size_cm, normal),
-            Paragraph(item["placement"], normal),
-            Paragraph(item["description"], normal),
-        ])
-    table = Table(table_data, colWidths=[3*cm, 3*cm, 4*cm, 6*cm])
-    table.setStyle(TableStyle([
+        logo_preview = images.flowable(item["logo"], 2*cm, 2*cm)
+        table_data.append([logo_preview, size_cm, item["placement"], item["description"]])
+    table = DataTable(table_data, [3*cm, 3*cm, 4*cm, 6*cm], [
         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 1), (0, -1), 'CENTER'),   # Center only logo column
@@ -165,7 +218,7 @@ def generate_pdf_report(results, pdf_path="logo_report.pdf"):
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
         ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
         ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
+    ], cell_style=normal)
 
     story.append(table)
     story.append(Spacer(1, 14))
@@ -177,8 +230,7 @@ def generate_pdf_report(results, pdf_path="logo_report.pdf"):
     cap_rows = []
     row = []
     for i, item in enumerate(results, 1):
-        pil_img = Image.open(item["output"])
-        w, h = pil_img.size
+        w, h = images.size(item["output"])
         aspect = w / h
 
         # Convert from pixels to cm using ~37.8 px/cm (96 DPI ≈ 37.8 px/cm)
@@ -189,7 +241,7 @@ def generate_pdf_report(results, pdf_path="logo_report.pdf"):
             display_h = min(MAX_HEIGHT, h / 37.8 * cm)
             display_w = display_h * aspect
 
-        img = RLImage(item["output"], width=display_w, height=display_h)
+        img = images.flowable(item["output"], display_w, display_h)
         row.append(img)
 
         if len(row) == 2:  # two images per row
@@ -207,25 +259,36 @@ def generate_pdf_report(results, pdf_path="logo_report.pdf"):
     ]))
     story.append(cap_table)
 
-    doc.build(story)
+    if not isinstance(summary, str):
+        try:
+            summary = summary.result(SUMMARY_WAIT)
+        except TimeoutError:
+            print("⚠️ AI summary not ready; using the plain summary.")
+            summary = _summary_fallback(results)
+    story[summary_index] = Paragraph(summary.replace("\n", "<br/>"), normal)
+
+    with without_a85():
+        doc.build(story)
     print(f"📄 PDF report saved as {pdf_path}")
 
 # --- Main flow ---
 def main():
+    prefetch_prompts()
+    summary = SummaryPrefetcher()
     results = []
     while True:
-        logo_path = input(ai_ask("🖼️ Please enter the path to your logo image: ")).strip()
+        logo_path = input(ai_ask(PROMPTS["logo"])).strip()
         if not os.path.exists(logo_path):
             print("⚠️ Logo not found.")
             continue
 
-        cap_path = input(ai_ask("🧢 Enter path to the cap/base image: ")).strip()
+        cap_path = input(ai_ask(PROMPTS["cap"])).strip()
         if not os.path.exists(cap_path):
             print("⚠️ Cap not found.")
             continue
 
         try:
-            size_in = input(ai_ask("👉 Enter logo width and height (cm, separated by space): "))
+            size_in = input(ai_ask(PROMPTS["size"]))
             w_cm, h_cm = map(float, size_in.split())
             w, h = int(w_cm * 37.8), int(h_cm * 37.8)
         except Exception:
@@ -233,7 +296,7 @@ def main():
             w_cm, h_cm = 3, 3
             w, h = int(3*37.8), int(3*37.8)
 
-        placement = input(ai_ask("📍 Where should I place the logo? (front, side, back, etc.): ")).strip()
+        placement = input(ai_ask(PROMPTS["placement"])).strip()
 
         out_dir = "output1"
         os.makedirs(out_dir, exist_ok=True)
@@ -241,7 +304,8 @@ def main():
 
         applied = apply_logo(cap_path, logo_path, w, h, out_path)
         if applied:
-            ai_desc = ai_generate_description(placement, (w_cm, h_cm), os.path.basename(cap_path))
+            # Generated concurrently while the next logo is entered
+            ai_desc = submit_description(placement, (w_cm, h_cm), os.path.basename(cap_path))
             results.append({
                 "image": cap_path,
                 "logo": logo_path,
@@ -250,13 +314,16 @@ def main():
                 "description": ai_desc,
                 "output": out_path,
             })
+            summary.update(results)  # re-drafted in the background while the next logo is entered
 
-        cont = input(ai_ask("➕ Do you want to add another logo? (yes/no): ")).strip().lower()
+        cont = input(ai_ask(PROMPTS["another"])).strip().lower()
         if cont != "yes":
             break
 
     if results:
-        generate_pdf_report(results)
+        for item in results:
+            item["description"] = item["description"].result()
+        generate_pdf_report(results, summary=summary.update(results))
     else:
         print("⚠️ No logos applied.")
 
@@ -0,0 +1,202 @@
+"""
+Concurrent, cached chat-completion service for the AI text in tech packs.
+
+Requests run on a background asyncio loop with bounded concurrency, so
+callers get a Future back immediately. Identical in-flight requests share
+one call, and finished responses are stored in an on-disk SQLite cache
+keyed by (backend, base URL, model, messages, temperature), so the same
+prompt never hits the API twice. The stub backend's replies are not
+persisted. The backend is pluggable:
+
+    TECHPACK_AI_BACKEND=openai   OpenAI API (default when OPENAI_API_KEY is set;
+                                 honours OPENAI_BASE_URL, e.g. ai_stub_server.py)
+    TECHPACK_AI_BACKEND=stub     deterministic in-process responses, no network
+    TECHPACK_AI_BACKEND=none     always use the caller's fallback text
+"""
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from image_io import content_hash
+from tracing import span
+
+MODEL = "gpt-4o-mini"
+CACHE_PATH = os.path.join(os.getenv("TECHPACK_CACHE_DIR", ".cache"), "ai_responses.sqlite")
+MAX_CONCURRENCY = int(os.getenv("TECHPACK_AI_CONCURRENCY", 8))
+
+_service = None
+_service_lock = threading.Lock()
+
+
+# ----------------- BACKENDS -----------------
+def stub_reply(messages, max_tokens=80):
+    """Deterministic reply derived from the last user message (shared with ai_stub_server)."""
+    prompt = messages[-1]["content"]
+    lines = [line.strip() for line in prompt.splitlines() if line.strip()]
+    details = "; ".join(lines[1:]) if len(lines) > 1 else lines[0] if lines else ""
+    words = f"Production note: {details}".split()
+    return " ".join(words[: max(max_tokens // 2, 8)])
+
+
+class StubBackend:
+    name = "stub"
+    base_url = None
+
+    async def complete(self, model, messages, temperature, max_tokens):
+        return stub_reply(messages, max_tokens)
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, api_key=None, base_url=None):
+        from openai import AsyncOpenAI
+
+        self._client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+        )
+        self.base_url = str(self._client.base_url)
+
+    async def complete(self, model, messages, temperature, max_tokens):
+        resp = await self._client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        return resp.choices[0].message.content.strip()
+
+
+def backend_from_env():
+    """Backend selected by TECHPACK_AI_BACKEND, or None when AI text is unavailable."""
+    choice = os.getenv("TECHPACK_AI_BACKEND", "").lower()
+    if choice == "stub":
+        return StubBackend()
+    if choice == "none":
+        return None
+    if choice == "openai" or os.getenv("OPENAI_API_KEY"):
+        try:
+            return OpenAIBackend()
+        except Exception as e:
+            print(f"⚠️ OpenAI backend unavailable: {e}")
+    return None
+
+
+# ----------------- CACHE -----------------
+class ResponseCache:
+    """SQLite key/value store; one short-lived connection per call keeps it thread-safe."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, model, response):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, model, response))
+
+
+# ----------------- SERVICE -----------------
+class AIService:
+    def __init__(self, backend, cache=None, max_concurrency=MAX_CONCURRENCY):
+        self.backend = backend
+        self.cache = cache
+        self._max_concurrency = max_concurrency
+        self._inflight = {}  # cache key -> Future
+        self._lock = threading.Lock()
+        self._loop = None
+        self._semaphore = None
+
+    def _ensure_loop(self):
+        if self._loop is None:
+            import asyncio  # deferred: only needed once a request actually goes out
+
+            self._loop = asyncio.new_event_loop()
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            threading.Thread(target=self._loop.run_forever, name="ai-service", daemon=True).start()
+        return self._loop
+
+    def cache_key(self, model, messages, temperature):
+        # A reply is only reusable from the endpoint that produced it (e.g. not a local stub server's)
+        backend = [self.backend.name, getattr(self.backend, "base_url", None)]
+        return content_hash(json.dumps([backend, model, messages, temperature], sort_keys=True).encode("utf-8"))
+
+    async def _run(self, key, model, messages, temperature, max_tokens, fallback):
+        async with self._semaphore:
+            try:
+                with span("ai.request", backend=self.backend.name, model=model):
+                    text = await self.backend.complete(model, messages, temperature, max_tokens)
+            except Exception as e:
+                print(f"⚠️ AI request failed: {e}")
+                return fallback
+        if self.cache is not None:
+            await self._loop.run_in_executor(None, self.cache.put, key, model, text)
+        return text
+
+    def submit(self, messages, model=MODEL, temperature=0.4, max_tokens=80, fallback=""):
+        """Returns a Future with the completion text (fallback if the backend is off or fails)."""
+        done = Future()
+        if self.backend is None:
+            done.set_result(fallback)
+            return done
+
+        key = self.cache_key(model, messages, temperature)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                done.set_result(cached)
+                return done
+
+        import asyncio
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            loop = self._ensure_loop()
+            future = asyncio.run_coroutine_threadsafe(
+                self._run(key, model, messages, temperature, max_tokens, fallback), loop
+            )
+            self._inflight[key] = future
+        # Outside the lock: on a request that already finished the callback runs right here
+        future.add_done_callback(lambda _f, k=key: self._forget(k))
+        return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def complete(self, messages, **kwargs):
+        """Blocking single completion."""
+        return self.submit(messages, **kwargs).result()
+
+    def complete_many(self, requests):
+        """
+        Runs a batch of requests concurrently and returns their texts in order.
+        Each request is a dict of submit() keyword arguments including "messages".
+        """
+        futures = [self.submit(**request) for request in requests]
+        return [f.result() for f in futures]
+
+
+def get_service():
+    """Process-wide service configured from the environment."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            backend = backend_from_env()
+            persist = backend is not None and not isinstance(backend, StubBackend)
+            _service = AIService(backend, ResponseCache() if persist else None)
+        return _service
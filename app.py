@@ -1,33 +1,86 @@
 import os
-import pandas as pd
+import uuid
+
 import streamlit as st
-from PIL import Image
-from reportlab.platypus import Table, TableStyle
-from ai_part import ai_generate_description, generate_pdf_report
-from opencv_logic import apply_logo_realistic
-from reportlab.lib import colors
-from reportlab.lib.units import cm
+from ai_part import submit_description
+from asset_store import default_store
+from image_cache import get_cache as get_image_cache
+from render_cache import cached_composite, get_cache as get_render_cache
+from render_service import colorway_job, get_service as get_render_service, render_job, report_job
 from streamlit_drawable_canvas import st_canvas
+import tracing
+from tracing import span
+
+# OpenCV, pandas and ReportLab are imported in the steps that need them, so
+# the first widgets draw without paying for them. Full-resolution renders and
+# PDF builds run in the shared render service's worker processes.
 
 # ----------------- CONFIG -----------------
-UPLOAD_DIR = "uploads"
-OUTPUT_DIR = "outputs"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+REPORT_FIELDS = ("image", "logo", "size_cm", "placement", "description", "output")
 
 # ----------------- HELPERS -----------------
-@st.cache_data(show_spinner=False)
-def load_image(path):
-    return Image.open(path).convert("RGBA")
-
-
-def save_uploaded_file(uploaded_file, folder=UPLOAD_DIR):
-    """Save Streamlit uploaded file to disk and return path."""
-    os.makedirs(folder, exist_ok=True)
-    file_path = os.path.join(folder, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    return file_path
+def resolve_descriptions(results, wait=False):
+    """Fill in AI descriptions whose background requests have finished (or wait for all)."""
+    for result in results:
+        future = result.get("description_future")
+        if future is not None and (wait or future.done()):
+            result["description"] = future.result()
+            del result["description_future"]
+
+
+def finished_results(results):
+    """Wait for background renders and descriptions, and return the results that are ready."""
+    resolve_descriptions(results, wait=True)
+    ready = []
+    for result in results:
+        render = result.get("render")
+        if render is not None:
+            if render.status == "cancelled":
+                continue
+            try:
+                render.result()
+            except Exception as e:
+                st.error(f"⚠️ Skipping {result['placement']}: render failed ({e})")
+                continue
+        # Only plain values go to the worker process
+        ready.append({key: result[key] for key in REPORT_FIELDS})
+    return ready
+
+
+def save_uploaded_file(uploaded_file):
+    """Save Streamlit uploaded file to the content-addressed upload store and return path."""
+    return default_store().put(uploaded_file.getbuffer(), uploaded_file.name)
+
+
+def persist_placements(placements):
+    """Store each placement's in-memory logo once and swap the bytes for its path."""
+    store = default_store()
+    return [
+        {**p, "logo": store.put(p["logo"], p["logo_name"])} if isinstance(p["logo"], bytes) else p
+        for p in placements
+    ]
+
+
+def template_drawing(quad, scale):
+    """Canvas initial drawing with a template's quad as a closed polygon, in display pixels."""
+    points = [(x * scale, y * scale) for x, y in quad]
+    xs, ys = zip(*points)
+    return {
+        "version": "4.4.0",
+        "objects": [
+            {
+                "type": "path",
+                "left": min(xs),
+                "top": min(ys),
+                "width": max(xs) - min(xs),
+                "height": max(ys) - min(ys),
+                "fill": "rgba(255, 165, 0, 0.3)",
+                "stroke": "red",
+                "strokeWidth": 2,
+                "path": [["M", *points[0]], ["L", *points[1]], ["L", *points[2]], ["L", *points[3]], ["z"]],
+            }
+        ],
+    }
 
 
 # ----------------- STREAMLIT APP -----------------
@@ -37,12 +90,28 @@ st.title("🧢 Tech Pack Logo Placement Tool")
 # Initialize session state
 if "results" not in st.session_state:
     st.session_state.results = []
-if "logo_path" not in st.session_state:
-    st.session_state.logo_path = None
+if "logo" not in st.session_state:
+    st.session_state.logo = None
 if "w_cm" not in st.session_state:
     st.session_state.w_cm = 5.0
 if "h_cm" not in st.session_state:
     st.session_state.h_cm = 5.0
+if "view_placements" not in st.session_state:
+    st.session_state.view_placements = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "report_build" not in st.session_state:
+    st.session_state.report_build = None
+if "open_view" not in st.session_state:
+    st.session_state.open_view = None  # gallery index shown at full resolution
+if "template_quads" not in st.session_state:
+    st.session_state.template_quads = {}  # cap content hash -> (template name, quad)
+
+render_service = get_render_service()
+session_id = st.session_state.session_id
+render_service.touch(session_id)  # every rerun reads the workspace, so it counts as use
+if tracing.METRICS_PORT:
+    tracing.start_metrics_server()  # once per process; later reruns are no-ops
 
 # --- Step 0: Upload Excel ---
 st.subheader("Step 0: Upload Excel & Select Data Range")
@@ -56,9 +125,11 @@ start_row = 0
 end_row = None
 
 if excel_file:
-    excel_path = save_uploaded_file(excel_file)
-    df = pd.read_excel(excel_file, header=None)
-    total_rows = len(df)
+    from excel_cache import read_range, row_count
+
+    # Parsed once per workbook content; reruns read the cached columnar table
+    with span("app.excel_load"):
+        total_rows = row_count(excel_file)
     st.write(f"📊 Total rows detected: {total_rows}")
 
     key_col_input = st.text_input("Enter column name for Keys (renamed)").strip()
@@ -67,8 +138,10 @@ if excel_file:
     end_row = st.number_input("End Row (1-indexed)", min_value=1, value=total_rows, step=1)
 
     if st.button("📥 Fetch Data from Excel"):
-        subset = df.iloc[start_row - 1 : end_row, [1, 2]].dropna()
-        subset.columns = [key_col_input or "Key", value_col_input or "Value"]
+        with span("app.excel_fetch"):
+            subset = read_range(
+                excel_file, start_row - 1, end_row, columns=[1, 2], names=[key_col_input or "Key", value_col_input or "Value"]
+            ).dropna()
         design_data = subset.values.tolist()
         st.success(f"✅ Fetched {len(subset)} rows.")
         st.dataframe(subset)
@@ -79,8 +152,8 @@ st.subheader("Step 1: Upload Logo Image")
 logo_file = st.file_uploader("Upload Logo Image", type=["png", "jpg", "jpeg"], key="logo_upload")
 
 if logo_file:
-    logo_path = save_uploaded_file(logo_file)
-    st.session_state.logo_path = logo_path
+    # Kept in memory; written to disk only when a cap using it is saved
+    st.session_state.logo = {"name": logo_file.name, "data": bytes(logo_file.getbuffer())}
     st.success("✅ Logo uploaded.")
 
 
@@ -98,21 +171,46 @@ with col_h:
 st.subheader("Step 3: Upload and Place Logo on Cap")
 st.info(
     "**HOW TO USE:** 1. Click 4 corners in clockwise order (Top-Left → Top-Right → Bottom-Right → Bottom-Left). "
-    "**2. Double-click the 4th point to finalize the shape.** A preview will then appear."
+    "**2. Double-click the 4th point to finalize the shape.** A preview will then appear. "
+    "**3. Use \"Add Another Logo\" to place more logos on the same view before saving.**"
 )
 
 cap_file = st.file_uploader(
     "Upload Cap/Base Image", type=["png", "jpg", "jpeg"], key=f"cap_{len(st.session_state.results)}"
 )
 
-if cap_file:
-    cap_path = save_uploaded_file(cap_file)
-    cap_image = load_image(cap_path)
+# Decoded straight from the upload buffer once per content hash; the display-size
+# views are cached with it, so reruns neither decode nor resize again
+with span("app.cap_load"):
+    cap_image = get_image_cache().get(cap_file) if cap_file else None
+if cap_file and cap_image is None:
+    st.error("Error: Could not read the cap image.")
+
+if cap_image is not None:
+    from PIL import Image
+    from compositing import scale_placements
 
     max_width = 600
     scale = max_width / cap_image.width
-    display_size = (max_width, int(cap_image.height * scale))
-    cap_resized = cap_image.resize(display_size)
+    display_bgr = cap_image.display(max_width)
+    display_size = (display_bgr.shape[1], display_bgr.shape[0])
+    cap_resized = Image.fromarray(cap_image.display(max_width, rgb=True))
+
+    # Photos shot from a template's studio angle get its quad pre-drawn; draw a new polygon to override it
+    template_quad = st.session_state.template_quads.get(cap_image.key)
+    with st.expander("📐 Placement templates"):
+        if st.button("📐 Place from Template", key=f"template_match_{len(st.session_state.results)}"):
+            from placement_templates import get_store as get_template_store
+
+            with span("app.template_match"):
+                match = get_template_store().match(cap_image.bgr)
+            if match is None:
+                st.warning("No placement template matched this photo; click the corners instead.")
+            else:
+                st.session_state.template_quads[cap_image.key] = (match.template.name, match.quad)
+                st.experimental_rerun()
+        if template_quad:
+            st.caption(f"Quad placed from template **{template_quad[0]}**.")
 
     canvas_result = st_canvas(
         fill_color="rgba(255, 165, 0, 0.3)",
@@ -123,21 +221,70 @@ if cap_file:
         height=display_size[1],
         width=display_size[0],
         drawing_mode="polygon",
-        key=f"canvas_{len(st.session_state.results)}",
+        initial_drawing=template_drawing(template_quad[1], scale) if template_quad else None,
+        key=f"canvas_{len(st.session_state.results)}_{len(st.session_state.view_placements)}"
+        + (f"_{template_quad[0]}" if template_quad else ""),
     )
 
+    if st.session_state.view_placements:
+        st.write(f"🧩 {len(st.session_state.view_placements)} logo(s) already placed on this view.")
+
     if canvas_result.json_data and canvas_result.json_data["objects"]:
         last_object = canvas_result.json_data["objects"][-1]
         if last_object["type"] == "path" and len(last_object["path"]) == 5:
             points = last_object["path"]
             dest_points = [(p[1] / scale, p[2] / scale) for p in points[:4]]
 
-            if st.session_state.logo_path:
-                os.makedirs(OUTPUT_DIR, exist_ok=True)
-                out_path = os.path.join(OUTPUT_DIR, os.path.splitext(cap_file.name)[0] + "_with_logo.png")
-                applied = apply_logo_realistic(cap_path, st.session_state.logo_path, dest_points, out_path)
-                if applied:
-                    st.image(applied, caption="Preview", width=400)
+            with st.expander("💾 Save This Quad as a Placement Template"):
+                template_style = st.text_input("Cap style", key=f"template_style_{len(st.session_state.results)}")
+                template_view = st.text_input(
+                    "View", os.path.splitext(cap_file.name)[0], key=f"template_view_{len(st.session_state.results)}"
+                )
+                if st.button("💾 Save Template", key=f"template_save_{len(st.session_state.results)}"):
+                    from placement_templates import get_store as get_template_store
+
+                    try:
+                        template = get_template_store().save(template_style, template_view, cap_file, dest_points)
+                    except ValueError as e:
+                        st.error(f"Could not save the template: {e}")
+                    else:
+                        st.success(f"✅ Saved template {template.name}; matching photos can now be placed from it.")
+
+            if st.session_state.logo:
+                opacity = st.slider(
+                    "Logo opacity", min_value=0.1, max_value=1.0, value=1.0, step=0.05,
+                    key=f"opacity_{len(st.session_state.results)}_{len(st.session_state.view_placements)}",
+                )
+                bend = st.slider(
+                    "Crown bend (negative arches up, positive sags down)",
+                    min_value=-1.0, max_value=1.0, value=0.0, step=0.05,
+                    key=f"bend_{len(st.session_state.results)}_{len(st.session_state.view_placements)}",
+                )
+                current = {
+                    "logo": st.session_state.logo["data"],
+                    "logo_name": st.session_state.logo["name"],
+                    "quad": dest_points,
+                    "z": len(st.session_state.view_placements),
+                    "opacity": opacity,
+                    "bend": bend,
+                }
+                placements = st.session_state.view_placements + [current]
+
+                # Preview at display scale, memoized across reruns; the full-resolution render only runs on save
+                try:
+                    with span("app.preview", placements=len(placements)):
+                        preview = cached_composite(
+                            display_bgr, cap_image.key, scale_placements(placements, scale), mode=f"preview:{display_size}"
+                        )
+                except Exception as e:
+                    st.error(f"An error occurred during image processing: {e}")
+                    preview = None
+                if preview is not None:
+                    st.image(preview, caption="Preview", width=400, channels="BGR")
+
+                    if st.button("➕ Add Another Logo to This View", key=f"add_{len(st.session_state.results)}"):
+                        st.session_state.view_placements.append(current)
+                        st.experimental_rerun()
 
                     placement = st.text_input(
                         "Placement description (e.g., Front Panel)",
@@ -146,43 +293,234 @@ if cap_file:
                     )
 
                     if st.button("✅ Save This Cap", key=f"save_{len(st.session_state.results)}"):
-                        ai_desc = ai_generate_description(
+                        # Each session renders into its own workspace, so users never overwrite each other
+                        view_name = f"{len(st.session_state.results) + 1:02d}_{os.path.splitext(cap_file.name)[0]}"
+                        out_path = os.path.join(render_service.workspace(session_id), view_name + "_with_logo.png")
+                        # Persist inputs once, on save; the worker process renders from the stored files
+                        cap_path = save_uploaded_file(cap_file)
+                        placements = persist_placements(placements)
+                        # Pins the stored inputs while this session can still render or report them
+                        assets = default_store().hold([cap_path, *(p["logo"] for p in placements)])
+                        render = render_service.submit(
+                            session_id, render_job, cap_path, placements, out_path, thumbnails=True, label=placement
+                        )
+                        # Returns at once; the description fills in when the request finishes
+                        ai_desc = submit_description(
                             placement, (st.session_state.w_cm, st.session_state.h_cm), cap_file.name
                         )
                         st.session_state.results.append(
                             {
                                 "image": cap_path,
-                                "logo": st.session_state.logo_path,
+                                "logo": placements[0]["logo"],
                                 "size_cm": (st.session_state.w_cm, st.session_state.h_cm),
                                 "placement": placement,
-                                "description": ai_desc,
+                                "description": None,
+                                "description_future": ai_desc,
                                 "output": out_path,
+                                "placements": placements,
+                                "render": render,
+                                "assets": assets,
                             }
                         )
-                        st.success("Cap saved! Upload another image or generate the report below.")
+                        st.session_state.view_placements = []
+                        st.success("Cap saved! The full-resolution render continues in the background.")
                         st.experimental_rerun()
 
+                    # One master photo, many fabric colours: every variant renders in one background job
+                    with st.expander("🎨 Save as Colorways"):
+                        mask_file = st.file_uploader(
+                            "Fabric mask (white = fabric to recolour, same framing as the cap photo)",
+                            type=["png", "jpg", "jpeg"],
+                            key=f"mask_{len(st.session_state.results)}",
+                        )
+                        colorway_text = st.text_area(
+                            "Colours, one per line (name=#rrggbb)",
+                            "navy=#1f2a44\nred=#b22222\nblack=#111111",
+                            key=f"colors_{len(st.session_state.results)}",
+                        )
+                        if st.button("🎨 Save Colorways", key=f"save_colorways_{len(st.session_state.results)}"):
+                            from colorways import colorway_paths, parse_colors
+
+                            try:
+                                colors = parse_colors(colorway_text)
+                            except ValueError as e:
+                                st.error(f"Invalid colours: {e}")
+                                colors = None
+                            if mask_file is None:
+                                st.error("Upload a fabric mask first.")
+                            elif colors:
+                                view_name = f"{len(st.session_state.results) + 1:02d}_{os.path.splitext(cap_file.name)[0]}"
+                                out_paths = colorway_paths(
+                                    os.path.join(render_service.workspace(session_id), view_name + "_with_logo.png"),
+                                    [name for name, _ in colors],
+                                )
+                                cap_path = save_uploaded_file(cap_file)
+                                mask_path = save_uploaded_file(mask_file)
+                                placements = persist_placements(placements)
+                                assets = default_store().hold([cap_path, mask_path, *(p["logo"] for p in placements)])
+                                render = render_service.submit(
+                                    session_id, colorway_job, cap_path, mask_path, colors, placements, out_paths,
+                                    thumbnails=True, label=f"{placement} colorways",
+                                )
+                                # Every variant is its own report entry, sharing the one render job
+                                for (name, _), out_path in zip(colors, out_paths):
+                                    label = f"{placement} – {name}"
+                                    st.session_state.results.append(
+                                        {
+                                            "image": cap_path,
+                                            "logo": placements[0]["logo"],
+                                            "size_cm": (st.session_state.w_cm, st.session_state.h_cm),
+                                            "placement": label,
+                                            "description": None,
+                                            "description_future": submit_description(
+                                                label, (st.session_state.w_cm, st.session_state.h_cm), cap_file.name
+                                            ),
+                                            "output": out_path,
+                                            "placements": placements,
+                                            "render": render,
+                                            "assets": assets,
+                                        }
+                                    )
+                                st.session_state.view_placements = []
+                                st.success(f"{len(colors)} colorways saved! They render together in the background.")
+                                st.experimental_rerun()
+
 
 # --- Step 4: Generate PDF ---
 if st.session_state.results:
     st.markdown("---")
     st.header("Final Report")
     st.write(f"📦 You have added **{len(st.session_state.results)}** cap views so far.")
+    resolve_descriptions(st.session_state.results)
+
+    from thumbnails import thumbnail
 
     cols = st.columns(min(len(st.session_state.results), 4))
     for i, result in enumerate(st.session_state.results):
         with cols[i % 4]:
-            st.image(result["output"], caption=result["placement"], use_column_width=200)
+            render = result.get("render")
+            status = render.status if render is not None else "done"
+            if status in ("queued", "running"):
+                st.info(f"⏳ {'Rendering' if status == 'running' else 'Queued'}: {result['placement']}…")
+                if st.button("✖ Cancel", key=f"cancel_render_{i}"):
+                    render.cancel()
+                    st.experimental_rerun()
+            elif status == "cancelled":
+                st.warning(f"✖ Render cancelled: {result['placement']}")
+            elif status == "failed":
+                st.error(f"⚠️ Render failed: {render.exception()}")
+            else:
+                # A few KB per view; the full-resolution render is only sent when the view is opened
+                thumb = thumbnail(result["output"], 1024 // len(cols)) or result["output"]
+                st.image(thumb, caption=result["placement"], use_column_width=200)
+                if st.button("🔍 Open", key=f"open_view_{i}"):
+                    st.session_state.open_view = i
+                    st.experimental_rerun()
+
+    open_view = st.session_state.open_view
+    if open_view is not None and open_view < len(st.session_state.results):
+        result = st.session_state.results[open_view]
+        st.image(result["output"], caption=f"{result['placement']} (full resolution)", use_column_width=True)
+        if st.button("✖ Close", key="close_view"):
+            st.session_state.open_view = None
+            st.experimental_rerun()
+
+    if any(
+        (r.get("render") is not None and r["render"].status in ("queued", "running")) or "description_future" in r
+        for r in st.session_state.results
+    ):
+        st.button("🔄 Refresh")
+
+    compress_photos = st.checkbox("Store cap photos as JPEG (smaller PDF)", value=True)
 
     if st.button("📄 Generate PDF Report"):
-        generate_pdf_report(
-            st.session_state.results,
-            pdf_path=os.path.join(OUTPUT_DIR, "logo_techpack.pdf"),
+        with st.spinner("Waiting for full-resolution renders..."):
+            ready = finished_results(st.session_state.results)
+        if st.session_state.report_build is not None:
+            st.session_state.report_build.cancel()
+
+        # A fresh file per build, so a superseded build still running can't clobber it
+        workspace = render_service.workspace(session_id)
+        pdf_path = os.path.join(workspace, f"logo_techpack_{uuid.uuid4().hex[:8]}.pdf")
+        excel_path = save_uploaded_file(excel_file) if excel_file else None
+        st.session_state.report_build = render_service.submit(
+            session_id,
+            report_job,
+            ready,
+            pdf_path,
+            progress_path=pdf_path + ".progress",
             excel_file=excel_path,
             excel_columns={"indices": [1, 2], "names": [key_col_input or "Key", value_col_input or "Value"]},
             excel_start_row=start_row - 1,
             excel_end_row=end_row,
+            image_format="jpeg" if compress_photos else "png",
+            label="PDF report",
+            total=len(ready),
         )
 
-        with open(os.path.join(OUTPUT_DIR, "logo_techpack.pdf"), "rb") as f:
-            st.download_button("⬇️ Download Techpack PDF", f, file_name="logo_techpack.pdf")
+    report = st.session_state.report_build
+    if report is not None:
+        status = report.status
+        if status in ("queued", "running"):
+            done = round((report.progress or 0.0) * report.total)
+            text = "Waiting for a worker..." if status == "queued" else f"Laid out {done}/{report.total} views"
+            st.progress(report.progress or 0.0, text=text)
+            col_refresh, col_cancel = st.columns(2)
+            with col_refresh:
+                st.button("🔄 Refresh", key="refresh_report")
+            with col_cancel:
+                if st.button("✖ Cancel PDF", key="cancel_report"):
+                    report.cancel()
+                    st.experimental_rerun()
+        elif status == "failed":
+            st.error(f"⚠️ PDF build failed: {report.exception()}")
+        elif status == "cancelled":
+            st.info("PDF build cancelled.")
+        else:
+            with open(report.result(), "rb") as f:
+                st.download_button("⬇️ Download Techpack PDF", f, file_name="logo_techpack.pdf")
+
+
+# --- Sidebar: how much rerun work the render cache saves ---
+with st.sidebar.expander("Render cache"):
+    cache_stats = get_render_cache().stats()
+    st.write(
+        f"Preview hits: {cache_stats['hits']} · misses: {cache_stats['misses']} "
+        f"({cache_stats['hit_rate']:.0%} served from cache)"
+    )
+    st.write(f"{cache_stats['entries']} composites in memory ({cache_stats['bytes'] / 1e6:.1f} MB)")
+    image_stats = get_image_cache().stats()
+    st.write(
+        f"Decoded images: {image_stats['entries']} ({image_stats['bytes'] / 1e6:.1f} MB), "
+        f"{image_stats['hits']} hits · {image_stats['misses']} misses"
+    )
+
+# --- Sidebar: where the time goes, per pipeline stage ---
+with st.sidebar.expander("Performance trace"):
+    if not tracing.ENABLED:
+        st.caption("Tracing is off. Set TECHPACK_TRACE=1 or enable it for this server process.")
+        if st.button("Enable tracing"):
+            tracing.enable()
+            st.experimental_rerun()
+    else:
+        rows = tracing.get_recorder().summary()
+        if rows:
+            st.table([
+                {
+                    "stage": row["stage"],
+                    "count": row["count"],
+                    "p50 ms": f"{row['p50_ms']:.1f}",
+                    "p90 ms": f"{row['p90_ms']:.1f}",
+                    "p99 ms": f"{row['p99_ms']:.1f}",
+                    "mem Δ MB": f"{row['mean_rss_delta_mb']:+.1f}",
+                }
+                for row in rows
+            ])
+        else:
+            st.caption("No spans recorded yet.")
+        st.caption("Renders and PDF builds run in worker processes; their spans go to the JSON log only.")
+        if tracing.METRICS_PORT:
+            st.caption(f"Metrics: http://127.0.0.1:{tracing.METRICS_PORT}/metrics")
+        if st.button("Reset trace"):
+            tracing.get_recorder().reset()
+            st.experimental_rerun()
@@ -0,0 +1,258 @@
+"""
+Content-addressed store for uploaded files.
+
+Files are stored once per content hash under sharded directories
+(uploads/ab/cd/<hash>.<ext>), with an SQLite index recording each file's
+original names, size, image dimensions and last use, plus pin leases.
+Every process serving the app shares the one index. When the store grows
+past its byte budget the least recently used unpinned files are evicted.
+
+A pin is a lease owned by one process. Leases of processes that died
+without releasing them, and leases not renewed for LEASE_SECONDS, expire
+when a store opens and before each eviction.
+"""
+import io
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+
+from image_io import content_hash, read_bytes
+
+UPLOAD_DIR = "uploads"
+DEFAULT_MAX_BYTES = int(os.getenv("TECHPACK_UPLOAD_MAX_BYTES", 2 * 1024**3))
+INDEX_NAME = "index.sqlite"
+TOUCH_INTERVAL = 60  # seconds; a repeated upload refreshes last_used at most this often
+LEASE_SECONDS = int(os.getenv("TECHPACK_UPLOAD_LEASE_SECONDS", 7 * 24 * 3600))
+
+_COLUMNS = ("path", "size", "names", "width", "height", "last_used", "pins")
+_PINS = "(SELECT COUNT(*) FROM pins WHERE pins.key = assets.key)"
+# This process's leases; a new process reusing a dead one's pid gets a new owner id
+_HOST = socket.gethostname()
+_OWNER = uuid.uuid4().hex
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def _image_size(data):
+    """(width, height) read from the image header only, or None for non-images."""
+    try:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        import psutil
+    except ImportError:
+        if os.name == "nt":
+            return True  # os.kill(pid, 0) would send Ctrl+C here; the lease age expires it instead
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    return psutil.pid_exists(pid)
+
+
+def _atomic_write(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class AssetHold:
+    """Pins stored files against eviction until it is garbage collected."""
+
+    __slots__ = ("keys", "__weakref__")
+
+    def __init__(self, keys):
+        self.keys = keys
+
+
+class AssetStore:
+    def __init__(self, root=UPLOAD_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(root, INDEX_NAME)
+        os.makedirs(root, exist_ok=True)
+        with self._write() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS assets (key TEXT PRIMARY KEY, path TEXT, size INTEGER, names TEXT, "
+                "width INTEGER, height INTEGER, last_used REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pins (id INTEGER PRIMARY KEY, key TEXT, owner TEXT, host TEXT, "
+                "pid INTEGER, renewed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pins_key ON pins (key)")
+            self._expire_leases(conn)
+
+    def _connect(self):
+        return sqlite3.connect(self._index_path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _write(self):
+        """Connection inside a write transaction; writers in every process take turns."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def total_bytes(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+        finally:
+            conn.close()
+
+    def path_for(self, key):
+        """Absolute-or-relative path of a stored hash, or None if it is not in the store."""
+        entry = self.info(key)
+        return os.path.join(self.root, entry["path"]) if entry else None
+
+    def info(self, key):
+        conn = self._connect()
+        try:
+            columns = ", ".join(_COLUMNS[:-1] + (_PINS,))
+            row = conn.execute(f"SELECT {columns} FROM assets WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        entry = dict(zip(_COLUMNS, row))
+        entry["names"] = json.loads(entry["names"])
+        return entry
+
+    def put(self, data, name):
+        """
+        Stores data (bytes or memoryview) under its content hash and returns the
+        file path. Identical bytes are written only once; name is recorded as
+        one of the file's original names.
+        """
+        key = content_hash(data)
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute("SELECT path, names, last_used FROM assets WHERE key = ?", (key,)).fetchone()
+            names = json.loads(row[1]) if row else []
+            if row and os.path.exists(os.path.join(self.root, row[0])):
+                # The index is only written when the entry actually changes
+                if name not in names:
+                    names.append(name)
+                    conn.execute(
+                        "UPDATE assets SET names = ?, last_used = ? WHERE key = ?", (json.dumps(names), now, key)
+                    )
+                elif now - row[2] > TOUCH_INTERVAL:
+                    conn.execute("UPDATE assets SET last_used = ? WHERE key = ?", (now, key))
+                return os.path.join(self.root, row[0])
+
+            ext = os.path.splitext(name)[1].lower()
+            rel_path = os.path.join(key[:2], key[2:4], key + ext)
+            abs_path = os.path.join(self.root, rel_path)
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+            _atomic_write(abs_path, data)
+
+            if name not in names:
+                names.append(name)
+            size = _image_size(data) or (None, None)
+            conn.execute(
+                "INSERT INTO assets (key, path, size, names, width, height, last_used) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET path = excluded.path, size = excluded.size, names = excluded.names, "
+                "width = excluded.width, height = excluded.height, last_used = excluded.last_used",
+                (key, rel_path, len(data), json.dumps(names), size[0], size[1], now),
+            )
+            self._evict(conn, keep=key)
+            return abs_path
+
+    def put_file(self, file_path):
+        """Stores a copy of an existing file and returns its path in the store."""
+        return self.put(read_bytes(file_path), os.path.basename(file_path))
+
+    def hold(self, paths):
+        """
+        Pins the stored files among paths against eviction for as long as the
+        returned AssetHold is alive; keep it next to whatever references them
+        (a session's results, which outlive their render jobs). Paths outside
+        the store are ignored.
+        """
+        keys, leases = [], []
+        now = time.time()
+        with self._write() as conn:
+            for key in {os.path.splitext(os.path.basename(path))[0] for path in paths if path}:
+                if conn.execute("SELECT 1 FROM assets WHERE key = ?", (key,)).fetchone():
+                    cursor = conn.execute(
+                        "INSERT INTO pins (key, owner, host, pid, renewed) VALUES (?, ?, ?, ?, ?)",
+                        (key, _OWNER, _HOST, os.getpid(), now),
+                    )
+                    keys.append(key)
+                    leases.append(cursor.lastrowid)
+            conn.execute("UPDATE pins SET renewed = ? WHERE owner = ?", (now, _OWNER))
+        hold = AssetHold(keys)
+        weakref.finalize(hold, self._unpin, leases)
+        return hold
+
+    def _unpin(self, leases):
+        # Runs from the garbage collector or at exit, so it must not raise
+        try:
+            with self._write() as conn:
+                conn.executemany("DELETE FROM pins WHERE id = ?", [(lease,) for lease in leases])
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ Could not unpin {len(leases)} uploads: {e}")
+
+    def _expire_leases(self, conn):
+        """Drops leases of dead processes on this host and leases not renewed for LEASE_SECONDS."""
+        now = time.time()
+        conn.execute("UPDATE pins SET renewed = ? WHERE owner = ?", (now, _OWNER))
+        conn.execute("DELETE FROM pins WHERE renewed < ?", (now - LEASE_SECONDS,))
+        owners = conn.execute("SELECT DISTINCT owner, pid FROM pins WHERE host = ? AND owner != ?", (_HOST, _OWNER))
+        for owner, pid in owners.fetchall():
+            if pid == os.getpid() or not _pid_alive(pid):
+                conn.execute("DELETE FROM pins WHERE owner = ?", (owner,))
+
+    def _evict(self, conn, keep=None):
+        """Drops least recently used unpinned files until the store fits its byte budget."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._expire_leases(conn)
+        candidates = conn.execute(
+            f"SELECT key, path, size FROM assets WHERE {_PINS} = 0 AND key != ? ORDER BY last_used", (keep,)
+        ).fetchall()
+        for key, path, size in candidates:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM assets WHERE key = ?", (key,))
+            try:
+                os.remove(os.path.join(self.root, path))
+            except OSError:
+                pass
+            total -= size
+
+
+def default_store():
+    """Process-wide store rooted at uploads/."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = AssetStore()
+        return _default_store
@@ -0,0 +1,320 @@
+"""
+Headless batch rendering of tech packs from a job manifest.
+
+A manifest (JSON, or YAML with PyYAML installed) lists styles; each style
+has cap views with one or more logo placements and an optional Excel range,
+and produces one PDF:
+
+    {
+      "output_dir": "outputs/batch",
+      "styles": [
+        {
+          "name": "trucker-navy",
+          "excel": {"path": "bom.xlsx", "start_row": 0, "end_row": 40,
+                    "columns": [1, 2], "names": ["Detail", "Value"]},
+          "views": [
+            {"cap": "input/caps/front.jpg", "placement": "Front", "size_cm": [6, 4],
+             "logos": [{"logo": "input/logos/bird.png",
+                        "quad": [[420, 300], [780, 310], [770, 560], [430, 550]],
+                        "z": 0, "opacity": 1.0, "bend": 0.2}]}
+          ]
+        }
+      ]
+    }
+
+A logo may be placed with "rect": [x, y, w, h], "center" + "size" or an
+explicit bend "grid" (+ "grid_size") instead of a "quad" (see compositing), or with "template": "style/view" (or "style",
+or "auto" for any style) to take the quad from the best matching placement
+template (see placement_templates); the match runs in the render worker. A view may use "logo" + a geometry instead of
+"logos" for a single placement, and may give a fixed "description" instead
+of the AI-generated one. Relative paths are resolved against the manifest's
+directory.
+
+Composites are fanned out over a process pool (one single-threaded OpenCV
+worker per core) and each style's PDF is built in the pool as soon as its
+views are done. A state file in the output directory records a fingerprint
+of every output's inputs, so re-running skips renders and PDFs whose inputs
+have not changed.
+"""
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from image_io import content_hash, read_bytes
+from render_cache import RENDER_VERSION
+from render_service import init_worker, render_job, report_job
+
+STATE_NAME = ".techpack-state.json"
+
+
+# ----------------- MANIFEST -----------------
+def load_manifest(path):
+    """Reads and validates a manifest; returns it with absolute paths."""
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            import yaml
+
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    return normalize_manifest(data, os.path.dirname(os.path.abspath(path)))
+
+
+def _slug(name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", str(name)).strip("_") or "style"
+
+
+def normalize_manifest(data, base_dir="."):
+    def resolve(path):
+        return os.path.normpath(os.path.join(base_dir, os.path.expanduser(path)))
+
+    from compositing import normalize_placement
+
+    def placement(spec, where):
+        if "logo" not in spec:
+            raise ValueError(f"{where}: each logo needs 'logo'")
+        if "template" in spec and not any(key in spec for key in ("quad", "rect", "center", "grid")):
+            geometry = {"template": str(spec["template"])}
+        else:
+            try:
+                normalized = normalize_placement(spec)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{where}: {e}") from None
+            geometry = {"quad": [list(corner) for corner in normalized["quad"]]}
+            if "grid" in normalized:
+                # A bent grid renders (and fingerprints) as itself, not as its corner quad
+                geometry["grid"] = [list(point) for point in normalized["grid"]]
+                geometry["grid_size"] = list(normalized["grid_size"])
+        return {
+            "logo": resolve(spec["logo"]),
+            **geometry,
+            "z": int(spec.get("z", 0)),
+            "opacity": float(spec.get("opacity", 1.0)),
+            "bend": float(spec.get("bend", 0.0)),
+        }
+
+    styles = []
+    for s, style in enumerate(data.get("styles") or []):
+        name = _slug(style.get("name", f"style_{s + 1}"))
+        views = []
+        for v, view in enumerate(style.get("views") or []):
+            where = f"style {name!r}, view {v + 1}"
+            if "cap" not in view:
+                raise ValueError(f"{where}: missing 'cap'")
+            specs = view.get("logos") or ([view] if "logo" in view else [])
+            if not specs:
+                raise ValueError(f"{where}: no logos")
+            cap = resolve(view["cap"])
+            views.append({
+                "name": _slug(view.get("name", f"{v + 1:02d}_{os.path.splitext(os.path.basename(cap))[0]}")),
+                "cap": cap,
+                "placements": [placement(p, where) for p in specs],
+                "placement": str(view.get("placement", "Front")),
+                "size_cm": tuple(float(x) for x in view.get("size_cm", (5.0, 5.0))),
+                "description": view.get("description"),
+            })
+        if not views:
+            raise ValueError(f"style {name!r}: no views")
+
+        excel = style.get("excel")
+        if excel:
+            excel = {
+                "path": resolve(excel["path"]),
+                "start_row": int(excel.get("start_row", 0)),
+                "end_row": excel.get("end_row"),
+                "columns": {"indices": list(excel.get("columns", [0, 1])),
+                            "names": list(excel.get("names", ["Detail", "Value"]))},
+            }
+        styles.append({"name": name, "views": views, "excel": excel})
+
+    if not styles:
+        raise ValueError("manifest has no styles")
+    return {"output_dir": resolve(data.get("output_dir", "outputs/batch")), "styles": styles}
+
+
+# ----------------- STATE -----------------
+class RenderState:
+    """Fingerprints of finished outputs, saved after every completed job."""
+
+    def __init__(self, output_dir):
+        self.root = output_dir
+        self.path = os.path.join(output_dir, STATE_NAME)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.outputs = json.load(f)
+        except (OSError, ValueError):
+            self.outputs = {}
+
+    def is_current(self, out_path, fingerprint):
+        # Keyed relative to the output directory, so a moved directory stays resumable
+        key = os.path.relpath(out_path, self.root)
+        return self.outputs.get(key) == fingerprint and os.path.exists(out_path)
+
+    def record(self, out_path, fingerprint):
+        self.outputs[os.path.relpath(out_path, self.root)] = fingerprint
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.outputs, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def _fingerprint(obj):
+    return content_hash(json.dumps(obj, sort_keys=True).encode("utf-8"))
+
+
+class _FileHashes(dict):
+    """Content hash per input path, computed once per run (missing files hash to None)."""
+
+    def __missing__(self, path):
+        try:
+            digest = content_hash(read_bytes(path))
+        except OSError:
+            digest = None
+        self[path] = digest
+        return digest
+
+
+def view_fingerprint(view, hashes):
+    def placement(p):
+        p = {**p, "logo": hashes[p["logo"]]}
+        if "template" in p:
+            # The quad comes from the template files the selector can match
+            from placement_templates import get_store
+
+            p["template"] = [p["template"], get_store().fingerprint(p["template"])]
+        return p
+
+    return _fingerprint({
+        "version": RENDER_VERSION,
+        "cap": hashes[view["cap"]],
+        "placements": [placement(p) for p in view["placements"]],
+    })
+
+
+def report_fingerprint(style, view_fingerprints, hashes):
+    excel = style["excel"]
+    return _fingerprint({
+        "views": [
+            [fp, v["placement"], v["size_cm"], v["description"], [hashes[p["logo"]] for p in v["placements"]]]
+            for v, fp in zip(style["views"], view_fingerprints)
+        ],
+        "excel": excel and {**excel, "path": hashes[excel["path"]]},
+    })
+
+
+# ----------------- RUN -----------------
+def run(manifest, workers=None, force=False):
+    """
+    Renders every out-of-date view and PDF in the manifest.
+    Returns counts: {"rendered", "skipped", "failed", "reports", "reports_skipped"}.
+    """
+    from ai_part import submit_description
+
+    out_dir = manifest["output_dir"]
+    os.makedirs(out_dir, exist_ok=True)
+    state = RenderState(out_dir)
+    hashes = _FileHashes()
+    counts = dict(rendered=0, skipped=0, failed=0, reports=0, reports_skipped=0)
+
+    # Plan: which renders and reports are out of date
+    plan = []
+    for style in manifest["styles"]:
+        style_dir = os.path.join(out_dir, style["name"])
+        outputs = [os.path.join(style_dir, view["name"] + ".png") for view in style["views"]]
+        view_fps = [view_fingerprint(view, hashes) for view in style["views"]]
+        pdf_path = os.path.join(out_dir, style["name"] + ".pdf")
+        pdf_fp = report_fingerprint(style, view_fps, hashes)
+        stale = [i for i, (out, fp) in enumerate(zip(outputs, view_fps)) if force or not state.is_current(out, fp)]
+        counts["skipped"] += len(style["views"]) - len(stale)
+        report_stale = force or bool(stale) or not state.is_current(pdf_path, pdf_fp)
+        if not report_stale:
+            counts["reports_skipped"] += 1
+        elif stale:
+            os.makedirs(style_dir, exist_ok=True)
+        plan.append((style, outputs, view_fps, stale, pdf_path, pdf_fp, report_stale))
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+        pending_views = {}  # style index -> renders still running
+        failed_styles = set()
+        jobs = {}
+        for s, (style, outputs, view_fps, stale, pdf_path, pdf_fp, report_stale) in enumerate(plan):
+            for i in stale:
+                view = style["views"][i]
+                job = pool.submit(render_job, view["cap"], view["placements"], outputs[i])
+                jobs[job] = ("render", s, i)
+            pending_views[s] = len(stale)
+
+        # Descriptions are generated concurrently in this process while the pool renders
+        descriptions = {}
+        for s, (style, _, _, _, _, _, report_stale) in enumerate(plan):
+            if report_stale:
+                for i, view in enumerate(style["views"]):
+                    if view["description"] is None:
+                        descriptions[s, i] = submit_description(
+                            view["placement"], view["size_cm"], os.path.basename(view["cap"])
+                        )
+
+        def submit_report(s):
+            style, outputs, _, _, pdf_path, _, _ = plan[s]
+            results = []
+            for i, view in enumerate(style["views"]):
+                future = descriptions.get((s, i))
+                results.append({
+                    "image": view["cap"],
+                    "logo": view["placements"][0]["logo"],
+                    "size_cm": view["size_cm"],
+                    "placement": view["placement"],
+                    "description": future.result() if future else view["description"],
+                    "output": outputs[i],
+                })
+            excel = style["excel"] or {}
+            job = pool.submit(
+                report_job, results, pdf_path,
+                excel_file=excel.get("path"),
+                excel_columns=excel.get("columns"),
+                excel_start_row=excel.get("start_row", 0),
+                excel_end_row=excel.get("end_row"),
+            )
+            jobs[job] = ("report", s, None)
+
+        for s, (_, _, _, _, _, _, report_stale) in enumerate(plan):
+            if report_stale and pending_views[s] == 0:
+                submit_report(s)
+
+        while jobs:
+            job = next(as_completed(jobs))
+            kind, s, i = jobs.pop(job)
+            style, outputs, view_fps, _, pdf_path, pdf_fp, report_stale = plan[s]
+            try:
+                job.result()
+            except Exception as e:
+                target = outputs[i] if kind == "render" else pdf_path
+                print(f"❌ {style['name']}: failed to build {os.path.basename(target)}: {e}")
+                counts["failed"] += 1
+                if kind == "report":
+                    continue
+                failed_styles.add(s)
+            else:
+                if kind == "report":
+                    state.record(pdf_path, pdf_fp)
+                    counts["reports"] += 1
+                    print(f"📄 {style['name']}: {pdf_path}")
+                    continue
+                state.record(outputs[i], view_fps[i])
+                counts["rendered"] += 1
+
+            pending_views[s] -= 1
+            if pending_views[s] == 0 and report_stale:
+                if s in failed_styles:
+                    print(f"⚠️ {style['name']}: skipping PDF, some views failed to render.")
+                else:
+                    submit_report(s)
+
+    print(
+        f"✅ Rendered {counts['rendered']} views ({counts['skipped']} up to date), "
+        f"built {counts['reports']} PDFs ({counts['reports_skipped']} up to date), {counts['failed']} failed."
+    )
+    return counts
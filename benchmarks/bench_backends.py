@@ -0,0 +1,90 @@
+"""
+Benchmark: the compositing engine's backends (opencv, numpy, pil) on the
+same placements, with the largest per-pixel difference from the OpenCV
+output. The synthetic logo is smooth, so the repo's own logos also run on
+the skewed quad: hard edges and fine detail show sampling offsets a
+gradient hides. The fastest backend should be compositing.DEFAULT_BACKEND.
+
+Run from the repo root:
+
+    python benchmarks/bench_backends.py [--megapixels 1 6 12] [--repeats 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_compositing import synthetic_inputs  # noqa: E402
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOLUTIONS_MP = [1, 6, 12]
+REAL_LOGOS = [os.path.join(REPO, "input", "logos", name) for name in ("back.png", "bird.png")]
+REPEATS = 5
+
+
+def cases(cap, logo, quad, real_logos=None):
+    """Placements per case; real_logos ({name: asset}) each add a case on the quad."""
+    h, w = cap.shape[:2]
+    side = w / 6
+    real = {name: [{"logo": asset, "quad": quad}] for name, asset in (real_logos or {}).items()}
+    return {
+        "quad": [{"logo": logo, "quad": quad}],
+        "rect": [{"logo": logo, "rect": (w * 0.1, h * 0.1, side, side)}],
+        "edge": [{"logo": logo, "center": (w - side / 4, h - side / 4), "size": (side, side)}],
+        "bend": [{"logo": logo, "quad": quad, "bend": 0.4}],
+        "multi": [
+            {"logo": logo, "quad": quad, "z": 1},
+            {"logo": logo, "rect": (w * 0.1, h * 0.1, side, side), "opacity": 0.5},
+        ],
+        **real,
+    }
+
+
+def best_ms(fn, repeats):
+    fn()  # warm up (pyramid level, bend maps)
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=RESOLUTIONS_MP)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from compositing import BACKENDS, DEFAULT_BACKEND, composite
+    from logo_assets import LogoAsset, load_logo_asset
+
+    totals = dict.fromkeys(BACKENDS, 0.0)
+    header = "".join(f"{name + ' ms':>11}" for name in BACKENDS)
+    print(f"{'MP':>4} {'case':<6}{header} {'max diff':>9}")
+    for mp in args.megapixels:
+        cap, logo, quad = synthetic_inputs(mp)
+        logo = LogoAsset(None, logo)
+        real_logos = {os.path.splitext(os.path.basename(path))[0]: load_logo_asset(path) for path in REAL_LOGOS}
+        for case, placements in cases(cap, logo, quad, real_logos).items():
+            reference = composite(cap, placements, backend="opencv").astype(np.int16)
+            row, diff = [], 0
+            for name in BACKENDS:
+                ms = best_ms(lambda: composite(cap, placements, backend=name), args.repeats)
+                totals[name] += ms
+                row.append(f"{ms:>11.1f}")
+                out = composite(cap, placements, backend=name).astype(np.int16)
+                diff = max(diff, int(np.abs(out - reference).max()))
+            print(f"{mp:>4g} {case:<6}{''.join(row)} {diff:>9}")
+
+    fastest = min(totals, key=totals.get)
+    print("\nTotal: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in totals.items()))
+    print(f"Fastest: {fastest} (default: {DEFAULT_BACKEND})")
+
+
+if __name__ == "__main__":
+    main()
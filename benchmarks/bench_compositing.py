@@ -0,0 +1,174 @@
+"""
+Benchmark: full-frame float32 vs ROI fixed-point compositing in opencv_logic.
+
+Each (mode, resolution) case runs in its own subprocess so peak RSS is not
+polluted by earlier cases. Accuracy is then checked on the logos in
+input/logos over random quads: the ROI path must stay within 1 LSB of the
+full-frame path. Run from the repo root:
+
+    python benchmarks/bench_compositing.py
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+RESOLUTIONS_MP = [1, 6, 12, 24]
+REPEATS = 5
+LOGO_DIR = os.path.join(REPO, "input", "logos")
+ACCURACY_MP = 6
+ACCURACY_QUADS = 30
+
+
+def synthetic_inputs(megapixels, logo_size=800):
+    import numpy as np
+
+    w = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    h = int(w * 3 / 4)
+    rng = np.random.default_rng(0)
+    cap = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    # Logo: colour gradients with a soft-edged circular alpha, like a real PNG mark
+    n = logo_size
+    yy, xx = np.mgrid[0:n, 0:n]
+    logo = np.empty((n, n, 4), dtype=np.uint8)
+    logo[:, :, 0] = xx * 255 // (n - 1)
+    logo[:, :, 1] = yy * 255 // (n - 1)
+    logo[:, :, 2] = 128
+    dist = np.hypot(xx - n / 2, yy - n / 2)
+    logo[:, :, 3] = np.clip((n * 0.475 - dist) * 8, 0, 255).astype(np.uint8)
+    # Logo occupies roughly a sixth of the cap width, slightly skewed
+    qw = w / 6
+    x, y = w * 0.4, h * 0.35
+    quad = [(x, y), (x + qw, y + qw * 0.05), (x + qw * 0.95, y + qw * 0.8), (x - qw * 0.05, y + qw * 0.75)]
+    return cap, logo, quad
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss():
+    """Reset VmHWM so the next peak only covers the timed section (Linux >= 4.0)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def run_case(mode, megapixels):
+    from logo_assets import LogoAsset
+    from opencv_logic import composite_logo
+
+    cap, logo, quad = synthetic_inputs(megapixels)
+    logo = LogoAsset(None, logo)
+    composite_logo(cap, logo, quad, mode=mode)  # warm up
+    rss_before = _status_kb("VmRSS")
+    reset_peak_rss()
+    timings = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        composite_logo(cap, logo, quad, mode=mode)
+        timings.append(time.perf_counter() - t0)
+    peak_kb = _status_kb("VmHWM")
+    return {
+        "mode": mode,
+        "megapixels": megapixels,
+        "best_ms": min(timings) * 1000,
+        "peak_rss_delta_mb": max(peak_kb - rss_before, 0) / 1024,
+    }
+
+
+def max_diff(megapixels):
+    import numpy as np
+    from opencv_logic import composite_logo
+
+    # A logo smaller than the quad keeps the ROI path on pyramid level 0,
+    # which is the level that must match the original blend
+    w = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    cap, logo, quad = synthetic_inputs(megapixels, logo_size=int(w / 6 * 0.7))
+    full = composite_logo(cap, logo, quad, mode="full").astype(np.int16)
+    roi = composite_logo(cap, logo, quad, mode="roi").astype(np.int16)
+    return int(np.abs(full - roi).max())
+
+
+def random_quads(rng, width, height, count, min_size):
+    """Perspective-skewed quads of at least min_size pixels, inside a width x height cap."""
+    quads = []
+    for _ in range(count):
+        size = rng.uniform(min_size, min(width, height) / 2)
+        cx, cy = rng.uniform(size, width - size), rng.uniform(size, height - size)
+        quads.append([
+            (cx + dx * size / 2 + rng.uniform(-0.15, 0.15) * size, cy + dy * size / 2 + rng.uniform(-0.15, 0.15) * size)
+            for dx, dy in ((-1, -1), (1, -1), (1, 1), (-1, 1))
+        ])
+    return quads
+
+
+def logo_accuracy(path, megapixels=ACCURACY_MP, count=ACCURACY_QUADS, logo_width=300):
+    """
+    (max diff, pixels more than 1 LSB off) between the ROI and full paths for
+    one logo over random quads. The logo is scaled below the smallest quad so
+    the ROI path samples pyramid level 0, the artwork the full path warps.
+    """
+    import cv2
+    import numpy as np
+    from logo_assets import LogoAsset
+    from opencv_logic import composite_logo
+
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    height = max(1, round(image.shape[0] * logo_width / image.shape[1]))
+    logo = LogoAsset(None, cv2.resize(image, (logo_width, height), interpolation=cv2.INTER_AREA))
+    cap, _, _ = synthetic_inputs(megapixels, logo_size=8)
+    rng = np.random.default_rng(0)
+    worst = over = 0
+    for quad in random_quads(rng, cap.shape[1], cap.shape[0], count, min_size=logo_width * 1.1):
+        full = composite_logo(cap, logo, quad, mode="full").astype(np.int16)
+        roi = composite_logo(cap, logo, quad, mode="roi").astype(np.int16)
+        diff = np.abs(full - roi)
+        worst = max(worst, int(diff.max()))
+        over += int(np.count_nonzero(diff > 1))
+    return worst, over
+
+
+def main():
+    if len(sys.argv) == 3:
+        print(json.dumps(run_case(sys.argv[1], float(sys.argv[2]))))
+        return
+
+    print(f"{'MP':>4} {'full ms':>9} {'roi ms':>8} {'speedup':>8} {'full MB':>8} {'roi MB':>7} {'max diff':>8}")
+    for mp in RESOLUTIONS_MP:
+        rows = {}
+        for mode in ("full", "roi"):
+            out = subprocess.run(
+                [sys.executable, __file__, mode, str(mp)], capture_output=True, text=True, check=True
+            )
+            rows[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        full, roi = rows["full"], rows["roi"]
+        print(
+            f"{mp:>4} {full['best_ms']:>9.1f} {roi['best_ms']:>8.1f} {full['best_ms'] / roi['best_ms']:>7.1f}x "
+            f"{full['peak_rss_delta_mb']:>8.0f} {roi['peak_rss_delta_mb']:>7.0f} {max_diff(mp):>8}"
+        )
+
+    print(f"\n{'logo':<28} {'max diff':>8} {'px > 1':>7}  ({ACCURACY_QUADS} random quads, {ACCURACY_MP} MP)")
+    failed = False
+    for name in sorted(os.listdir(LOGO_DIR)):
+        worst, over = logo_accuracy(os.path.join(LOGO_DIR, name))
+        failed |= worst > 1
+        print(f"{name:<28} {worst:>8} {over:>7}")
+    if failed:
+        print("❌ The ROI path differs from the full-frame path by more than 1 LSB.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: Paragraph-cell ReportLab Table vs DataTable for long design tables.
+
+Builds a two-column key/value table (about one row in ten wraps) at each row
+count and times the PDF build. The legacy Table re-splits every remaining row
+on each page, so it is skipped above --legacy-max rows. Run from the repo root:
+
+    python benchmarks/bench_tables.py [--legacy-max 10000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+from report_tables import DataTable, default_cell_style
+
+ROW_COUNTS = [100, 10_000, 100_000]
+COL_WIDTHS = [7 * cm, 8 * cm]
+STYLE = [
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+]
+
+
+def synthetic_rows(n):
+    rows = [["Detail", "Value"]]
+    for i in range(n):
+        value = f"Cotton twill {i}"
+        if i % 10 == 0:
+            value += ", brushed, enzyme washed, 280 gsm, colour matched to panel trims"
+        rows.append([f"Trim {i}", value])
+    return rows
+
+
+def legacy_table(rows):
+    style = default_cell_style()
+    table = Table([[Paragraph(c, style) for c in row] for row in rows], colWidths=COL_WIDTHS, repeatRows=1)
+    table.setStyle(TableStyle(STYLE))
+    return table
+
+
+def data_table(rows):
+    return DataTable(rows, COL_WIDTHS, STYLE)
+
+
+def time_build(make_table, rows, path):
+    start = time.perf_counter()
+    SimpleDocTemplate(path, pagesize=A4).build([make_table(rows)])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--legacy-max", type=int, default=10_000,
+                        help="largest row count to run the legacy Table at")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'legacy s':>10} {'datatable s':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "table.pdf")
+        for n in ROW_COUNTS:
+            rows = synthetic_rows(n)
+            fast = time_build(data_table, rows, path)
+            if n <= args.legacy_max:
+                legacy = time_build(legacy_table, rows, path)
+                print(f"{n:>8} {legacy:>10.2f} {fast:>12.2f} {legacy / fast:>7.1f}x")
+            else:
+                print(f"{n:>8} {'skipped':>10} {fast:>12.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Import-time budget check for the modules app.py loads on startup.
+
+Each module is imported in a fresh interpreter (`python -X importtime`) from an
+empty working directory, and the check fails (exit status 1) if:
+
+  * its cumulative import time exceeds the budget (best of several runs),
+  * it pulls in a heavy dependency (OpenCV, NumPy, pandas, ReportLab, ...) it
+    is not allowed in ALLOWED_HEAVY, or
+  * importing it creates files or directories.
+
+Run from the repo root, e.g. in CI:
+
+    python benchmarks/check_import_time.py [--budget-ms 150] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "ai_part", "ai_part2", "ai_service", "asset_store", "image_io",
+    "render_cache", "render_service", "image_cache", "tracing", "compositing", "logo_assets",
+]
+HEAVY = ["cv2", "numpy", "pandas", "pyarrow", "reportlab", "PIL", "matplotlib", "openai", "streamlit"]
+# The image modules need OpenCV and NumPy to do anything; everything else stays out
+ALLOWED_HEAVY = {"compositing": ["cv2", "numpy"], "logo_assets": ["cv2", "numpy"]}
+BUDGET_MS = 150
+RUNS = 3
+
+PROBE = (
+    "import sys, json, {module}; "
+    "print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}} & set({heavy!r}))))"
+)
+
+
+def import_once(module, cwd):
+    """Returns (cumulative import time in ms, heavy modules loaded) for one fresh import."""
+    env = dict(os.environ, PYTHONPATH=REPO)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, heavy=HEAVY)],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    cumulative_us = 0
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1])
+    return cumulative_us / 1000, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check_module(module, budget_ms, runs):
+    problems = []
+    with tempfile.TemporaryDirectory() as cwd:
+        times, heavy = [], []
+        for _ in range(runs):
+            ms, heavy = import_once(module, cwd)
+            times.append(ms)
+        created = sorted(os.listdir(cwd))
+    best = min(times)
+    if best > budget_ms:
+        problems.append(f"{best:.1f} ms > {budget_ms} ms budget")
+    heavy = [name for name in heavy if name not in ALLOWED_HEAVY.get(module, ())]
+    if heavy:
+        problems.append(f"imports {', '.join(heavy)}")
+    if created:
+        problems.append(f"creates {', '.join(created)}")
+    return best, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        best, problems = check_module(module, args.budget_ms, args.runs)
+        status = "FAIL " + "; ".join(problems) if problems else "ok"
+        print(f"{module:<14} {best:>8.1f} ms  {status}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
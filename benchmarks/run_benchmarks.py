@@ -0,0 +1,420 @@
+"""
+Benchmark suite for the render and report pipeline, with a regression gate.
+
+Synthetic caps (1-50 MP) and logos (RGB, RGBA, huge and tiny) are generated
+once into a data directory, then every case runs in a fresh subprocess:
+
+  * opencv_logic.apply_logo_realistic, ai_part.apply_logo and
+    ai_part2.apply_logo (the click is fixed at the cap centre), per cap x logo,
+  * fetch_key_value_table on workbooks of several row counts,
+  * generate_pdf_report at several report sizes; warm repeats of an
+    unchanged report hit the report cache, so the largest size also runs
+    "edited", changing one view's description per call to time a rebuild
+    from prepared images,
+  * colorways.render_colorways with 1 and 20 colours, so the cost of extra
+    colorways stays visible next to the single-colour render.
+
+Each case records cold_ms (first call, caches empty), warm_ms (best repeat),
+peak_rss_mb (peak RSS growth during the calls) and output_bytes, keeping
+the best of --runs processes. The AI layer
+runs on the deterministic stub backend and all caches live in a temporary
+directory, so the suite runs offline. Run from the repo root:
+
+    python benchmarks/run_benchmarks.py --save                   # record the baseline
+    python benchmarks/run_benchmarks.py                          # compare, exit 1 on regression
+    python benchmarks/run_benchmarks.py --quick --threshold 0.3  # smaller matrix, e.g. in CI
+    python benchmarks/run_benchmarks.py --no-baseline            # measure only, no gate
+
+A case regresses when a metric grows by more than --threshold (fractional)
+and, for time and memory, by more than --min-ms / --min-mb as well, so
+noise on millisecond-sized cases does not fail the run. Baselines are
+machine-specific and not committed; record one per machine. A compare run
+without a baseline fails rather than passing with nothing to compare.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from bench_compositing import _status_kb, reset_peak_rss  # noqa: E402
+
+BASELINE_PATH = os.path.join(REPO, "benchmarks", "baseline.json")
+CAP_MP = [1, 6, 12, 24, 50]
+LOGOS = {"rgb": (600, 400, 3), "rgba": (800, 800, 4), "huge": (6000, 6000, 4), "tiny": (24, 24, 4)}
+TABLE_ROWS = [1_000, 10_000, 100_000]
+REPORT_VIEWS = [1, 10, 50]
+REPORT_CAP_MP = 6
+REPORT_TABLE_ROWS = 200
+COLORWAYS = [1, 20]
+QUICK = {
+    "caps": [1, 6], "logos": ["rgba", "huge"], "tables": [1_000], "reports": [1, 10], "report_mp": 1, "colorways": [1, 20],
+}
+REPEATS = 3  # calls per process: one cold, the rest warm
+RUNS = 3  # fresh processes per case; each metric keeps its best run
+THRESHOLD = 0.2
+MIN_MS = 10.0
+MIN_MB = 8.0
+METRICS = ["cold_ms", "warm_ms", "peak_rss_mb", "output_bytes"]
+
+
+# ----------------- SYNTHETIC INPUTS -----------------
+def cap_size(megapixels):
+    w = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    return w, int(w * 3 / 4)
+
+
+def cap_path(data_dir, megapixels):
+    return os.path.join(data_dir, f"cap_{megapixels:g}mp.jpg")
+
+
+def logo_path(data_dir, kind):
+    return os.path.join(data_dir, f"logo_{kind}." + ("jpg" if LOGOS[kind][2] == 3 else "png"))
+
+
+def table_path(data_dir, rows):
+    return os.path.join(data_dir, f"table_{rows}.xlsx")
+
+
+def mask_path(data_dir, megapixels):
+    return os.path.join(data_dir, f"mask_{megapixels:g}mp.png")
+
+
+def make_cap(path, megapixels):
+    """Smooth colour fields plus sensor-like noise, so JPEG sizes resemble photos."""
+    import cv2
+    import numpy as np
+
+    w, h = cap_size(megapixels)
+    rng = np.random.default_rng(int(megapixels * 10))
+    coarse = rng.integers(40, 220, (max(h // 256, 2), max(w // 256, 2), 3), dtype=np.uint8)
+    cap = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC)
+    noise = np.empty_like(cap)
+    cv2.randu(noise, 0, 24)
+    cv2.add(cap, noise, dst=cap)
+    cv2.imwrite(path, cap, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+
+def make_logo(path, width, height, channels):
+    """Colour gradients with a soft-edged elliptical alpha, like a real PNG mark."""
+    import cv2
+    import numpy as np
+
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    logo = np.empty((height, width, channels), dtype=np.uint8)
+    logo[:, :, 0] = xx * 255 / max(width - 1, 1)
+    logo[:, :, 1] = yy * 255 / max(height - 1, 1)
+    logo[:, :, 2] = 128
+    if channels == 4:
+        dist = np.hypot((xx - width / 2) / width, (yy - height / 2) / height)
+        logo[:, :, 3] = np.clip((0.475 - dist) * 8 * min(width, height), 0, 255).astype(np.uint8)
+    cv2.imwrite(path, logo)
+
+
+def make_mask(path, megapixels):
+    """Soft-edged elliptical fabric mask covering the middle of the cap."""
+    import cv2
+    import numpy as np
+
+    w, h = cap_size(megapixels)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.ellipse(mask, (w // 2, h // 2), (w // 3, h // 3), 0, 0, 360, 255, -1)
+    cv2.imwrite(path, cv2.GaussianBlur(mask, (0, 0), max(w / 400, 1)))
+
+
+def make_table(path, rows):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["Detail", "Value"])
+    for i in range(rows):
+        value = f"Cotton twill {i}"
+        if i % 10 == 0:
+            value += ", brushed, enzyme washed, 280 gsm, colour matched to panel trims"
+        ws.append([f"Trim {i}", value])
+    wb.save(path)
+
+
+def prepare_data(data_dir, matrix):
+    """Generates any missing inputs; existing files are reused across runs."""
+    os.makedirs(data_dir, exist_ok=True)
+    jobs = [(cap_path(data_dir, mp), make_cap, (mp,)) for mp in sorted(set(matrix["caps"] + [matrix["report_mp"]]))]
+    jobs += [(logo_path(data_dir, kind), make_logo, LOGOS[kind]) for kind in LOGOS]
+    jobs += [(table_path(data_dir, n), make_table, (n,)) for n in sorted(set(matrix["tables"] + [REPORT_TABLE_ROWS]))]
+    jobs.append((mask_path(data_dir, matrix["report_mp"]), make_mask, (matrix["report_mp"],)))
+    for path, make, args in jobs:
+        if not os.path.exists(path):
+            print(f"⏳ Generating {os.path.basename(path)}")
+            make(path, *args)
+
+
+def build_cases(matrix):
+    cases = []
+    for kind in ("apply_logo_realistic", "ai_part.apply_logo", "ai_part2.apply_logo"):
+        for mp in matrix["caps"]:
+            for logo in matrix["logos"]:
+                cases.append({"name": f"{kind}/{mp:g}mp/{logo}", "kind": kind, "mp": mp, "logo": logo})
+    for rows in matrix["tables"]:
+        cases.append({"name": f"fetch_key_value_table/{rows}", "kind": "fetch_key_value_table", "rows": rows})
+    for views in matrix["reports"]:
+        cases.append({"name": f"generate_pdf_report/{views}views", "kind": "generate_pdf_report",
+                      "views": views, "mp": matrix["report_mp"]})
+    views = max(matrix["reports"])
+    cases.append({"name": f"generate_pdf_report/{views}views/edited", "kind": "generate_pdf_report",
+                  "views": views, "mp": matrix["report_mp"], "edited": True})
+    for count in matrix["colorways"]:
+        cases.append({"name": f"render_colorways/{matrix['report_mp']:g}mp/{count}colors", "kind": "render_colorways",
+                      "colors": count, "mp": matrix["report_mp"]})
+    return cases
+
+
+# ----------------- CASES (run in the child process) -----------------
+def _quad(megapixels):
+    w, h = cap_size(megapixels)
+    qw = w / 6
+    x, y = w * 0.4, h * 0.35
+    return [(x, y), (x + qw, y + qw * 0.05), (x + qw * 0.95, y + qw * 0.8), (x - qw * 0.05, y + qw * 0.75)]
+
+
+def _checked(fn, *args):
+    def call():
+        if not fn(*args):
+            raise RuntimeError(f"{fn.__module__}.{fn.__name__} reported a failure")
+    return call
+
+
+def setup_case(case, data_dir, out_dir):
+    """Returns (callable, output path) for a case; imports happen here, outside the timing."""
+    kind = case["kind"]
+    out_path = os.path.join(out_dir, "out.pdf" if kind == "generate_pdf_report" else "out.png")
+    if kind.endswith("apply_logo") or kind == "apply_logo_realistic":
+        # The overlay functions import the engine lazily; keep that out of cold_ms
+        importlib.import_module("compositing")
+
+    if kind == "apply_logo_realistic":
+        from opencv_logic import apply_logo_realistic
+
+        args = (cap_path(data_dir, case["mp"]), logo_path(data_dir, case["logo"]), _quad(case["mp"]), out_path)
+        return _checked(apply_logo_realistic, *args), out_path
+
+    if kind in ("ai_part.apply_logo", "ai_part2.apply_logo"):
+        import ai_part
+        import ai_part2
+
+        w, h = cap_size(case["mp"])
+        size = (int(w / 6), int(w / 6))
+        args = (cap_path(data_dir, case["mp"]), logo_path(data_dir, case["logo"]), *size, out_path)
+        if kind == "ai_part.apply_logo":
+            return _checked(ai_part.apply_logo, *args), out_path
+        ai_part2.get_click_coordinates = lambda image_path: (w // 2, h // 2)  # no interactive click
+        return _checked(ai_part2.apply_logo, *args), out_path
+
+    if kind == "fetch_key_value_table":
+        from report_pdf import fetch_key_value_table
+
+        path = table_path(data_dir, case["rows"])
+        columns = {"indices": [0, 1], "names": ["Detail", "Value"]}
+
+        def call():
+            rows = fetch_key_value_table(path, columns=columns)
+            with open(out_path, "w") as f:
+                json.dump(rows, f)
+        return call, out_path
+
+    if kind == "generate_pdf_report":
+        from ai_part import submit_description
+        from report_pdf import generate_pdf_report
+
+        cap = cap_path(data_dir, case["mp"])
+        results = [
+            {
+                "image": cap,
+                "logo": logo_path(data_dir, "rgba"),
+                "size_cm": (6, 4),
+                "placement": f"Panel {i + 1}",
+                "description": submit_description(f"Panel {i + 1}", (6, 4), os.path.basename(cap)).result(),
+                "output": cap,
+            }
+            for i in range(case["views"])
+        ]
+        args = dict(excel_file=table_path(data_dir, REPORT_TABLE_ROWS),
+                    excel_columns={"indices": [0, 1], "names": ["Detail", "Value"]})
+        if not case.get("edited"):
+            return (lambda: generate_pdf_report(results, pdf_path=out_path, **args)), out_path
+        edits = iter(range(1_000_000))
+
+        def call():
+            results[-1]["description"] = f"Revision {next(edits)}"
+            generate_pdf_report(results, pdf_path=out_path, **args)
+        return call, out_path
+
+    if kind == "render_colorways":
+        from colorways import render_colorways
+
+        colors = [f"c{i}=#{(i * 0x2f5b13) % 0xffffff:06x}" for i in range(case["colors"])]
+        placements = [{"logo": logo_path(data_dir, "rgba"), "quad": _quad(case["mp"])}]
+        out_paths = [os.path.join(out_dir, f"out_{i}.png") for i in range(case["colors"])]
+        args = (cap_path(data_dir, case["mp"]), mask_path(data_dir, case["mp"]), colors, placements, out_paths)
+        # output_bytes is the first variant's size
+        return (lambda: render_colorways(*args)), out_paths[0]
+
+    raise ValueError(f"Unknown benchmark kind: {kind}")
+
+
+def run_case(case, data_dir, repeats):
+    with tempfile.TemporaryDirectory() as out_dir:
+        call, out_path = setup_case(case, data_dir, out_dir)
+        rss_before = _status_kb("VmRSS")
+        reset_peak_rss()
+        timings = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - t0) * 1000)
+        peak_kb = _status_kb("VmHWM")
+        output_bytes = os.path.getsize(out_path)
+    return {
+        "cold_ms": round(timings[0], 2),
+        "warm_ms": round(min(timings[1:] or timings), 2),
+        "peak_rss_mb": round(max(peak_kb - rss_before, 0) / 1024, 1),
+        "output_bytes": output_bytes,
+    }
+
+
+# ----------------- DRIVER -----------------
+def run_once(case, data_dir, repeats):
+    cache_dir = tempfile.mkdtemp(prefix="techpack-bench-cache-")
+    env = dict(os.environ, TECHPACK_AI_BACKEND="stub", TECHPACK_CACHE_DIR=cache_dir, PYTHONPATH=REPO)
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case),
+             "--data-dir", data_dir, "--repeats", str(repeats)],
+            cwd=cache_dir, env=env, capture_output=True, text=True,
+        )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "case failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_best_of(case, data_dir, repeats, runs):
+    results = [run_once(case, data_dir, repeats) for _ in range(runs)]
+    return {metric: min(result[metric] for result in results) for metric in METRICS}
+
+
+def machine_info():
+    import cv2
+    import numpy as np
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def regressions(result, base, threshold, min_ms, min_mb):
+    found = []
+    for metric in METRICS:
+        old, new = base.get(metric), result[metric]
+        if old is None or new <= old * (1 + threshold):
+            continue
+        floor = min_ms if metric.endswith("_ms") else min_mb if metric.endswith("_mb") else 0
+        if new - old > floor:
+            found.append(f"{metric} {old:g} -> {new:g} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against or save to")
+    parser.add_argument("--save", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--no-baseline", action="store_true", help="only measure; skip the regression gate")
+    parser.add_argument("--quick", action="store_true", help="smaller matrix (1-6 MP, fewer logos and sizes)")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this text")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--min-ms", type=float, default=MIN_MS)
+    parser.add_argument("--min-mb", type=float, default=MIN_MB)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "techpack-bench-data"))
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case), args.data_dir, args.repeats)))
+        return
+
+    matrix = QUICK if args.quick else {
+        "caps": CAP_MP, "logos": list(LOGOS), "tables": TABLE_ROWS, "reports": REPORT_VIEWS, "report_mp": REPORT_CAP_MP,
+        "colorways": COLORWAYS,
+    }
+    cases = [case for case in build_cases(matrix) if args.filter in case["name"]]
+
+    baseline = {}
+    gate = not (args.save or args.no_baseline)
+    if gate and not os.path.exists(args.baseline):
+        print(f"❌ No baseline at {args.baseline}, so there is nothing to compare against.")
+        print("   Record one on this machine with --save, or pass --no-baseline to only measure.")
+        sys.exit(1)
+    if gate:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != machine_info():
+            print("⚠️ Baseline was recorded on a different machine or library versions; timings may not compare.")
+    prepare_data(args.data_dir, matrix)
+
+    results, failed, compared = {}, [], 0
+    print(f"{'case':<44} {'cold ms':>9} {'warm ms':>9} {'peak MB':>8} {'output':>11}  status")
+    for case in cases:
+        try:
+            result = run_best_of(case, args.data_dir, args.repeats, args.runs)
+        except RuntimeError as e:
+            print(f"{case['name']:<44} ❌ {e}")
+            failed.append(case["name"])
+            continue
+        results[case["name"]] = result
+        base = baseline.get("cases", {}).get(case["name"])
+        problems = regressions(result, base, args.threshold, args.min_ms, args.min_mb) if base else []
+        compared += bool(base)
+        status = "new" if base is None and baseline else "; ".join(problems) if problems else "ok"
+        print(
+            f"{case['name']:<44} {result['cold_ms']:>9.1f} {result['warm_ms']:>9.1f} "
+            f"{result['peak_rss_mb']:>8.1f} {result['output_bytes']:>11,}  {status}"
+        )
+        if problems:
+            failed.append(case["name"])
+
+    if args.save:
+        old_cases = {}
+        if args.filter and os.path.exists(args.baseline):
+            # A filtered run only replaces the cases it measured
+            with open(args.baseline) as f:
+                old_cases = json.load(f).get("cases", {})
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine_info(), "cases": {**old_cases, **results}}, f, indent=1, sort_keys=True)
+        print(f"💾 Baseline saved to {args.baseline}")
+
+    if failed:
+        print(f"❌ {len(failed)} case(s) failed or regressed beyond {args.threshold:.0%}.")
+        sys.exit(1)
+    if gate and results and not compared:
+        print(f"❌ None of these cases are in {args.baseline}; record them with --save (e.g. with the same --quick).")
+        sys.exit(1)
+    print("✅ No regressions." if gate else "✅ Done (no regression gate).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Colorway variants: one master cap photo, a fabric mask and a list of target
+colours in, one rendered image per colour out.
+
+    paths = render_colorways("front.jpg", "front_mask.png", ["navy=#1f2a44", "#b22222"],
+                             placements, colorway_paths("out/front.png", ["navy", "#b22222"]))
+
+The fabric is recoloured in LAB: lightness keeps the photo's shading around
+the target's lightness and a/b keep a fraction of the fabric's own chroma
+variation, so folds, stitching and texture survive. Everything that does not
+depend on the colour is done once per batch: the master's LAB conversion and
+fabric statistics, and the logo warps (compositing.warp_placements). Each
+colour then costs a 256-entry lookup table over the fabric's bounding box,
+its share of one LAB -> BGR conversion over the stacked batch, a masked copy
+(only the mask's soft edge is blended per pixel), the logo blends and the
+encode, which runs on a small thread pool.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_io import decode_image, read_bytes
+from opencv_logic import blend_roi
+from tracing import span
+
+CHROMA_KEEP = 0.35  # share of the fabric's own a/b variation kept in each colorway
+MIN_SHADING = 0.4  # floor on shading contrast when darkening a light fabric
+BATCH_BYTES = int(os.getenv("TECHPACK_COLORWAY_BATCH_BYTES", 256 * 1024 * 1024))
+ENCODE_THREADS = min(4, os.cpu_count() or 1)
+
+_HEX = re.compile(r"#?([0-9a-fA-F]{6})")
+
+
+# ----------------- INPUTS -----------------
+def parse_color(spec):
+    """BGR tuple for "#rrggbb" / "rrggbb" or an (r, g, b) sequence; raises ValueError."""
+    if isinstance(spec, str):
+        match = _HEX.fullmatch(spec.strip())
+        if not match:
+            raise ValueError(f"Not a hex colour: {spec!r}")
+        r, g, b = (int(match.group(1)[i:i + 2], 16) for i in (0, 2, 4))
+    else:
+        r, g, b = (int(c) for c in spec)
+        if not all(0 <= c <= 255 for c in (r, g, b)):
+            raise ValueError(f"RGB values must be 0-255: {spec!r}")
+    return (b, g, r)
+
+
+def parse_colors(colors):
+    """
+    [(name, "#rrggbb")] from a {name: colour} dict, or from "name=#rrggbb" /
+    "#rrggbb" strings or (name, colour) pairs, colours as for parse_color(); a
+    string may list several, separated by commas or newlines. Unnamed colours
+    are named by their hex code. Parsing its own output returns it unchanged.
+    """
+    if isinstance(colors, dict):
+        colors = list(colors.items())
+    elif isinstance(colors, str):
+        colors = [c for c in re.split(r"[,\n]", colors) if c.strip()]
+    parsed = []
+    for item in colors:
+        if isinstance(item, str):
+            name, _, spec = item.rpartition("=")
+            name, spec = name.strip(), spec.strip()
+            name = name or "#" + spec.lstrip("#").lower()
+        else:
+            name, spec = item
+        b, g, r = parse_color(spec)
+        parsed.append((str(name), f"#{r:02x}{g:02x}{b:02x}"))
+    if not parsed:
+        raise ValueError("No colorway colours given.")
+    return parsed
+
+
+def colorway_paths(base_path, names):
+    """One output path per colour name: out/front.png -> out/front_navy.png."""
+    stem, ext = os.path.splitext(base_path)
+    return [f"{stem}_{re.sub(r'[^0-9A-Za-z]+', '-', name).strip('-').lower() or 'color'}{ext}" for name in names]
+
+
+def load_mask(source, size):
+    """
+    Fabric mask as a uint8 array of size (h, w): 255 recolours fully, 0 leaves
+    the photo untouched, values between blend. source is a path, uploaded
+    file, encoded bytes or an array; a mask with an alpha channel uses the
+    alpha, anything else its grey level. Raises ValueError if unreadable.
+    """
+    if isinstance(source, np.ndarray):
+        mask = source
+    else:
+        if isinstance(source, (str, os.PathLike)):
+            data = read_bytes(source)
+        else:
+            data = source.getbuffer() if hasattr(source, "getbuffer") else source
+        mask = decode_image(data, cv2.IMREAD_UNCHANGED)
+        if mask is None:
+            raise ValueError("Could not read the fabric mask.")
+    if mask.ndim == 3:
+        mask = mask[:, :, 3] if mask.shape[2] == 4 else cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
+    if mask.dtype != np.uint8:
+        mask = (mask >> 8).astype(np.uint8) if mask.dtype == np.uint16 else cv2.convertScaleAbs(mask)
+    h, w = size
+    if mask.shape[:2] != (h, w):
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(mask)
+
+
+# ----------------- RECOLOUR -----------------
+def _lookup_tables(mean, colors, chroma_keep):
+    """One 256 x 1 x 3 LAB lookup table per colour, mapping fabric values to the colorway."""
+    targets = cv2.cvtColor(np.array([[parse_color(spec) for _, spec in colors]], dtype=np.uint8), cv2.COLOR_BGR2LAB)[0]
+    targets = targets.astype(np.float32)
+    levels = np.arange(256, dtype=np.float32)
+    tables = np.empty((len(colors), 256, 1, 3), dtype=np.uint8)
+    for k, target in enumerate(targets):
+        # Darkening a light fabric compresses its shading so shadows don't clip to black
+        shading = float(np.clip(target[0] / max(mean[0], 1.0), MIN_SHADING, 1.0))
+        table = np.stack([
+            target[0] + (levels - mean[0]) * shading,
+            target[1] + (levels - mean[1]) * chroma_keep,
+            target[2] + (levels - mean[2]) * chroma_keep,
+        ], axis=-1)
+        tables[k, :, 0] = np.clip(np.rint(table), 0, 255)
+    return tables
+
+
+def recolor_variants(cap_img, mask, colors, chroma_keep=CHROMA_KEEP, batch_bytes=BATCH_BYTES):
+    """
+    Yields one full-size BGR copy of cap_img per colour, with the masked
+    fabric recoloured. colors is parse_colors() output. Colours
+    are converted in batches of at most batch_bytes of stacked fabric.
+    """
+    x, y, w, h = cv2.boundingRect(mask)
+    if not w or not h:
+        raise ValueError("The fabric mask is empty.")
+    roi_mask = mask[y:y + h, x:x + w]
+    with span("colorway.analyse", pixels=w * h):
+        lab = cv2.cvtColor(cap_img[y:y + h, x:x + w], cv2.COLOR_BGR2LAB)
+        mean = cv2.mean(lab, mask=roi_mask)[:3]
+        tables = _lookup_tables(mean, colors, chroma_keep)
+        # Fully masked fabric is copied; only the soft edge needs a per-pixel blend
+        solid = (roi_mask == 255).astype(np.uint8)
+        edge = np.nonzero((roi_mask > 0) & (roi_mask < 255))
+        edge_alpha = roi_mask[edge][:, None]
+
+    per_batch = max(1, batch_bytes // (2 * lab.nbytes))  # LAB stack + its BGR conversion
+    for start in range(0, len(colors), per_batch):
+        count = min(per_batch, len(colors) - start)
+        with span("colorway.recolor", colors=count, pixels=w * h):
+            stack = np.empty((count * h, w, 3), dtype=np.uint8)
+            for k in range(count):
+                cv2.LUT(lab, tables[start + k], dst=stack[k * h:(k + 1) * h])
+            recolored = cv2.cvtColor(stack, cv2.COLOR_LAB2BGR)
+        del stack
+        for k in range(count):
+            out = cap_img.copy()
+            region, variant = out[y:y + h, x:x + w], recolored[k * h:(k + 1) * h]
+            cv2.copyTo(variant, solid, region)
+            if edge_alpha.size:
+                region[edge] = blend_roi(region[edge][:, None], variant[edge][:, None], edge_alpha)[:, 0]
+            yield out
+
+
+# ----------------- RENDER -----------------
+def _write(path, img, thumbnails=False):
+    with span("encode", format=os.path.splitext(path)[1].lower(), pixels=img.shape[0] * img.shape[1]):
+        if not cv2.imwrite(path, img):
+            raise IOError(f"Could not write {path}")
+    if thumbnails:
+        from thumbnails import make_thumbnails
+
+        make_thumbnails(path, img)
+    return path
+
+
+def render_colorways(cap, mask, colors, placements, out_paths, backend=None, thumbnails=False):
+    """
+    Renders one image per colour: the recoloured cap with every placement
+    composited on top, written to the matching entry of out_paths. The logos
+    are warped once and blended onto each variant. cap is a path, uploaded
+    file, encoded bytes or BGR array; mask as for load_mask(). With
+    thumbnails=True each variant's gallery thumbnails are made from its
+    array. Returns out_paths; raises on failure, so it is safe to run from
+    a render worker.
+    """
+    from compositing import blend_layers, get_backend, warp_placements
+
+    colors = parse_colors(colors)
+    if len(out_paths) != len(colors):
+        raise ValueError(f"Expected {len(colors)} output paths, got {len(out_paths)}.")
+    if not isinstance(cap, np.ndarray):
+        from image_cache import load_image
+
+        source, cap = cap, load_image(cap)
+        if cap is None:
+            raise ValueError(f"Could not read the cap image: {source}")
+
+    backend = get_backend(backend)
+    with span("colorways", colors=len(colors), placements=len(placements)):
+        mask = load_mask(mask, cap.shape[:2])
+        layers = warp_placements(placements, cap.shape[:2], backend)
+        with ThreadPoolExecutor(ENCODE_THREADS, thread_name_prefix="colorway-encode") as pool:
+            pending = []
+            for path, variant in zip(out_paths, recolor_variants(cap, mask, colors)):
+                blend_layers(variant, layers, backend)
+                pending.append(pool.submit(_write, path, variant, thumbnails))
+                # cv2.imwrite releases the GIL; bound how many full-size variants wait for an encoder
+                if len(pending) > ENCODE_THREADS:
+                    pending[-ENCODE_THREADS - 1].result()
+            for future in pending:
+                future.result()
+    return list(out_paths)
@@ -0,0 +1,322 @@
+"""
+The compositing engine shared by the app, both CLIs and the render workers.
+
+A placement is a dict with a "logo" (path, encoded bytes, decoded array or
+LogoAsset) and one geometry:
+
+    "quad": [tl, tr, br, bl]                   perspective warp onto four cap points
+    "rect": [x, y, w, h]                       axis-aligned box
+    "center": [cx, cy], "size": [w, h]         box centred on a point
+    "grid": points, "grid_size": (cols, rows)  explicit bend grid, row-major
+
+plus optional "bend" (-1..1, crown bend of the quad), "z" (lower draws
+first) and "opacity" (0..1). Geometry may run past the cap; only the part
+inside the image is drawn.
+
+Normalising placements, z-order, opacity and clipping are done here once; a
+backend only warps a logo into a clipped region and blends it there:
+
+    "opencv"  cv2.warpPerspective / remap + fixed-point blend (default, fastest)
+    "numpy"   inverse-mapped bilinear sampling in NumPy + the same blend
+    "pil"     Image.transform + ImageChops blend (bends sample through NumPy)
+
+Pick one per call or with TECHPACK_COMPOSITE_BACKEND; benchmarks/bench_backends.py
+compares them.
+"""
+import os
+
+import cv2
+import numpy as np
+
+from logo_assets import LogoAsset, load_logo_asset
+from opencv_logic import (
+    BEND_GRID_SIZE, bend_lattice, blend_roi, generate_bent_grid, grid_corners, logo_roi, warp_logo, warp_logo_bent,
+)
+from tracing import span
+
+DEFAULT_BACKEND = os.getenv("TECHPACK_COMPOSITE_BACKEND", "opencv")
+
+
+# ----------------- PLACEMENTS -----------------
+def rect_quad(x, y, w, h):
+    """tl, tr, br, bl corners of an axis-aligned box."""
+    return [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+
+
+def normalize_placement(placement):
+    """
+    Copy of a placement with its geometry resolved to a "quad" of float
+    corners (an explicit "grid" keeps its points and gets its corner quad).
+    Raises ValueError for a placement without usable geometry.
+    """
+    p = dict(placement)
+    if "grid" in p:
+        grid = [(float(x), float(y)) for x, y in p["grid"]]
+        gx, gy = p["grid_size"] = tuple(p.get("grid_size", BEND_GRID_SIZE))
+        if len(grid) != gx * gy:
+            raise ValueError(f"'grid' must have {gx} x {gy} points")
+        p["grid"] = grid
+        p["quad"] = [grid[0], grid[gx - 1], grid[-1], grid[-gx]]
+    elif "quad" not in p:
+        if "rect" in p:
+            x, y, w, h = p.pop("rect")
+        elif "center" in p and "size" in p:
+            (cx, cy), (w, h) = p.pop("center"), p.pop("size")
+            x, y = cx - w / 2, cy - h / 2
+        else:
+            raise ValueError("a placement needs a 'quad', 'rect', 'center' and 'size', or 'grid'")
+        p["quad"] = rect_quad(x, y, w, h)
+    quad = [(float(x), float(y)) for x, y in p["quad"]]
+    if len(quad) != 4:
+        raise ValueError("'quad' must have 4 corner points")
+    p["quad"] = quad
+    return p
+
+
+def scale_placements(placements, factor):
+    """Normalised copies of placements with their geometry scaled, e.g. to a display-sized preview."""
+    scaled = []
+    for p in map(normalize_placement, placements):
+        p["quad"] = [(x * factor, y * factor) for x, y in p["quad"]]
+        if "grid" in p:
+            p["grid"] = [(x * factor, y * factor) for x, y in p["grid"]]
+        scaled.append(p)
+    return scaled
+
+
+def _resolve_logo(logo):
+    if isinstance(logo, LogoAsset):
+        return logo
+    if isinstance(logo, np.ndarray):
+        return LogoAsset(None, logo)
+    return load_logo_asset(logo)
+
+
+# ----------------- BACKENDS -----------------
+# warp(logo, quad, roi) and warp_bent(logo, grid, grid_size, roi) return
+# (colour, alpha, premultiplied) sized to roi (x0, y0, x1, y1), already
+# clipped to the cap; blend(region, colour, alpha, premultiplied) draws in place.
+class OpenCVBackend:
+    name = "opencv"
+
+    def warp(self, logo, quad, roi):
+        x0, y0, x1, y1 = roi
+        return warp_logo(logo, quad, (x0, y0), (x1 - x0, y1 - y0))
+
+    def warp_bent(self, logo, grid, grid_size, roi):
+        return warp_logo_bent(logo, grid, grid_size, roi)
+
+    def blend(self, region, color, alpha, premultiplied):
+        blend_roi(region, color, alpha, premultiplied)
+
+
+def _homography(src, dst):
+    """3x3 matrix mapping four src points onto four dst points."""
+    a = np.zeros((8, 8))
+    b = np.zeros(8)
+    for i, ((x, y), (u, v)) in enumerate(zip(src, dst)):
+        a[2 * i] = [x, y, 1, 0, 0, 0, -u * x, -u * y]
+        a[2 * i + 1] = [0, 0, 0, x, y, 1, -v * x, -v * y]
+        b[2 * i], b[2 * i + 1] = u, v
+    return np.append(np.linalg.solve(a, b), 1.0).reshape(3, 3)
+
+
+def _roi_inverse(logo_size, quad, roi):
+    """Homography from ROI pixel coordinates back to logo coordinates."""
+    w, h = logo_size
+    x0, y0 = roi[:2]
+    shift = np.array([[1, 0, x0], [0, 1, y0], [0, 0, 1]], dtype=np.float64)
+    return np.linalg.inv(_homography([(0, 0), (w, 0), (w, h), (0, h)], quad)) @ shift
+
+
+def _sample(image, mx, my):
+    """Bilinear lookup of image at float maps (mx, my) as float32; taps outside the image read as 0."""
+    h, w = image.shape[:2]
+    mx = np.clip(mx, -2, w + 1)
+    my = np.clip(my, -2, h + 1)
+    fx0, fy0 = np.floor(mx), np.floor(my)
+    fx, fy = (mx - fx0).astype(np.float32), (my - fy0).astype(np.float32)
+    ix, iy = fx0.astype(np.intp), fy0.astype(np.intp)
+    out = np.zeros(mx.shape + image.shape[2:], dtype=np.float32)
+    for dx, dy, weight in ((0, 0, (1 - fx) * (1 - fy)), (1, 0, fx * (1 - fy)), (0, 1, (1 - fx) * fy), (1, 1, fx * fy)):
+        xs, ys = ix + dx, iy + dy
+        weight = weight * ((xs >= 0) & (xs < w) & (ys >= 0) & (ys < h))
+        tap = image[np.clip(ys, 0, h - 1), np.clip(xs, 0, w - 1)]
+        out += tap * (weight[..., None] if image.ndim == 3 else weight)
+    return out
+
+
+def _to_uint8(values):
+    return np.clip(values + 0.5, 0, 255).astype(np.uint8)
+
+
+class NumpyBackend:
+    name = "numpy"
+
+    def warp(self, logo, quad, roi):
+        color, alpha, premultiplied = logo.level(logo.level_for_quad(quad))
+        inv = _roi_inverse((alpha.shape[1], alpha.shape[0]), quad, roi)
+        xs, ys = np.meshgrid(np.arange(roi[2] - roi[0], dtype=np.float64), np.arange(roi[3] - roi[1], dtype=np.float64))
+        den = inv[2, 0] * xs + inv[2, 1] * ys + inv[2, 2]
+        mx = (inv[0, 0] * xs + inv[0, 1] * ys + inv[0, 2]) / den
+        my = (inv[1, 0] * xs + inv[1, 1] * ys + inv[1, 2]) / den
+        return _to_uint8(_sample(color, mx, my)), _to_uint8(_sample(alpha, mx, my)), premultiplied
+
+    def warp_bent(self, logo, grid, grid_size, roi):
+        color, alpha, premultiplied = logo.level(logo.level_for_quad(grid_corners(grid, grid_size)))
+        coarse = bend_lattice((alpha.shape[1], alpha.shape[0]), grid, grid_size, roi)
+        # Upsample the lattice the way cv2.resize (INTER_LINEAR) does: centre-aligned, edge-clamped
+        nh, nw = coarse.shape[:2]
+        rw, rh = roi[2] - roi[0], roi[3] - roi[1]
+        cx = np.clip((np.arange(rw) + 0.5) * nw / rw - 0.5, 0, nw - 1)
+        cy = np.clip((np.arange(rh) + 0.5) * nh / rh - 0.5, 0, nh - 1)
+        dense = _sample(coarse, *np.meshgrid(cx, cy))
+        mx, my = dense[:, :, 0], dense[:, :, 1]
+        return _to_uint8(_sample(color, mx, my)), _to_uint8(_sample(alpha, mx, my)), premultiplied
+
+    def blend(self, region, color, alpha, premultiplied):
+        blend_roi(region, color, alpha, premultiplied)
+
+
+class PILBackend:
+    name = "pil"
+
+    def warp(self, logo, quad, roi):
+        from PIL import Image
+
+        color, alpha, premultiplied = logo.level(logo.level_for_quad(quad))
+        inv = _roi_inverse((alpha.shape[1], alpha.shape[0]), quad, roi)
+        # Pillow samples at pixel centres (index + 0.5) where OpenCV uses the index itself,
+        # and the logo gets a transparent 1 px border (+1) so its edge fades out like
+        # OpenCV's zero border instead of being cut off
+        inv = np.array([[1, 0, 1.5], [0, 1, 1.5], [0, 0, 1]]) @ inv @ np.array([[1, 0, -0.5], [0, 1, -0.5], [0, 0, 1]])
+        coeffs = tuple((inv / inv[2, 2]).ravel()[:8])
+        size = (roi[2] - roi[0], roi[3] - roi[1])
+
+        def transform(array):
+            image = Image.fromarray(np.pad(array, ((1, 1), (1, 1)) + ((0, 0),) * (array.ndim - 2)))
+            return np.asarray(image.transform(size, Image.Transform.PERSPECTIVE, coeffs, Image.Resampling.BILINEAR))
+
+        return transform(color), transform(alpha), premultiplied
+
+    def warp_bent(self, logo, grid, grid_size, roi):
+        # Pillow has no dense remap; its MESH transform maps output boxes, not a bent grid
+        return _backends["numpy"].warp_bent(logo, grid, grid_size, roi)
+
+    def blend(self, region, color, alpha, premultiplied):
+        from PIL import Image, ImageChops
+
+        cap = Image.fromarray(np.ascontiguousarray(region))
+        logo = Image.fromarray(np.ascontiguousarray(color))
+        mask = Image.fromarray(np.ascontiguousarray(alpha))
+        if premultiplied:
+            out = ImageChops.add(logo, ImageChops.multiply(cap, ImageChops.invert(mask).convert("RGB")))
+        else:
+            out = Image.composite(logo, cap, mask)
+        region[:] = np.asarray(out)
+
+
+_backends = {backend.name: backend for backend in (OpenCVBackend(), NumpyBackend(), PILBackend())}
+BACKENDS = tuple(_backends)
+
+
+def get_backend(name=None):
+    """Backend instance by name (an instance is returned as is); None selects DEFAULT_BACKEND."""
+    if hasattr(name, "blend"):
+        return name
+    name = name or DEFAULT_BACKEND
+    try:
+        return _backends[name]
+    except KeyError:
+        raise ValueError(f"Unknown compositing backend {name!r}; choose from {', '.join(BACKENDS)}") from None
+
+
+# ----------------- ENGINE -----------------
+def composite(cap_img, placements, backend=None, copy=True):
+    """
+    Composites every placement onto a BGR cap image in one pass, touching only
+    the union of the placements' clipped bounding boxes. Returns a copy unless
+    copy=False.
+    """
+    backend = get_backend(backend)
+    with span("composite", backend=backend.name, placements=len(placements)):
+        out = cap_img.copy() if copy else cap_img
+        return blend_layers(out, warp_placements(placements, out.shape[:2], backend), backend)
+
+
+def warp_placements(placements, size, backend=None):
+    """
+    Warps every placement for a cap of size (h, w), clipped to the image, with
+    opacity applied. Returns layers in draw order, as (roi, color, alpha,
+    premultiplied), for blend_layers(); they only depend on the geometry, so
+    one set can be blended onto any number of caps of that size (colorways).
+    """
+    backend = get_backend(backend)
+    h, w = size
+    prepared = []
+    for order, placement in enumerate(placements):
+        p = normalize_placement(placement)
+        logo = _resolve_logo(p["logo"])
+        if logo is None:
+            raise ValueError(f"Could not read logo for placement {order + 1}.")
+        grid = p.get("grid")
+        bend = float(p.get("bend", 0.0))
+        if grid is None and bend:
+            grid = generate_bent_grid(p["quad"], bend)
+        roi = logo_roi(logo, p["quad"], w, h, grid, p.get("grid_size", BEND_GRID_SIZE))
+        if roi[2] <= roi[0] or roi[3] <= roi[1]:
+            continue
+        prepared.append((p.get("z", 0), order, logo, p, grid, roi))
+
+    layers = []
+    for _, _, logo, p, grid, roi in sorted(prepared, key=lambda item: (item[0], item[1])):
+        x0, y0, x1, y1 = roi
+        with span("warp", backend=backend.name, bent=grid is not None, pixels=(x1 - x0) * (y1 - y0)):
+            if grid is None:
+                color, alpha, premultiplied = backend.warp(logo, p["quad"], roi)
+            else:
+                color, alpha, premultiplied = backend.warp_bent(logo, grid, p.get("grid_size", BEND_GRID_SIZE), roi)
+            opacity = float(p.get("opacity", 1.0))
+            if opacity < 1.0:
+                alpha = np.rint(alpha * opacity).astype(np.uint8)
+                if premultiplied:
+                    color = np.rint(color * opacity).astype(np.uint8)
+        layers.append((roi, color, alpha, premultiplied))
+    return layers
+
+
+def blend_layers(img, layers, backend=None):
+    """Blends warp_placements() layers onto img in place, within their ROI union; returns img."""
+    if not layers:
+        return img
+    backend = get_backend(backend)
+    ux0 = min(roi[0] for roi, *_ in layers)
+    uy0 = min(roi[1] for roi, *_ in layers)
+    ux1 = max(roi[2] for roi, *_ in layers)
+    uy1 = max(roi[3] for roi, *_ in layers)
+    region = img[uy0:uy1, ux0:ux1]
+    for (x0, y0, x1, y1), color, alpha, premultiplied in layers:
+        with span("blend", backend=backend.name, pixels=(x1 - x0) * (y1 - y0)):
+            backend.blend(region[y0 - uy0:y1 - uy0, x0 - ux0:x1 - ux0], color, alpha, premultiplied)
+    return img
+
+
+def render(cap, placements, out_path, backend=None):
+    """
+    Composites every placement onto the cap and encodes once. cap is a path,
+    uploaded file or encoded bytes (decoded through the shared image cache)
+    or a BGR array; either is left untouched. Raises on failure, so it is
+    safe to run from a background worker.
+    """
+    if not isinstance(cap, np.ndarray):
+        from image_cache import load_image
+
+        source, cap = cap, load_image(cap)
+        if cap is None:
+            raise ValueError(f"Could not read the cap image: {source}")
+    out = composite(cap, placements, backend=backend)
+
+    with span("encode", format=os.path.splitext(out_path)[1].lower(), pixels=out.shape[0] * out.shape[1]):
+        if not cv2.imwrite(out_path, out):
+            raise IOError(f"Could not write {out_path}")
+    return out_path
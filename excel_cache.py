@@ -0,0 +1,155 @@
+"""
+Columnar cache for Excel design sheets.
+
+Each workbook is parsed once per content hash into a Parquet file (all cells
+as text, columns named "0", "1", ...). Later reads memory-map that file and
+pull only the requested columns and row range, so the Streamlit reruns and
+the PDF report share one parse. The Parquet files are an LRU (by mtime)
+bounded by DISK_BYTES.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from image_io import content_hash, read_bytes
+from tracing import span, traced
+
+CACHE_DIR = os.path.join(os.getenv("TECHPACK_CACHE_DIR", ".cache"), "excel")
+MAX_CACHED_TABLES = 8
+DISK_BYTES = int(os.getenv("TECHPACK_EXCEL_CACHE_BYTES", 512 * 1024 * 1024))
+
+_tables = OrderedDict()  # content hash -> pyarrow.Table
+_path_index = {}  # (abs path, mtime_ns, size) -> content hash
+_disk_bytes = None  # size of CACHE_DIR, measured on the first write
+_lock = threading.Lock()  # Streamlit runs each session on its own thread
+
+
+def _source_key(source):
+    """Returns (content hash, raw bytes or None when the hash was already known)."""
+    if isinstance(source, (str, os.PathLike)):
+        st = os.stat(source)
+        stat_key = (os.path.abspath(source), st.st_mtime_ns, st.st_size)
+        with _lock:
+            key = _path_index.get(stat_key)
+        if key is not None:
+            return key, None
+        data = read_bytes(source)
+        key = content_hash(data)
+        with _lock:
+            _path_index[stat_key] = key
+        return key, data
+
+    # Streamlit UploadedFile or any binary file-like object
+    data = source.getbuffer() if hasattr(source, "getbuffer") else source.read()
+    return content_hash(data), data
+
+
+@traced("excel.parse")
+def _parse_workbook(data):
+    df = pd.read_excel(io.BytesIO(data), header=None, dtype=object)
+    return pa.table({
+        str(i): pa.array([None if pd.isna(v) else str(v) for v in df.iloc[:, i]], type=pa.string())
+        for i in range(df.shape[1])
+    })
+
+
+def sheet_table(source):
+    """Arrow table for the first sheet of a workbook (path or uploaded file), parsed once."""
+    key, data = _source_key(source)
+    with _lock:
+        table = _tables.get(key)
+        if table is not None:
+            _tables.move_to_end(key)
+            return table
+
+    cache_path = os.path.join(CACHE_DIR, key + ".parquet")
+    try:
+        os.utime(cache_path)  # mtime is the LRU clock
+        table = pq.read_table(cache_path, memory_map=True)
+    except (OSError, pa.ArrowException):
+        if data is None:
+            data = read_bytes(source)
+        table = _parse_workbook(data)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pq.write_table(table, tmp_path)
+        written = os.path.getsize(tmp_path)
+        os.replace(tmp_path, cache_path)
+        _grow_disk(written, keep=cache_path)
+
+    with _lock:
+        _tables[key] = table
+        _tables.move_to_end(key)
+        while len(_tables) > MAX_CACHED_TABLES:
+            _tables.popitem(last=False)
+    return table
+
+
+def _disk_files():
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith(".parquet"):
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield st.st_mtime, st.st_size, path
+
+
+def _grow_disk(nbytes, keep):
+    global _disk_bytes
+    with _lock:
+        if _disk_bytes is None:
+            _disk_bytes = sum(size for _, size, _ in _disk_files())
+        else:
+            _disk_bytes += nbytes
+        if _disk_bytes <= DISK_BYTES:
+            return
+        # Other processes share the directory, so re-measure before evicting;
+        # tables held in memory here (and the one just written) are kept
+        in_use = {os.path.join(CACHE_DIR, k + ".parquet") for k in _tables} | {keep}
+        files = sorted(_disk_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= DISK_BYTES * 0.9:
+                break
+            if path in in_use:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        _disk_bytes = total
+
+
+def row_count(source):
+    return sheet_table(source).num_rows
+
+
+def read_range(source, start_row=0, end_row=None, columns=(0, 1), names=None):
+    """
+    Rows [start_row, end_row) of the given column indices as a DataFrame.
+    Only the selected columns and rows are materialised; missing cells are None.
+    """
+    with span("excel.load"):
+        table = sheet_table(source)
+    n_cols = table.num_columns
+    for i in columns:
+        if not -n_cols <= i < n_cols:
+            raise IndexError(f"Column index {i} is out of range for a sheet with {n_cols} columns.")
+
+    start, stop, _ = slice(start_row, end_row).indices(table.num_rows)
+    subset = table.select([str(i % n_cols) for i in columns]).slice(start, max(stop - start, 0))
+    df = subset.to_pandas()
+    df.columns = list(names) if names is not None else list(columns)
+    return df
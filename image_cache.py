@@ -0,0 +1,159 @@
+"""
+Shared cache of decoded cap images, keyed by content hash.
+
+Every consumer (the app's canvas and previews, render workers, the CLI) gets
+the same read-only BGR array for the same file contents instead of decoding
+its own copy, and display-scaled variants are cached alongside it so the
+app's resize for the canvas is done once per image rather than on every
+rerun. The cache is an LRU bounded by the total bytes of all arrays it holds.
+
+Arrays are shared, so they are read-only; copy before drawing on one.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from image_io import content_hash, decode_image, read_bytes
+from tracing import span
+
+MAX_BYTES = int(os.getenv("TECHPACK_IMAGE_CACHE_BYTES", 512 * 1024 * 1024))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class DecodedImage:
+    """A decoded image plus its cached display-size views."""
+
+    def __init__(self, key, bgr, owner=None):
+        bgr.setflags(write=False)
+        self.key = key
+        self.bgr = bgr
+        self.nbytes = bgr.nbytes
+        self._views = {}  # (width, rgb) -> array
+        self._owner = owner
+
+    @property
+    def width(self):
+        return self.bgr.shape[1]
+
+    @property
+    def height(self):
+        return self.bgr.shape[0]
+
+    def display(self, width, rgb=False):
+        """Read-only copy resized to width (INTER_AREA, aspect kept); rgb=True for PIL/canvas use."""
+        view = self._views.get((width, rgb))
+        if view is not None:
+            return view
+
+        import cv2
+
+        with span("display.resize", width=width):
+            view = self.bgr
+            if width != self.width:
+                view = cv2.resize(view, (width, int(self.height * width / self.width)), interpolation=cv2.INTER_AREA)
+            if rgb:
+                view = cv2.cvtColor(view, cv2.COLOR_BGR2RGB)
+        if view is not self.bgr:
+            view.setflags(write=False)
+            if self._owner is not None:
+                view = self._owner._add_view(self, (width, rgb), view)
+            else:
+                self._views[(width, rgb)] = view
+                self.nbytes += view.nbytes
+        return view
+
+
+class ImageCache:
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()  # content hash -> DecodedImage
+        self._bytes = 0
+        self._path_index = {}  # (abs path, mtime_ns, size) -> content hash
+        self._lock = threading.Lock()
+
+    def _source_key(self, source):
+        """Returns (content hash, raw bytes or None when the hash was already known)."""
+        if isinstance(source, (str, os.PathLike)):
+            st = os.stat(source)
+            stat_key = (os.path.abspath(source), st.st_mtime_ns, st.st_size)
+            key = self._path_index.get(stat_key)
+            if key is not None:
+                return key, None
+            data = read_bytes(source)
+            key = self._path_index[stat_key] = content_hash(data)
+            return key, data
+        # Streamlit UploadedFile, or raw bytes / memoryview
+        data = source.getbuffer() if hasattr(source, "getbuffer") else source
+        return content_hash(data), data
+
+    def get(self, source):
+        """DecodedImage for a path, uploaded file or encoded bytes; None if undecodable."""
+        try:
+            key, data = self._source_key(source)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        with span("decode.cap", bytes=len(data) if data is not None else None) as s:
+            if data is None:
+                data = read_bytes(source)
+                s.set(bytes=len(data))
+            bgr = decode_image(data)
+        if bgr is None:
+            return None
+        entry = DecodedImage(key, bgr, owner=self)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._bytes += entry.nbytes
+                self._evict(keep=key)
+            return self._entries[key]
+
+    def _add_view(self, entry, view_key, view):
+        with self._lock:
+            existing = entry._views.get(view_key)
+            if existing is not None:
+                return existing
+            entry._views[view_key] = view
+            entry.nbytes += view.nbytes
+            if self._entries.get(entry.key) is entry:
+                self._bytes += view.nbytes
+                self._evict(keep=entry.key)
+            return view
+
+    def _evict(self, keep):
+        # Called with the lock held; the newest entry stays even if it alone exceeds the budget
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                continue
+            self._bytes -= self._entries.pop(key).nbytes
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+
+def get_cache():
+    """Process-wide decoded-image cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
+
+
+def load_image(source):
+    """Shared read-only BGR array for a path, uploaded file or encoded bytes; None if unreadable."""
+    entry = get_cache().get(source)
+    return None if entry is None else entry.bgr
@@ -0,0 +1,30 @@
+"""
+Shared helpers for hashing and decoding image bytes.
+
+Hashing is used by lightweight modules (uploads, AI cache), so OpenCV and
+NumPy are only imported when an image is actually decoded.
+"""
+import hashlib
+
+
+def content_hash(data):
+    """Stable hex digest of raw file bytes, used as the key for every decoded-asset cache."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def decode_image(data, flags=None):
+    """Decode encoded image bytes (bytes, bytearray or memoryview) without touching disk."""
+    import cv2
+    import numpy as np
+
+    if flags is None:
+        flags = cv2.IMREAD_COLOR
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    return cv2.imdecode(buf, flags)
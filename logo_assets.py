@@ -0,0 +1,162 @@
+"""
+Logo asset layer: decode each logo once per content hash, split colour from
+alpha, and keep a premultiplied mip pyramid so warps sample a level close to
+the on-image size instead of the full-resolution artwork. The cache is an LRU
+bounded by the total bytes of the assets it holds.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from image_io import content_hash, decode_image, read_bytes
+from tracing import span
+
+MAX_BYTES = int(os.getenv("TECHPACK_LOGO_CACHE_BYTES", 256 * 1024 * 1024))
+MIN_LEVEL_SIZE = 8
+
+_assets = OrderedDict()  # content hash -> LogoAsset
+_assets_bytes = 0
+_path_index = {}  # (abs path, mtime_ns, size) -> content hash
+_lock = threading.Lock()  # Streamlit runs each session on its own thread
+
+
+def _premultiply(bgr, alpha):
+    acc = bgr.astype(np.uint16) * alpha.astype(np.uint16)[:, :, None]
+    acc += 128
+    acc += acc >> 8
+    return (acc >> 8).astype(np.uint8)
+
+
+class LogoAsset:
+    """
+    A decoded logo. Level 0 is the straight (non-premultiplied) colour so
+    full-size warps match the original blend exactly; downsampled levels are
+    premultiplied, built from a transient premultiplied level 0, so
+    transparent edges don't bleed dark fringes into the average.
+    """
+
+    def __init__(self, key, image):
+        self.key = key
+        if image.dtype != np.uint8:
+            image = (image >> 8).astype(np.uint8) if image.dtype == np.uint16 else cv2.convertScaleAbs(image)
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+
+        self.has_alpha = image.shape[2] == 4
+        if self.has_alpha:
+            self.bgr = np.ascontiguousarray(image[:, :, :3])
+            self.alpha = np.ascontiguousarray(image[:, :, 3])
+        else:
+            self.bgr = image
+            self.alpha = np.full(image.shape[:2], 255, dtype=np.uint8)
+
+        # pyramid[0] is None: level 0 is bgr/alpha, premultiplied only while level 1 is built
+        self.pyramid = [None]
+        color, alpha = _premultiply(self.bgr, self.alpha) if self.has_alpha else self.bgr, self.alpha
+        while min(alpha.shape[:2]) >= 2 * MIN_LEVEL_SIZE:
+            color, alpha = cv2.pyrDown(color), cv2.pyrDown(alpha)
+            self.pyramid.append((color, alpha))
+        self.nbytes = self.bgr.nbytes + self.alpha.nbytes + sum(c.nbytes + a.nbytes for c, a in self.pyramid[1:])
+
+    @property
+    def width(self):
+        return self.bgr.shape[1]
+
+    @property
+    def height(self):
+        return self.bgr.shape[0]
+
+    def level(self, index):
+        """Returns (colour, alpha, premultiplied) for a pyramid level."""
+        if index == 0:
+            return self.bgr, self.alpha, False
+        color, alpha = self.pyramid[index]
+        return color, alpha, True
+
+    def level_for_size(self, width, height):
+        """Deepest level that is still at least width x height, so the warp never upsamples a mip."""
+        best = 0
+        for i in range(len(self.pyramid)):
+            h, w = self.level(i)[1].shape[:2]
+            if w < width or h < height:
+                break
+            best = i
+        return best
+
+    def level_for_quad(self, dest_points):
+        """Pyramid level matching the on-image size of a tl, tr, br, bl quad."""
+        tl, tr, br, bl = np.asarray(dest_points, dtype=np.float64).reshape(4, 2)
+        width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+        height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+        return self.level_for_size(width, height)
+
+    def resized(self, width, height):
+        """Premultiplied colour and alpha resized to width x height from the nearest level."""
+        color, alpha, premultiplied = self.level(self.level_for_size(width, height))
+        if not premultiplied and self.has_alpha:
+            color = _premultiply(color, alpha)
+        return (
+            cv2.resize(color, (width, height), interpolation=cv2.INTER_AREA),
+            cv2.resize(alpha, (width, height), interpolation=cv2.INTER_AREA),
+        )
+
+
+def _cached(key):
+    with _lock:
+        asset = _assets.get(key)
+        if asset is not None:
+            _assets.move_to_end(key)
+        return asset
+
+
+def _remember(key, asset):
+    global _assets_bytes
+    with _lock:
+        if key in _assets:  # decoded concurrently by another session
+            _assets.move_to_end(key)
+            return _assets[key]
+        _assets[key] = asset
+        _assets_bytes += asset.nbytes
+        # The newest asset stays even if it alone is over budget
+        while _assets_bytes > MAX_BYTES and len(_assets) > 1:
+            _, evicted = _assets.popitem(last=False)
+            _assets_bytes -= evicted.nbytes
+    return asset
+
+
+def load_logo_asset(source):
+    """
+    Returns the cached LogoAsset for a logo file path or raw encoded bytes,
+    decoding it only the first time its content is seen. None if undecodable.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if not os.path.isfile(source):
+            return None
+        st = os.stat(source)
+        stat_key = (os.path.abspath(source), st.st_mtime_ns, st.st_size)
+        with _lock:
+            key = _path_index.get(stat_key)
+        asset = key and _cached(key)
+        if asset:
+            return asset
+        data = read_bytes(source)
+        key = content_hash(data)
+        with _lock:
+            _path_index[stat_key] = key
+    else:
+        data = source
+        key = content_hash(data)
+
+    asset = _cached(key)
+    if asset is not None:
+        return asset
+
+    with span("decode.logo", bytes=len(data)):
+        image = decode_image(data, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return None
+        asset = LogoAsset(key, image)
+    return _remember(key, asset)
@@ -1,160 +1,321 @@
+import threading
+from collections import OrderedDict
+
 import cv2
 import numpy as np
-import streamlit as st
 
+from logo_assets import LogoAsset
+from tracing import span
+
+BEND_GRID_SIZE = (5, 5)
+BEND_MAP_STEP = 4  # TPS is evaluated every few pixels and linearly upsampled
+BEND_CACHE_BYTES = 256 * 1024 * 1024
+
+_bend_maps = OrderedDict()  # (logo size, grid size, grid points, roi) -> (map1, map2)
+_bend_maps_bytes = 0
+_bend_maps_lock = threading.Lock()  # Streamlit runs each session on its own thread
+
+
+def _error(message):
+    # Streamlit is only needed for these UI wrappers, not for CLIs or render workers
+    import streamlit as st
 
-def apply_logo_realistic(cap_path, logo_path, dest_points, out_path):
+    st.error(message)
+
+
+def quad_roi(dest_points, width, height, pad=2):
     """
-    Applies a logo to a cap image with perspective warping.
+    Integer bounding box (x0, y0, x1, y1) of a destination quad, padded by a few
+    pixels for bilinear spill and clipped to the image. Empty when x1 <= x0 or y1 <= y0.
     """
-    try:
-        cap_img = cv2.imread(cap_path)
-        # Load the logo, preserving its channels (3 for JPG, 4 for PNG)
-        logo_img = cv2.imread(logo_path, cv2.IMREAD_UNCHANGED)
+    pts = np.asarray(dest_points, dtype=np.float32).reshape(-1, 2)
+    x0 = max(int(np.floor(pts[:, 0].min())) - pad, 0)
+    y0 = max(int(np.floor(pts[:, 1].min())) - pad, 0)
+    x1 = min(int(np.ceil(pts[:, 0].max())) + pad + 1, width)
+    y1 = min(int(np.ceil(pts[:, 1].max())) + pad + 1, height)
+    return x0, y0, x1, y1
+
+
+def blend_roi(cap_roi, logo_roi, alpha_roi, premultiplied=False):
+    """
+    Fixed-point alpha blend of a warped logo into a cap ROI, in place.
+    Computes (logo * a + cap * (255 - a)) / 255 in uint16 with an exact
+    shift-based division by 255, so no float temporaries are allocated.
+    A premultiplied logo already carries the logo * a / 255 term.
+    """
+    a = alpha_roi.astype(np.uint16)[:, :, None]
+    if premultiplied:
+        acc = logo_roi.astype(np.uint16) * np.uint16(255)
+    else:
+        acc = logo_roi.astype(np.uint16) * a
+    acc += cap_roi.astype(np.uint16) * (255 - a)
+    acc += 1 + (acc >> 8)
+    cap_roi[:] = acc >> 8
+    return cap_roi
+
+
+def _composite_full(cap_img, logo_rgb, alpha_channel, matrix):
+    """Original full-frame float32 blend, kept as the reference path."""
+    size = (cap_img.shape[1], cap_img.shape[0])
+    warped_logo_rgb = cv2.warpPerspective(logo_rgb, matrix, size)
+    warped_alpha_mask = cv2.warpPerspective(alpha_channel, matrix, size)
+
+    mask = cv2.cvtColor(warped_alpha_mask, cv2.COLOR_GRAY2BGR).astype(np.float32) / 255.0
+
+    cap_float = cap_img.astype(np.float32) / 255.0
+    logo_float = warped_logo_rgb.astype(np.float32) / 255.0
+
+    blended_float = (logo_float * mask) + (cap_float * (1.0 - mask))
 
-        if cap_img is None or logo_img is None:
-            st.error("Error: Could not read one of the images. Check paths.")
-            return None
+    return (blended_float * 255).astype(np.uint8)
 
-        h, w = logo_img.shape[:2]
-        src_points = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float32)
-        dest_points_np = np.array(dest_points, dtype=np.float32)
-        matrix = cv2.getPerspectiveTransform(src_points, dest_points_np)
 
-        # Check if the logo has an alpha (transparency) channel
-        if logo_img.shape[2] == 4:
-            logo_rgb = logo_img[:, :, :3]
-            alpha_channel = logo_img[:, :, 3]
-        else:
-            logo_rgb = logo_img
-            alpha_channel = np.ones((h, w), dtype=np.uint8) * 255
+def _perspective_matrix(width, height, dest_points):
+    src_points = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+    dest_points_np = np.array(dest_points, dtype=np.float32)
+    return cv2.getPerspectiveTransform(src_points, dest_points_np)
 
-        warped_logo_rgb = cv2.warpPerspective(logo_rgb, matrix, (cap_img.shape[1], cap_img.shape[0]))
 
-        warped_alpha_mask = cv2.warpPerspective(alpha_channel, matrix, (cap_img.shape[1], cap_img.shape[0]))
+def logo_roi(logo, dest_points, width, height, grid=None, grid_size=BEND_GRID_SIZE):
+    """
+    quad_roi() covering everything the warp of logo onto dest_points (or onto
+    a bent grid) can touch. An enlarged logo's edge pixels spill up to one
+    source pixel past the quad under bilinear sampling, which is more than
+    quad_roi's fixed pad once the sampled level is magnified.
+    """
+    quad = dest_points if grid is None else grid_corners(grid, grid_size)
+    alpha = logo.level(logo.level_for_quad(quad))[1]
+    h, w = alpha.shape[:2]
+    if grid is None:
+        # Source coordinates in (-1, w) x (-1, h) get a bilinear share of an edge pixel
+        support = np.array([[[-1, -1], [w, -1], [w, h], [-1, h]]], dtype=np.float64)
+        support = cv2.perspectiveTransform(support, _perspective_matrix(w, h, dest_points).astype(np.float64))[0]
+        return quad_roi(np.vstack([np.asarray(dest_points, dtype=np.float64).reshape(-1, 2), support]), width, height)
+    gx, gy = grid_size
+    pts = np.asarray(grid, dtype=np.float64).reshape(gy, gx, 2)
+    scale = max(
+        np.linalg.norm(np.diff(pts, axis=1), axis=-1).max() * (gx - 1) / w,
+        np.linalg.norm(np.diff(pts, axis=0), axis=-1).max() * (gy - 1) / h,
+    )
+    return quad_roi(pts.reshape(-1, 2), width, height, pad=2 + int(np.ceil(scale)))
+
+
+def warp_logo(logo, dest_points, origin, size):
+    """
+    Warps a LogoAsset onto dest_points inside a canvas whose top-left corner
+    sits at origin (x0, y0) of the cap and measures size (w, h).
+    Returns (colour, alpha, premultiplied) ready for blend_roi.
+    """
+    color, alpha, premultiplied = logo.level(logo.level_for_quad(dest_points))
+    matrix = _perspective_matrix(alpha.shape[1], alpha.shape[0], dest_points)
+
+    # Shift the homography so the ROI origin maps to (0, 0)
+    x0, y0 = origin
+    shift = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=np.float64)
+    roi_matrix = shift @ matrix
+
+    warped_color = cv2.warpPerspective(color, roi_matrix, size)
+    warped_alpha = cv2.warpPerspective(alpha, roi_matrix, size)
+    return warped_color, warped_alpha, premultiplied
+
+
+def _composite_roi(cap_img, logo, dest_points):
+    """Warp and blend only inside the bounding box of the destination quad."""
+    x0, y0, x1, y1 = logo_roi(logo, dest_points, cap_img.shape[1], cap_img.shape[0])
+    out = cap_img.copy()
+    if x1 <= x0 or y1 <= y0:
+        return out
+
+    warped_color, warped_alpha, premultiplied = warp_logo(logo, dest_points, (x0, y0), (x1 - x0, y1 - y0))
+    blend_roi(out[y0:y1, x0:x1], warped_color, warped_alpha, premultiplied)
+    return out
 
-        mask = cv2.cvtColor(warped_alpha_mask, cv2.COLOR_GRAY2BGR).astype(np.float32) / 255.0
 
-        cap_float = cap_img.astype(np.float32) / 255.0
-        logo_float = warped_logo_rgb.astype(np.float32) / 255.0
+def composite_logo(cap_img, logo, dest_points, mode="roi"):
+    """
+    Returns a copy of cap_img (BGR) with the logo warped onto dest_points.
+    logo is a LogoAsset or a decoded image array (3 channels for JPG, 4 for PNG).
+    mode="roi" blends in fixed point inside the quad's bounding box only,
+    sampling the pyramid level closest to the quad's size; mode="full" is the
+    original full-frame float32 path. At full size both agree within 1 LSB.
+    """
+    if not isinstance(logo, LogoAsset):
+        logo = LogoAsset(None, logo)
 
-        blended_float = (logo_float * mask) + (cap_float * (1.0 - mask))
+    if mode == "full":
+        matrix = _perspective_matrix(logo.width, logo.height, dest_points)
+        return _composite_full(cap_img, logo.bgr, logo.alpha, matrix)
+    if mode == "roi":
+        return _composite_roi(cap_img, logo, dest_points)
+    raise ValueError(f"Unknown compositing mode: {mode}")
 
-        blended_img = (blended_float * 255).astype(np.uint8)
 
-        cv2.imwrite(out_path, blended_img)
-        return out_path
+def apply_logo_realistic(cap_path, logo_path, dest_points, out_path, backend=None):
+    """
+    Applies a logo to a cap image with perspective warping.
+    """
+    return apply_logos_realistic(cap_path, [{"logo": logo_path, "quad": dest_points}], out_path, backend=backend)
+
+
+def apply_logos_realistic(cap_path, placements, out_path, backend=None):
+    """
+    Applies several logo placements to one cap image: the cap is decoded once,
+    every placement is composited in one pass, and the result is encoded once.
+    """
+    from compositing import render
 
+    try:
+        return render(cap_path, placements, out_path, backend=backend)
     except Exception as e:
-        st.error(f"An error occurred during image processing: {e}")
+        _error(f"An error occurred during image processing: {e}")
         return None
 
 
-# def generate_bent_grid(four_corners, bend_factor=0.0, grid_size=(5, 5)):
-#     """
-#     Generates a 25-point (5x5) grid based on 4 corner points and a bend factor.
-#     The bend is applied as a vertical parabolic curve.
-#     """
-#     tl, tr, br, bl = four_corners
-
-#     # Create arrays for easy interpolation
-#     top_edge = np.linspace(tl, tr, grid_size[0])
-#     bottom_edge = np.linspace(bl, br, grid_size[0])
-
-#     # Create the initial flat, perspective-corrected grid
-#     flat_grid = np.linspace(top_edge, bottom_edge, grid_size[1])
-
-#     # Calculate the direction and magnitude of the bend
-#     # The "down" vector is perpendicular to the top edge
-#     top_mid = (np.array(tl) + np.array(tr)) / 2
-#     bottom_mid = (np.array(bl) + np.array(br)) / 2
-#     down_vector = bottom_mid - top_mid
-
-#     # The max bend amount is a fraction of the height of the shape
-#     max_bend = np.linalg.norm(down_vector) * 0.5 * bend_factor
-
-#     bent_grid = []
-#     for i, row in enumerate(flat_grid):
-#         new_row = []
-#         for point in row:
-#             # v_ratio is how far down the grid we are (0.0 at top, 1.0 at bottom)
-#             v_ratio = i / (grid_size[1] - 1)
-
-#             # Use a parabolic function: 4 * (x - x^2)
-#             # This is 0 at the ends (v_ratio=0, 1) and 1 in the middle (v_ratio=0.5)
-#             parabolic_factor = 4 * (v_ratio - v_ratio**2)
-
-#             # Apply the offset
-#             offset = down_vector * (max_bend / np.linalg.norm(down_vector)) * parabolic_factor
-#             new_point = point + offset
-#             new_row.append(new_point)
-#         bent_grid.append(new_row)
-
-#     # Flatten the grid to a list of points for the next function
-#     return [tuple(p) for row in bent_grid for p in row]
-
-
-# def apply_logo_with_bend(cap_path, logo_path, dest_points_grid, out_path, grid_size=(5, 5)):
-#     """
-#     Applies a logo to a cap image with a realistic bend using Thin Plate Spline.
-#     (This function remains mostly the same as the one I provided before)
-#     """
-#     try:
-#         cap_img = cv2.imread(cap_path)
-#         logo_img = cv2.imread(logo_path, cv2.IMREAD_UNCHANGED)
-
-#         if cap_img is None or logo_img is None:
-#             st.error("Error: Could not read one of the images.")
-#             return None
-
-#         h, w = logo_img.shape[:2]
-
-#         # Create the source grid on the flat logo image
-#         src_points = []
-#         for i in range(grid_size[1]):
-#             for j in range(grid_size[0]):
-#                 x = j * (w / (grid_size[0] - 1))
-#                 y = i * (h / (grid_size[1] - 1))
-#                 src_points.append([x, y])
-
-#         src_points = np.array(src_points, dtype=np.float32).reshape((-1, 1, 2))
-#         dest_points = np.array(dest_points_grid, dtype=np.float32).reshape((-1, 1, 2))
-
-#         tps = cv2.createThinPlateSplineShapeTransformer()
-#         matches = [cv2.DMatch(i, i, 0) for i in range(len(src_points))]
-#         tps.estimateTransformation(src_points, dest_points, matches)
-
-#         warped_img = tps.warpImage(logo_img)
-
-#         # Blend the warped logo onto the cap
-#         if warped_img.shape[2] == 4:
-#             logo_rgb = warped_img[:, :, :3]
-#             alpha_channel = warped_img[:, :, 3]
-#         else:
-#             logo_rgb = warped_img
-#             alpha_channel = np.ones(warped_img.shape[:2], dtype=np.uint8) * 255
-
-#         mask = alpha_channel > 0
-#         rows, cols = np.where(mask)
-#         if len(rows) == 0 or len(cols) == 0:  # Handle cases where the warp is empty
-#             cv2.imwrite(out_path, cap_img)
-#             return out_path
-
-#         min_row, max_row = np.min(rows), np.max(rows)
-#         min_col, max_col = np.min(cols), np.max(cols)
-
-#         cap_roi = cap_img[min_row:max_row, min_col:max_col]
-#         logo_roi = logo_rgb[min_row:max_row, min_col:max_col]
-#         mask_roi = mask[min_row:max_row, min_col:max_col]
-
-#         blended_roi = np.where(mask_roi[..., None], logo_roi, cap_roi)
-
-#         final_img = cap_img.copy()
-#         final_img[min_row:max_row, min_col:max_col] = blended_roi
-
-#         cv2.imwrite(out_path, final_img)
-#         return out_path
-
-#     except Exception as e:
-#         st.error(f"An error occurred during bending process: {e}")
-#         return None
+# ----------------- BEND (THIN-PLATE SPLINE) -----------------
+def generate_bent_grid(four_corners, bend_factor=0.0, grid_size=BEND_GRID_SIZE):
+    """
+    Generates a grid_size (columns, rows) grid of points inside 4 corner points,
+    bent by a parabolic curve along the panel's "down" direction. The corners
+    stay where they were clicked; the middle columns sag (bend_factor > 0) or
+    arch (bend_factor < 0) by up to half the panel height, like a crown seam.
+    Returns an array of shape (rows * columns, 2), row-major.
+    """
+    tl, tr, br, bl = np.asarray(four_corners, dtype=np.float64).reshape(4, 2)
+    u = np.linspace(0.0, 1.0, grid_size[0])[None, :, None]
+    v = np.linspace(0.0, 1.0, grid_size[1])[:, None, None]
+
+    # Flat, perspective-corrected grid
+    top_edge = tl + (tr - tl) * u
+    bottom_edge = bl + (br - bl) * u
+    flat_grid = top_edge + (bottom_edge - top_edge) * v
+
+    # 4 * (u - u^2) is 0 at the side edges and 1 in the middle
+    down_vector = (bl + br) / 2 - (tl + tr) / 2
+    parabolic_factor = 4 * (u - u**2)
+    bent_grid = flat_grid + down_vector * 0.5 * bend_factor * parabolic_factor
+
+    return bent_grid.reshape(-1, 2)
+
+
+def _tps_kernel(d2):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = d2 * np.log(d2)
+    k[d2 == 0] = 0.0
+    return k
+
+
+def _tps_fit(ctrl, values):
+    """Solves the thin-plate spline mapping ctrl points (n, 2) onto values (n, 2)."""
+    n = len(ctrl)
+    d2 = ((ctrl[:, None, :] - ctrl[None, :, :]) ** 2).sum(-1)
+    P = np.hstack([np.ones((n, 1)), ctrl])
+    L = np.zeros((n + 3, n + 3))
+    L[:n, :n] = _tps_kernel(d2)
+    L[:n, n:] = P
+    L[n:, :n] = P.T
+    rhs = np.zeros((n + 3, 2))
+    rhs[:n] = values
+    return np.linalg.solve(L, rhs)
+
+
+def _tps_eval(coeffs, ctrl, pts):
+    n = len(ctrl)
+    d2 = ((pts[:, None, :] - ctrl[None, :, :]) ** 2).sum(-1)
+    return _tps_kernel(d2) @ coeffs[:n] + coeffs[n] + pts @ coeffs[n + 1:]
+
+
+def bend_lattice(logo_size, dest_grid, grid_size, roi):
+    """
+    Inverse spline (ROI pixel -> logo coordinates, destination grid -> logo
+    grid) evaluated every BEND_MAP_STEP pixels, as float32 (rows, cols, 2).
+    The lattice is aligned so bilinear upsampling to the ROI size, as
+    cv2.resize does it, gives the dense map.
+    """
+    w, h = logo_size
+    x0, y0, x1, y1 = roi
+    roi_w, roi_h = x1 - x0, y1 - y0
+
+    gx, gy = grid_size
+    jj, ii = np.meshgrid(np.arange(gx), np.arange(gy))
+    src = np.stack([jj.ravel() * w / (gx - 1), ii.ravel() * h / (gy - 1)], axis=1)
+
+    # Normalise for conditioning; the spline itself is scale invariant
+    scale = float(max(roi_w, roi_h))
+    ctrl = (np.asarray(dest_grid, dtype=np.float64) - (x0, y0)) / scale
+    coeffs = _tps_fit(ctrl, src)
+
+    nw = max(2, -(-roi_w // BEND_MAP_STEP))
+    nh = max(2, -(-roi_h // BEND_MAP_STEP))
+    xs = (np.arange(nw) + 0.5) * roi_w / nw - 0.5
+    ys = (np.arange(nh) + 0.5) * roi_h / nh - 0.5
+    px, py = np.meshgrid(xs / scale, ys / scale)
+    coarse = _tps_eval(coeffs, ctrl, np.stack([px.ravel(), py.ravel()], axis=1))
+    return coarse.reshape(nh, nw, 2).astype(np.float32)
+
+
+def _compute_bend_maps(logo_size, dest_grid, grid_size, roi):
+    """Dense fixed-point cv2.remap maps for the ROI, upsampled from bend_lattice."""
+    x0, y0, x1, y1 = roi
+    coarse = bend_lattice(logo_size, dest_grid, grid_size, roi)
+    dense = cv2.resize(coarse, (x1 - x0, y1 - y0), interpolation=cv2.INTER_LINEAR)
+    return cv2.convertMaps(dense[:, :, 0], dense[:, :, 1], cv2.CV_16SC2)
+
+
+def bend_maps(logo_size, dest_grid, grid_size, roi):
+    """
+    Cached remap maps keyed by logo size, grid size, the destination grid
+    points (which carry the bend factor) and the ROI, so re-rendering the same
+    bend is a single cv2.remap.
+    """
+    global _bend_maps_bytes
+    key = (tuple(logo_size), tuple(grid_size), tuple(np.round(dest_grid, 2).ravel().tolist()), tuple(roi))
+    with _bend_maps_lock:
+        maps = _bend_maps.get(key)
+        if maps is not None:
+            _bend_maps.move_to_end(key)
+            return maps
+
+    with span("bend.maps", pixels=(roi[2] - roi[0]) * (roi[3] - roi[1])):
+        maps = _compute_bend_maps(logo_size, dest_grid, grid_size, roi)
+    with _bend_maps_lock:
+        if key in _bend_maps:  # computed concurrently by another session
+            _bend_maps.move_to_end(key)
+            return _bend_maps[key]
+        _bend_maps[key] = maps
+        _bend_maps_bytes += maps[0].nbytes + maps[1].nbytes
+        while _bend_maps_bytes > BEND_CACHE_BYTES and len(_bend_maps) > 1:
+            _, (m1, m2) = _bend_maps.popitem(last=False)
+            _bend_maps_bytes -= m1.nbytes + m2.nbytes
+    return maps
+
+
+def grid_corners(dest_grid, grid_size):
+    gx = grid_size[0]
+    grid = np.asarray(dest_grid, dtype=np.float64).reshape(-1, 2)
+    return grid[[0, gx - 1, len(grid) - 1, len(grid) - gx]]
+
+
+def warp_logo_bent(logo, dest_grid, grid_size, roi):
+    """
+    Bends a LogoAsset onto a grid of destination points inside roi
+    (x0, y0, x1, y1). Returns (colour, alpha, premultiplied) ready for blend_roi.
+    """
+    color, alpha, premultiplied = logo.level(logo.level_for_quad(grid_corners(dest_grid, grid_size)))
+    map1, map2 = bend_maps((alpha.shape[1], alpha.shape[0]), dest_grid, grid_size, roi)
+    warped_color = cv2.remap(color, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+    warped_alpha = cv2.remap(alpha, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+    return warped_color, warped_alpha, premultiplied
+
+
+def apply_logo_with_bend(cap_path, logo_path, dest_points_grid, out_path, grid_size=BEND_GRID_SIZE, backend=None):
+    """
+    Applies a logo to a cap image with a realistic bend using Thin Plate Spline.
+    """
+    from compositing import render
+
+    try:
+        placement = {"logo": logo_path, "grid": dest_points_grid, "grid_size": grid_size}
+        return render(cap_path, [placement], out_path, backend=backend)
+    except Exception as e:
+        _error(f"An error occurred during bending process: {e}")
+        return None
@@ -0,0 +1,319 @@
+"""
+Placement templates: a reference photo per cap style and view plus the quad
+drawn on it, so new photos shot from the same studio angle get their logo
+quad without clicks.
+
+    store = get_store()
+    store.save("trucker", "front", "input/caps/front.jpg", quad)
+    match = store.match("new/front_0412.jpg")              # best template of any style
+    match = store.match(bgr, style="trucker", view="front")  # or a restricted set
+    match.quad, match.template.name, match.inliers
+
+Templates live under TECHPACK_TEMPLATE_DIR as <style>/<view>.json with a
+copy of the reference image and its ORB features (.npz, computed once on
+save). The store keeps every template's features in memory as one
+descriptor index, reloaded only when a template file changes. A photo is
+described once at MATCH_WIDTH; its descriptors vote against the whole index
+to shortlist templates, and each shortlisted template is verified with a
+ratio test and a MAGSAC++ (OpenCV's USAC RANSAC) homography, which maps the
+template quad onto the photo.
+"""
+import glob
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from image_io import content_hash, decode_image, read_bytes
+
+TEMPLATE_DIR = os.getenv("TECHPACK_TEMPLATE_DIR", "templates")
+FEATURE_VERSION = 1  # bump when the feature settings below change; cached .npz files are recomputed
+MATCH_WIDTH = 1024  # photos are described at this width
+MAX_FEATURES = 2000
+RATIO = 0.75  # Lowe's ratio test
+VOTE_DISTANCE = 48  # Hamming distance under which a nearest neighbour votes for its template
+SHORTLIST = 3  # templates verified with RANSAC per photo
+RANSAC_THRESHOLD = 4.0  # reprojection error in pixels at MATCH_WIDTH
+RANSAC_METHOD = cv2.USAC_MAGSAC  # plain cv2.RANSAC locks onto local models under strong perspective
+MIN_INLIERS = 25
+SPREAD_GRID = 8  # the reference is split into SPREAD_GRID x SPREAD_GRID cells ...
+MIN_SPREAD_CELLS = 4  # ... and inliers must fill this many (3+ each), not just a shared caption or logo
+
+Template = namedtuple("Template", "name style view quad size reference points descriptors")
+TemplateMatch = namedtuple("TemplateMatch", "template quad inliers homography")
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _slug(name):
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", str(name)).strip("_.")
+    if not slug:
+        raise ValueError(f"Invalid template name: {name!r}")
+    return slug
+
+
+def parse_selector(selector):
+    """(style, view) for "style/view", "style" or "auto"; None matches any."""
+    if selector in (None, True, "auto", "*", ""):
+        return None, None
+    style, _, view = str(selector).partition("/")
+    return style or None, view or None
+
+
+def _as_bgr(image):
+    """BGR array for a path, uploaded file, encoded bytes or array; None if unreadable."""
+    if isinstance(image, np.ndarray):
+        return image
+    from image_cache import load_image
+
+    return load_image(image)
+
+
+def features(bgr):
+    """ORB keypoints (N x 2 float32, full-resolution coordinates) and descriptors (N x 32 uint8)."""
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if bgr.ndim == 3 else bgr
+    scale = min(1.0, MATCH_WIDTH / gray.shape[1])
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    keypoints, descriptors = cv2.ORB_create(MAX_FEATURES).detectAndCompute(gray, None)
+    if descriptors is None:
+        return np.empty((0, 2), np.float32), np.empty((0, 32), np.uint8)
+    points = np.float32([kp.pt for kp in keypoints]) / scale
+    return points, descriptors
+
+
+def _spread_cells(points, size):
+    """Grid cells of the reference holding at least three of the points."""
+    w, h = size
+    cols = np.clip(points[:, 0] * SPREAD_GRID // w, 0, SPREAD_GRID - 1).astype(int)
+    rows = np.clip(points[:, 1] * SPREAD_GRID // h, 0, SPREAD_GRID - 1).astype(int)
+    return int((np.bincount(rows * SPREAD_GRID + cols, minlength=SPREAD_GRID**2) >= 3).sum())
+
+
+def _valid_quad(quad, size):
+    """Rejects degenerate mappings: the quad must stay convex and roughly on the photo."""
+    w, h = size
+    if not cv2.isContourConvex(quad.reshape(-1, 1, 2)) or cv2.contourArea(quad) < 4:
+        return False
+    return bool((quad[:, 0] > -w).all() and (quad[:, 0] < 2 * w).all() and (quad[:, 1] > -h).all() and (quad[:, 1] < 2 * h).all())
+
+
+class TemplateStore:
+    def __init__(self, root=TEMPLATE_DIR):
+        self.root = root
+        self._templates = []
+        self._descriptors = np.empty((0, 32), np.uint8)
+        self._owners = np.empty(0, np.int32)  # template index per descriptor row
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    # ----------------- FILES -----------------
+    def _json_paths(self):
+        return sorted(glob.glob(os.path.join(self.root, "*", "*.json")))
+
+    def _refresh(self):
+        """Reloads the in-memory index if template files were added, removed or changed."""
+        paths = self._json_paths()
+        stamp = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        if stamp == self._stamp:
+            return
+        templates = [t for t in (self._load(path) for path, _, _ in stamp) if t is not None]
+        self._templates = templates
+        if templates:
+            self._descriptors = np.vstack([t.descriptors for t in templates])
+            self._owners = np.repeat(np.arange(len(templates), dtype=np.int32), [len(t.descriptors) for t in templates])
+        else:
+            self._descriptors = np.empty((0, 32), np.uint8)
+            self._owners = np.empty(0, np.int32)
+        self._stamp = stamp
+
+    def _load(self, json_path):
+        try:
+            with open(json_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        base = os.path.dirname(json_path)
+        reference = os.path.join(base, meta["reference"])
+        npz_path = os.path.splitext(json_path)[0] + ".npz"
+        try:
+            with np.load(npz_path) as cached:
+                if int(cached["version"]) != FEATURE_VERSION or str(cached["reference_hash"]) != meta["reference_hash"]:
+                    raise ValueError("stale features")
+                points, descriptors = cached["points"], cached["descriptors"]
+        except (OSError, KeyError, ValueError):
+            bgr = _as_bgr(reference)
+            if bgr is None:
+                return None
+            points, descriptors = self._write_features(npz_path, bgr, meta["reference_hash"])
+        return Template(
+            f"{meta['style']}/{meta['view']}", meta["style"], meta["view"],
+            [tuple(p) for p in meta["quad"]], tuple(meta["size"]), reference, points, descriptors,
+        )
+
+    @staticmethod
+    def _write_features(npz_path, bgr, reference_hash):
+        points, descriptors = features(bgr)
+        tmp = npz_path + ".tmp.npz"
+        np.savez(tmp, version=FEATURE_VERSION, reference_hash=reference_hash, points=points, descriptors=descriptors)
+        os.replace(tmp, npz_path)
+        return points, descriptors
+
+    def save(self, style, view, reference, quad):
+        """
+        Stores (or replaces) the template for style/view: the reference photo
+        (path, uploaded file or encoded bytes), the quad in its pixel
+        coordinates and its features. Returns the Template.
+        """
+        style, view = _slug(style), _slug(view)
+        if isinstance(reference, (str, os.PathLike)):
+            ext, data = os.path.splitext(reference)[1].lower(), read_bytes(reference)
+        else:
+            ext = os.path.splitext(getattr(reference, "name", ""))[1].lower() or ".png"
+            data = reference.getbuffer() if hasattr(reference, "getbuffer") else reference
+        bgr = decode_image(data)
+        if bgr is None:
+            raise ValueError("Could not read the template's reference image.")
+        quad = [[float(x), float(y)] for x, y in quad]
+        if len(quad) != 4:
+            raise ValueError("A template needs a quad of four corners.")
+
+        base = os.path.join(self.root, style)
+        os.makedirs(base, exist_ok=True)
+        json_path = os.path.join(base, view + ".json")
+        meta = {
+            "style": style,
+            "view": view,
+            "quad": quad,
+            "size": [bgr.shape[1], bgr.shape[0]],
+            "reference": view + ext,
+            "reference_hash": content_hash(data),
+        }
+        with self._lock:
+            with open(os.path.join(base, view + ext), "wb") as f:
+                f.write(data)
+            self._write_features(os.path.join(base, view + ".npz"), bgr, meta["reference_hash"])
+            tmp = json_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=1)
+            os.replace(tmp, json_path)
+            self._stamp = None  # reload on next use
+            self._refresh()
+            return next(t for t in self._templates if t.name == f"{style}/{view}")
+
+    def templates(self):
+        with self._lock:
+            self._refresh()
+            return list(self._templates)
+
+    def fingerprint(self, selector):
+        """Hash of the template files a selector ("style/view", "style" or "auto") can match."""
+        style, view = parse_selector(selector)
+        pattern = os.path.join(self.root, style or "*", (view or "*") + ".json")
+        parts = [FEATURE_VERSION]
+        for path in sorted(glob.glob(pattern)):
+            try:
+                parts.append(content_hash(read_bytes(path)))
+            except OSError:
+                continue
+        return content_hash(json.dumps(parts).encode("utf-8"))
+
+    # ----------------- MATCHING -----------------
+    def match(self, image, style=None, view=None):
+        """
+        Best TemplateMatch for a photo (path, uploaded file, encoded bytes or
+        BGR array), optionally limited to one style and/or view; None if no
+        template matches with at least MIN_INLIERS inliers spread over
+        MIN_SPREAD_CELLS of its reference.
+        """
+        bgr = _as_bgr(image)
+        if bgr is None:
+            raise ValueError("Could not read the image to match.")
+        with self._lock:
+            self._refresh()
+            templates, descriptors, owners = self._templates, self._descriptors, self._owners
+        allowed = [i for i, t in enumerate(templates) if style in (None, t.style) and view in (None, t.view)]
+        if not allowed:
+            return None
+        points, query = features(bgr)
+        if len(query) < MIN_INLIERS:
+            return None
+
+        # Shortlist: every query descriptor votes for the template owning its nearest neighbour
+        if len(allowed) > SHORTLIST:
+            rows = np.isin(owners, allowed)
+            votes = np.zeros(len(templates), np.int64)
+            row_owners = owners[rows]
+            for m in cv2.BFMatcher(cv2.NORM_HAMMING).match(query, descriptors[rows]):
+                if m.distance < VOTE_DISTANCE:
+                    votes[row_owners[m.trainIdx]] += 1
+            allowed = sorted(allowed, key=lambda i: -votes[i])[:SHORTLIST]
+
+        scale = min(1.0, MATCH_WIDTH / bgr.shape[1])
+        best = None
+        matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        for i in allowed:
+            template = templates[i]
+            if len(template.descriptors) < 2:
+                continue
+            pairs = [p for p in matcher.knnMatch(query, template.descriptors, k=2) if len(p) == 2]
+            good = [m for m, n in pairs if m.distance < RATIO * n.distance]
+            if len(good) < MIN_INLIERS:
+                continue
+            src = template.points[[m.trainIdx for m in good]]
+            dst = points[[m.queryIdx for m in good]]
+            homography, inlier_mask = cv2.findHomography(src, dst, RANSAC_METHOD, RANSAC_THRESHOLD / scale)
+            if homography is None:
+                continue
+            inliers = int(inlier_mask.sum())
+            if inliers < MIN_INLIERS or (best is not None and inliers <= best.inliers):
+                continue
+            if _spread_cells(src[inlier_mask.ravel() == 1], template.size) < MIN_SPREAD_CELLS:
+                continue
+            quad = cv2.perspectiveTransform(np.float32(template.quad)[None], homography)[0]
+            if _valid_quad(quad, (bgr.shape[1], bgr.shape[0])):
+                best = TemplateMatch(template, [(float(x), float(y)) for x, y in quad], inliers, homography)
+        return best
+
+
+def get_store():
+    """Process-wide template store rooted at TECHPACK_TEMPLATE_DIR."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TemplateStore()
+        return _store
+
+
+def resolve_templates(cap, placements, store=None):
+    """
+    Placements with a "template" selector ("style/view", "style" or "auto")
+    and no geometry get the matched quad. The cap is matched once per
+    selector. Raises ValueError if a selector matches no template.
+    """
+    store = store or get_store()
+    matches = {}
+    resolved = []
+    for p in placements:
+        selector = p.get("template")
+        if selector is None or any(key in p for key in ("quad", "rect", "center", "grid")):
+            resolved.append(p)
+            continue
+        if selector not in matches:
+            matches[selector] = store.match(cap, *parse_selector(selector))
+        match = matches[selector]
+        if match is None:
+            raise ValueError(f"No placement template matched the cap for {selector!r}.")
+        resolved.append({**{k: v for k, v in p.items() if k != "template"}, "quad": match.quad})
+    return resolved
@@ -0,0 +1,219 @@
+"""
+Memoized composites, keyed by what actually determines the pixels.
+
+The key is the cap's content hash, each logo's content hash, the destination
+quads quantized to QUAD_STEP pixels, z/opacity/bend, and the render mode
+(e.g. preview size or "full"), so Streamlit reruns with an unchanged polygon
+and re-saves of an unchanged view are served from memory or disk instead of
+being composited again. Both tiers are LRUs with a byte budget, and hit/miss
+counters show how much work they save.
+"""
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from image_io import content_hash, read_bytes
+
+RENDER_VERSION = 4  # bump when compositing output changes, to invalidate cached renders
+QUAD_STEP = 1 / 8  # sub-pixel quantum for quad corners
+MEMORY_BYTES = int(os.getenv("TECHPACK_RENDER_CACHE_BYTES", 256 * 1024 * 1024))
+DISK_BYTES = int(os.getenv("TECHPACK_RENDER_CACHE_DISK_BYTES", 2 * 1024**3))
+CACHE_DIR = os.path.join(os.getenv("TECHPACK_CACHE_DIR", ".cache"), "renders")
+
+_cache = None
+_cache_lock = threading.Lock()
+_path_index = {}  # (abs path, mtime_ns, size) -> content hash
+
+
+def _file_hash(path):
+    st = os.stat(path)
+    stat_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    key = _path_index.get(stat_key)
+    if key is None:
+        key = _path_index[stat_key] = content_hash(read_bytes(path))
+    return key
+
+
+def source_hash(source):
+    """Content hash of a path, raw bytes or LogoAsset, without decoding it."""
+    if isinstance(source, (str, os.PathLike)):
+        return _file_hash(source)
+    if hasattr(source, "key"):
+        return source.key
+    return content_hash(source)
+
+
+def render_key(cap_hash, placements, mode, backend=None):
+    """Cache key for a set of placements on a cap; geometry is quantized to QUAD_STEP."""
+    from compositing import get_backend, normalize_placement
+
+    parts = [
+        [
+            source_hash(p["logo"]),
+            [[round(x / QUAD_STEP), round(y / QUAD_STEP)] for x, y in p.get("grid") or p["quad"]],
+            int(p.get("z", 0)),
+            round(float(p.get("opacity", 1.0)), 3),
+            round(float(p.get("bend", 0.0)), 3),
+        ]
+        for p in map(normalize_placement, placements)
+    ]
+    key = [RENDER_VERSION, cap_hash, parts, mode, get_backend(backend).name]
+    return content_hash(json.dumps(key).encode("utf-8"))
+
+
+class RenderCache:
+    """
+    In-memory LRU of decoded composites (read-only arrays) backed by a disk LRU
+    of encoded files, each bounded in bytes.
+    """
+
+    def __init__(self, max_bytes=MEMORY_BYTES, cache_dir=CACHE_DIR, disk_max_bytes=DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = self.disk_hits = self.misses = 0
+        self._entries = OrderedDict()  # key -> array
+        self._bytes = 0
+        self._disk_bytes = None  # measured on first disk write
+        self._lock = threading.Lock()
+
+    # --- memory tier ---
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return image
+
+    def put(self, key, image):
+        if image.nbytes > self.max_bytes:
+            return image
+        image.setflags(write=False)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = image
+            self._bytes += image.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return image
+
+    # --- disk tier ---
+    def _disk_path(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def fetch_file(self, key, out_path):
+        """Copies a cached render to out_path; False on a miss."""
+        path = self._disk_path(key, os.path.splitext(out_path)[1].lower())
+        try:
+            shutil.copyfile(path, out_path)
+            os.utime(path)  # mtime is the LRU clock
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.disk_hits += 1
+        return True
+
+    def store_file(self, key, rendered_path):
+        """Keeps a copy of a finished render for later fetch_file calls."""
+        path = self._disk_path(key, os.path.splitext(rendered_path)[1].lower())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(rendered_path, tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk()
+            else:
+                self._disk_bytes += os.path.getsize(path)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _disk_files(self):
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".tmp"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield st.st_mtime, st.st_size, path
+
+    def _scan_disk(self):
+        return sum(size for _, size, _ in self._disk_files())
+
+    def _evict_disk(self):
+        # Other processes share the directory, so re-measure before evicting
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.disk_max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+def get_cache():
+    """Process-wide render cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache()
+        return _cache
+
+
+def cached_composite(cap_img, cap_hash, placements, mode="preview", cache=None, backend=None):
+    """
+    compositing.composite through the memory cache. mode should identify how
+    cap_img was derived from the original cap (e.g. its preview size).
+    Returns a read-only array.
+    """
+    from compositing import composite
+
+    cache = cache or get_cache()
+    key = render_key(cap_hash, placements, mode, backend)
+    image = cache.get(key)
+    if image is None:
+        image = cache.put(key, composite(cap_img, placements, backend=backend))
+    return image
+
+
+def cached_render_view(cap_path, placements, out_path, cache=None, backend=None):
+    """compositing.render through the disk cache: unchanged inputs copy the earlier render."""
+    from compositing import render
+
+    if not isinstance(cap_path, (str, os.PathLike)):
+        return render(cap_path, placements, out_path, backend=backend)
+    cache = cache or get_cache()
+    key = render_key(_file_hash(cap_path), placements, "full", backend)
+    if cache.fetch_file(key, out_path):
+        return out_path
+    render(cap_path, placements, out_path, backend=backend)
+    cache.store_file(key, out_path)
+    return out_path
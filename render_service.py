@@ -0,0 +1,281 @@
+"""
+Shared background render service for the Streamlit app.
+
+Full-resolution composites and PDF builds run in one process pool shared by
+every session, so they neither block a session's script thread nor compete
+with other sessions for the GIL. Each session gets its own job queue, with a
+small in-flight limit so one user queueing many renders cannot starve the
+others, and its own workspace directory for outputs.
+
+    service = get_service()
+    job = service.submit(session_id, render_job, cap_path, placements, out_path, label="Front")
+    job.status  # "queued" | "running" | "done" | "failed" | "cancelled"
+    job.cancel()
+"""
+import itertools
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+WORKSPACE_ROOT = os.getenv("TECHPACK_WORKSPACE_DIR", "workspaces")
+MAX_WORKERS = int(os.getenv("TECHPACK_RENDER_WORKERS", 0)) or None  # None: one per core
+MAX_INFLIGHT_PER_SESSION = 2
+WORKER_IMAGE_CACHE_BYTES = int(os.getenv("TECHPACK_WORKER_IMAGE_CACHE_BYTES", 192 * 1024 * 1024))
+WORKSPACE_TTL = 24 * 3600  # session workspaces idle (untouched) for longer than this are removed
+CLEANUP_INTERVAL = 3600  # how often finished jobs trigger a workspace cleanup
+
+_service = None
+_service_lock = threading.Lock()
+
+
+# ----------------- WORKER FUNCTIONS -----------------
+# Run inside the pool processes; they import their heavy dependencies there.
+def init_worker():
+    import cv2
+
+    from image_cache import get_cache
+
+    cv2.setNumThreads(1)  # one process per core; let the pool provide the parallelism
+    # Each worker keeps its own decoded caps; enough for consecutive views of one cap
+    get_cache().max_bytes = WORKER_IMAGE_CACHE_BYTES
+
+
+def render_job(cap, placements, out_path, backend=None, thumbnails=False):
+    from render_cache import cached_render_view
+
+    if any("template" in p for p in placements):
+        from placement_templates import resolve_templates
+
+        placements = resolve_templates(cap, placements)
+    cached_render_view(cap, placements, out_path, backend=backend)
+    if thumbnails:
+        from thumbnails import make_thumbnails
+
+        make_thumbnails(out_path)
+    return out_path
+
+
+def colorway_job(cap, mask, colors, placements, out_paths, backend=None, thumbnails=False):
+    from colorways import render_colorways
+
+    return render_colorways(cap, mask, colors, placements, out_paths, backend=backend, thumbnails=thumbnails)
+
+
+def report_job(results, pdf_path, progress_path=None, **report_kwargs):
+    from report_pdf import generate_pdf_report
+
+    def progress(done):
+        tmp = progress_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(done))
+        os.replace(tmp, progress_path)
+
+    generate_pdf_report(results, pdf_path=pdf_path, progress=progress if progress_path else None, **report_kwargs)
+    return pdf_path
+
+
+# ----------------- JOBS -----------------
+class Job:
+    """One unit of background work, with a Future-like interface for polling."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, service, session, fn, args, kwargs, label="", total=None):
+        self.id = next(self._ids)
+        self.session = session
+        self.label = label
+        self.created = time.time()
+        self.progress_path = kwargs.get("progress_path")
+        self.total = total
+        self.future = Future()
+        self._service = service
+        self._call = (fn, args, kwargs)
+        self._pool = None  # the pool the job was submitted to
+        self._pool_future = None
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "done"
+        if self._pool_future is not None and self._pool_future.running():
+            return "running"
+        return "queued"
+
+    @property
+    def progress(self):
+        """Fraction done for jobs that report progress (e.g. PDF builds), else None."""
+        if not (self.progress_path and self.total):
+            return None
+        if self.future.done():
+            return 1.0
+        try:
+            with open(self.progress_path) as f:
+                return min(int(f.read() or 0) / self.total, 1.0)
+        except (OSError, ValueError):
+            return 0.0
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def exception(self, timeout=None):
+        return None if self.future.cancelled() else self.future.exception(timeout)
+
+    def cancel(self):
+        return self._service.cancel(self)
+
+
+# ----------------- SERVICE -----------------
+class RenderService:
+    def __init__(self, max_workers=MAX_WORKERS, workspace_root=WORKSPACE_ROOT, max_inflight=MAX_INFLIGHT_PER_SESSION):
+        self.max_workers = max_workers
+        self.workspace_root = workspace_root
+        self.max_inflight = max_inflight
+        self._pool = None
+        self._queues = {}  # session -> deque of queued Jobs
+        self._running = {}  # session -> set of Jobs handed to the pool
+        self._lock = threading.RLock()
+        self._last_cleanup = 0.0
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            import multiprocessing
+
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+            )
+        return self._pool
+
+    def _reset_pool(self, pool):
+        # Only the current pool: a late failure from a pool already replaced must not cancel the new one's jobs
+        if pool is not None and pool is self._pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def workspace(self, session):
+        """Per-session output directory (created on demand)."""
+        path = os.path.join(self.workspace_root, session)
+        os.makedirs(path, exist_ok=True)
+        self.touch(session)
+        return path
+
+    def touch(self, session):
+        """
+        Marks a session's workspace as in use: cleanup measures idle time from
+        its mtime, which writes alone would leave stale while a session only reads.
+        """
+        try:
+            os.utime(os.path.join(self.workspace_root, session))
+        except OSError:
+            pass  # no workspace yet
+
+    def submit(self, session, fn, *args, label="", total=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs) for this session; fn must be a picklable
+        top-level function. If kwargs has a progress_path (see report_job) and
+        total is given, job.progress reports how far the worker has got.
+        """
+        job = Job(self, session, fn, args, kwargs, label=label, total=total)
+        self.touch(session)
+        with self._lock:
+            self._queues.setdefault(session, deque()).append(job)
+            self._dispatch(session)
+        return job
+
+    def pending(self, session):
+        """Queued and running jobs for a session, oldest first."""
+        with self._lock:
+            jobs = list(self._running.get(session, ())) + list(self._queues.get(session, ()))
+        return sorted(jobs, key=lambda job: job.id)
+
+    def cancel(self, job):
+        """
+        Cancels a job. Queued jobs never run; a job already running in a worker
+        finishes there, but its result is discarded.
+        """
+        with self._lock:
+            queue = self._queues.get(job.session)
+            if queue and job in queue:
+                queue.remove(job)
+            elif job._pool_future is not None:
+                job._pool_future.cancel()
+            return job.future.cancel()
+
+    def cleanup_workspaces(self, max_age=WORKSPACE_TTL):
+        """Removes workspaces of sessions without jobs that have not been touched for max_age seconds."""
+        if not os.path.isdir(self.workspace_root):
+            return
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.workspace_root):
+            path = os.path.join(self.workspace_root, name)
+            with self._lock:
+                active = bool(self._queues.get(name) or self._running.get(name))
+            if not active and os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _maybe_cleanup(self):
+        with self._lock:
+            if time.time() - self._last_cleanup < CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = time.time()
+        self.cleanup_workspaces()
+
+    def _dispatch(self, session):
+        # Called with the lock held
+        queue = self._queues.get(session)
+        running = self._running.setdefault(session, set())
+        while queue and len(running) < self.max_inflight:
+            job = queue.popleft()
+            if job.future.cancelled():
+                continue
+            fn, args, kwargs = job._call
+            job._pool = self._ensure_pool()
+            try:
+                job._pool_future = job._pool.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool for this and later jobs
+                self._reset_pool(job._pool)
+                job._pool = self._ensure_pool()
+                job._pool_future = job._pool.submit(fn, *args, **kwargs)
+            running.add(job)
+            job._pool_future.add_done_callback(lambda f, job=job: self._finished(job, f))
+
+    def _finished(self, job, pool_future):
+        with self._lock:
+            self._running.get(job.session, set()).discard(job)
+            if not job.future.cancelled():
+                if pool_future.cancelled():
+                    job.future.cancel()
+                elif pool_future.exception() is not None:
+                    if isinstance(pool_future.exception(), BrokenProcessPool):
+                        self._reset_pool(job._pool)
+                    job.future.set_exception(pool_future.exception())
+                else:
+                    job.future.set_result(pool_future.result())
+            self._dispatch(job.session)
+        if job.progress_path:
+            try:
+                os.remove(job.progress_path)
+            except OSError:
+                pass
+        self._maybe_cleanup()
+
+
+def get_service():
+    """Process-wide render service shared by all app sessions."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RenderService()
+            _service._maybe_cleanup()
+        return _service
@@ -0,0 +1,198 @@
+"""
+Report image pipeline: resample images to the DPI of the box they are drawn
+in before ReportLab embeds them, optionally as JPEG, and hand out the same
+prepared file for repeated assets so each is decoded and embedded once.
+
+Inside without_a85(), image streams are stored Flate-compressed without
+ReportLab's ASCII85 layer: without its optional C accelerator, ASCII85
+encoding was most of the cost of rebuilding a report, and it makes every
+image 25% larger.
+"""
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+from reportlab import rl_config
+from reportlab.platypus import Flowable
+
+from tracing import span
+
+CACHE_DIR = os.path.join(os.getenv("TECHPACK_CACHE_DIR", ".cache"), "report_images")
+CACHE_BYTES = int(os.getenv("TECHPACK_REPORT_IMAGE_CACHE_BYTES", 1024**3))
+REPORT_DPI = 150
+JPEG_QUALITY = 85
+
+_a85_lock = threading.Lock()
+_a85_builds = 0
+_a85_saved = None
+
+
+@contextmanager
+def without_a85():
+    """
+    Turns off ReportLab's process-wide ASCII85 setting for the duration of a
+    build. Overlapping builds share it; the last one out restores the setting.
+    """
+    global _a85_builds, _a85_saved
+    with _a85_lock:
+        if _a85_builds == 0:
+            _a85_saved = rl_config.useA85
+            rl_config.useA85 = 0
+        _a85_builds += 1
+    try:
+        yield
+    finally:
+        with _a85_lock:
+            _a85_builds -= 1
+            if _a85_builds == 0:
+                rl_config.useA85 = _a85_saved
+
+
+class ReportImage(Flowable):
+    """
+    Image flowable drawn by filename: ReportLab then names the image XObject
+    after the path instead of digesting the decoded pixels, and decodes the
+    file once, when it is embedded.
+    """
+
+    def __init__(self, filename, width, height):
+        Flowable.__init__(self)
+        self.hAlign = "CENTER"
+        self.filename = filename
+        self.drawWidth, self.drawHeight = width, height
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        self.canv.drawImage(self.filename, 0, 0, self.drawWidth, self.drawHeight, mask="auto")
+
+
+class ReportImages:
+    """
+    Prepared images for one report. image_format is "png" (lossless) or
+    "jpeg"; JPEG only applies to images without transparency, so logos with
+    alpha stay PNG. Prepared files are cached on disk by source file
+    identity and target size, so unchanged images are not resampled again;
+    the least recently used files are evicted past cache_bytes.
+    """
+
+    def __init__(self, dpi=REPORT_DPI, image_format="png", jpeg_quality=JPEG_QUALITY, cache_dir=CACHE_DIR,
+                 cache_bytes=CACHE_BYTES):
+        if image_format not in ("png", "jpeg"):
+            raise ValueError(f"Unknown report image format: {image_format}")
+        self.dpi = dpi
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self.cache_dir = cache_dir
+        self.cache_bytes = cache_bytes
+        self._disk_bytes = None
+        self._sizes = {}
+        self._prepared = {}
+
+    def size(self, path):
+        """Pixel (width, height), read from the image header only."""
+        if path not in self._sizes:
+            with Image.open(path) as img:
+                self._sizes[path] = img.size
+        return self._sizes[path]
+
+    def _target_pixels(self, path, width, height):
+        w, h = self.size(path)
+        scale = min(1.0, width / 72.0 * self.dpi / w, height / 72.0 * self.dpi / h)
+        return max(1, round(w * scale)), max(1, round(h * scale))
+
+    def prepare(self, path, width, height):
+        """Path of a copy of path resampled for a width x height (points) box."""
+        target = self._target_pixels(path, width, height)
+        memo_key = (path, target)
+        if memo_key in self._prepared:
+            return self._prepared[memo_key]
+
+        st = os.stat(path)
+        ident = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{target}|{self.image_format}|{self.jpeg_quality}"
+        stem = hashlib.blake2b(ident.encode("utf-8"), digest_size=16).hexdigest()
+        for ext in (".jpg", ".png"):
+            cached = os.path.join(self.cache_dir, stem + ext)
+            try:
+                os.utime(cached)  # mtime is the LRU clock
+            except OSError:
+                continue
+            self._prepared[memo_key] = cached
+            return cached
+
+        with span("report.image", target=f"{target[0]}x{target[1]}"), Image.open(path) as img:
+            if img.format == "JPEG":
+                img.draft("RGB", target)  # DCT-domain downscale before decoding
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+            if has_alpha:
+                img = img.convert("RGBA")
+                has_alpha = img.getchannel("A").getextrema()[0] < 255  # fully opaque alpha is dropped
+            img = img.convert("RGBA" if has_alpha else "RGB")
+            if img.size != target:
+                img = img.resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self.image_format == "jpeg" and not has_alpha:
+                out = os.path.join(self.cache_dir, stem + ".jpg")
+                tmp = f"{out}.{os.getpid()}.tmp"
+                img.save(tmp, "JPEG", quality=self.jpeg_quality, optimize=True)
+            else:
+                out = os.path.join(self.cache_dir, stem + ".png")
+                tmp = f"{out}.{os.getpid()}.tmp"
+                img.save(tmp, "PNG", compress_level=6)
+            written = os.path.getsize(tmp)
+            os.replace(tmp, out)
+
+        self._prepared[memo_key] = out
+        self._grow_disk(written)
+        return out
+
+    def _disk_files(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".tmp"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _grow_disk(self, nbytes):
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+        else:
+            self._disk_bytes += nbytes
+        if self._disk_bytes > self.cache_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        # Other reports share the directory, so re-measure before evicting; files
+        # this report still has to draw are kept
+        in_use = set(self._prepared.values())
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.cache_bytes * 0.9:
+                break
+            if path in in_use:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
+
+    def flowable(self, path, width, height):
+        """
+        Image flowable for path drawn at width x height points. Repeated assets
+        share one prepared file, which ReportLab embeds as a single image XObject.
+        """
+        return ReportImage(self.prepare(path, width, height), width, height)
@@ -0,0 +1,249 @@
+"""
+PDF tech pack report: design data table, cap views and placement summary.
+
+Kept separate from the CLI and app so ReportLab, Pillow and pandas are only
+imported when a report is actually built.
+
+A finished report is kept under a key made of everything it is built from
+(ReportKey), so rebuilding a result list with nothing changed is a file copy.
+Otherwise unchanged views reuse their prepared images (report_images).
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
+
+from excel_cache import read_range
+from report_images import JPEG_QUALITY, REPORT_DPI, ReportImages, without_a85
+from report_stream import StreamingStory
+from report_tables import DataTable
+from tracing import span
+
+REPORT_VERSION = 1  # bump when the layout changes, to invalidate cached reports
+REPORT_CACHE_DIR = os.path.join(os.getenv("TECHPACK_CACHE_DIR", ".cache"), "reports")
+MAX_CACHED_REPORTS = int(os.getenv("TECHPACK_REPORT_CACHE_SIZE", 8))
+
+
+def fetch_key_value_table(file_path, start_row=0, end_row=None, columns=None):
+    """
+    Reads Excel file and returns a list of lists suitable for ReportLab Table.
+    columns format: {"indices": [col_idx1, col_idx2], "names": ["Detail", "Value"]}
+    Uses the cached columnar copy of the workbook, reading only the requested range.
+    """
+    if columns is None:
+        cols_to_take = [0, 1]
+        col_names = ["Column 1", "Column 2"]
+    else:
+        cols_to_take = columns.get("indices", [0, 1])
+        col_names = columns.get("names", [f"Column {i+1}" for i in cols_to_take])
+
+    subset = read_range(file_path, start_row, end_row, columns=cols_to_take, names=col_names)
+    return subset.values.tolist()
+
+
+# --- PDF Report ---
+def _report_story(results, images, excel_file, excel_columns, excel_start_row, excel_end_row, progress):
+    """
+    Yields the report's flowables one at a time. Results are pulled lazily, so
+    only the views currently being laid out are held in memory; the
+    measurement rows are collected as they stream past and emitted at the end.
+    """
+    styles = getSampleStyleSheet()
+    normal = ParagraphStyle("NormalWrap", parent=styles["Normal"], fontSize=10)
+    heading = styles["Heading2"]
+
+    # Title
+    yield Paragraph("<b>Trucker Hat Tech Pack</b>", styles["Title"])
+    yield Spacer(1, 20)
+
+    yield Paragraph("<b>Design Summary</b>", styles["Title"])
+    yield Spacer(1, 12)
+
+    # Fabric & Design Details (dynamic Excel)
+    if excel_file and os.path.exists(excel_file):
+        yield Paragraph("Fabric & Design Details", heading)
+        yield Spacer(1, 12)
+        try:
+            design_data = fetch_key_value_table(
+                excel_file, start_row=excel_start_row, end_row=excel_end_row, columns=excel_columns
+            )
+            design_table = DataTable(design_data, [7*cm, 8*cm], [
+                ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+                ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+                ('VALIGN', (0,0), (-1,-1), 'TOP'),
+            ], repeat_rows=0, cell_style=normal)
+        except Exception as e:
+            yield Paragraph(f"<b>⚠️ Error reading Excel file:</b> {str(e)}", normal)
+            yield Spacer(1, 12)
+        else:
+            yield design_table
+            yield Spacer(1, 20)
+
+    # Cap images
+    measurements = []
+    for done, item in enumerate(results, 1):
+        w, h = images.size(item["output"])
+        aspect = w / h
+        max_w, max_h = A4[0] - 4*cm, A4[1] - 8*cm
+
+        if aspect > 1:
+            display_w = max_w
+            display_h = max_w / aspect
+        else:
+            display_h = max_h
+            display_w = max_h * aspect
+
+        yield images.flowable(item["output"], display_w, display_h)
+        yield Spacer(1, 6)
+
+        measurements.append((item["logo"], item["size_cm"], item["placement"], item["description"]))
+        if progress:
+            progress(done)
+
+    # Measurements
+    yield PageBreak()
+    yield Paragraph("Design and Label Measurements", heading)
+    yield Spacer(1, 12)
+    yield Paragraph("Logo Placement Summary", heading)
+    yield Spacer(1, 12)
+
+    table_data = [["Logo", "Size (cm)", "Placement", "AI Description"]]
+    for logo, size, placement, description in measurements:
+        size_cm = f"{size[0]:.2f} × {size[1]:.2f} cm"
+        logo_preview = images.flowable(logo, 2*cm, 2*cm)
+        table_data.append([logo_preview, size_cm, placement, description])
+
+    meas_table = DataTable(table_data, [3*cm, 3*cm, 4*cm, 6*cm], [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+        ('ALIGN', (1, 1), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ], cell_style=normal)
+    yield meas_table
+    yield Spacer(1, 14)
+
+
+def _stamp(source):
+    """Identity of one input: path, mtime and size for files, a content hash otherwise."""
+    if isinstance(source, (str, os.PathLike)):
+        st = os.stat(source)
+        return [os.path.abspath(source), st.st_mtime_ns, st.st_size]
+    from render_cache import source_hash
+
+    return source_hash(source)
+
+
+class ReportKey:
+    """
+    Cache key of a report, fed one view at a time so a streamed result set is
+    keyed as it is laid out: each view's output and logo (path, mtime, size),
+    size, placement and description, the Excel range and the image options.
+    hexdigest() is None if an input file could not be read.
+    """
+
+    def __init__(self, excel_file=None, excel_columns=None, excel_start_row=0, excel_end_row=None, **options):
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._valid = True
+        self._update(lambda: [
+            REPORT_VERSION,
+            excel_file and os.path.exists(excel_file) and [_stamp(excel_file), excel_start_row, excel_end_row, excel_columns],
+            sorted(options.items()),
+        ])
+
+    def _update(self, ident):
+        if self._valid:
+            try:
+                self._hash.update(json.dumps(ident(), default=str).encode("utf-8") + b"\n")
+            except OSError:
+                self._valid = False
+
+    def add(self, item):
+        self._update(lambda: [
+            _stamp(item["output"]), _stamp(item["logo"]), list(item["size_cm"]), item["placement"], item["description"]
+        ])
+
+    def feed(self, results):
+        """Yields results unchanged, adding each view to the key on the way."""
+        for item in results:
+            self.add(item)
+            yield item
+
+    def hexdigest(self):
+        return self._hash.hexdigest() if self._valid else None
+
+
+def _fetch_report(key, pdf_path):
+    path = os.path.join(REPORT_CACHE_DIR, key + ".pdf")
+    try:
+        shutil.copyfile(path, pdf_path)
+        os.utime(path)  # mtime is the LRU clock
+    except OSError:
+        return False
+    return True
+
+
+def _store_report(key, pdf_path):
+    os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+    path = os.path.join(REPORT_CACHE_DIR, key + ".pdf")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(pdf_path, tmp)
+    os.replace(tmp, path)
+    reports = []
+    for name in os.listdir(REPORT_CACHE_DIR):
+        if name.endswith(".pdf"):
+            try:
+                reports.append((os.stat(os.path.join(REPORT_CACHE_DIR, name)).st_mtime, name))
+            except OSError:
+                continue
+    for _, name in sorted(reports)[:-MAX_CACHED_REPORTS or None]:
+        try:
+            os.remove(os.path.join(REPORT_CACHE_DIR, name))
+        except OSError:
+            pass
+
+
+def generate_pdf_report(results, pdf_path="logo_techpack.pdf", excel_file=None, excel_columns=None, excel_start_row=0, excel_end_row=None,
+                        image_dpi=REPORT_DPI, image_format="png", jpeg_quality=JPEG_QUALITY, progress=None):
+    """
+    Builds the tech pack PDF. results may be a list or a generator; it is
+    consumed once and laid out as it streams, so memory stays bounded for
+    catalog-sized packs. progress(views_done) is called after each view.
+    Images are resampled to image_dpi for the box they are drawn in;
+    image_format="jpeg" stores opaque photos as JPEG. A list whose inputs
+    are all unchanged is copied from the report cache instead of rebuilt.
+    """
+    key = ReportKey(excel_file, excel_columns, excel_start_row, excel_end_row,
+                    image_dpi=image_dpi, image_format=image_format, jpeg_quality=jpeg_quality)
+    if isinstance(results, (list, tuple)):
+        for item in results:
+            key.add(item)
+        if key.hexdigest() and _fetch_report(key.hexdigest(), pdf_path):
+            if progress:
+                progress(len(results))
+            print(f"📄 Techpack PDF saved as {pdf_path} (unchanged)")
+            return
+    else:
+        # A generator is keyed as it streams: its report is stored, but never looked up first
+        results = key.feed(results)
+
+    doc = SimpleDocTemplate(pdf_path, pagesize=A4)
+    images = ReportImages(dpi=image_dpi, image_format=image_format, jpeg_quality=jpeg_quality)
+
+    # Build PDF
+    with span("report.build"), without_a85():
+        doc.build(StreamingStory(_report_story(
+            results, images, excel_file, excel_columns, excel_start_row, excel_end_row, progress
+        )))
+    if key.hexdigest() and MAX_CACHED_REPORTS > 0:
+        _store_report(key.hexdigest(), pdf_path)
+    print(f"📄 Techpack PDF saved as {pdf_path}")
@@ -0,0 +1,41 @@
+"""
+Streaming story for large PDF reports.
+
+StreamingStory is the flowable list handed to the public doc.build(); it
+pulls flowables lazily from an iterator whenever the layout looks at it,
+keeping only a small lookahead window in memory instead of the whole story.
+Finished pages keep only their compressed content in the canvas, and each
+flowable (and any decoded image it holds) is released as soon as it has
+been placed.
+"""
+LOOKAHEAD = 8
+
+
+class StreamingStory(list):
+    """
+    A list of flowables that refills itself from an iterable (e.g. a generator).
+    The layout only reads the front of the story, deletes what it placed and
+    puts split parts back, so len() and indexing top it up to lookahead items
+    and keepWithNext and splits can still look ahead.
+    """
+
+    def __init__(self, flowables, lookahead=LOOKAHEAD):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            nxt = next(self._source, None)
+            if nxt is None:
+                self._source = None
+            else:
+                list.append(self, nxt)
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
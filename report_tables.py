@@ -0,0 +1,204 @@
+"""
+Scalable tables for the PDF report.
+
+ReportLab's Table re-measures and copies every remaining row each time it is
+split across a page, so a single table with thousands of rows costs
+O(rows x pages). DataTable measures each row once up front and hands the
+frame one page-sized LongTable at a time, repeating the header rows on every
+page. Cells whose text fits on one line are drawn as plain strings; only
+cells that need wrapping become Paragraphs.
+"""
+from bisect import bisect_right
+from itertools import accumulate
+from xml.sax.saxutils import escape
+
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, LongTable, Paragraph, TableStyle
+
+# ReportLab Table defaults for cell padding
+PAD_X = 6
+PAD_Y = 3
+
+# Style commands that change a cell's measured size: font, size, leading, left/right/top/bottom padding
+_SIZE_OPS = {"FONT", "FONTNAME", "FACE", "FONTSIZE", "SIZE", "LEADING",
+             "LEFTPADDING", "RIGHTPADDING", "TOPPADDING", "BOTTOMPADDING"}
+_SLOTS = {"FONTNAME": 0, "FACE": 0, "FONTSIZE": 1, "SIZE": 1, "LEADING": 2,
+          "LEFTPADDING": 3, "RIGHTPADDING": 4, "TOPPADDING": 5, "BOTTOMPADDING": 6}
+
+
+def default_cell_style(font_size=10):
+    return ParagraphStyle("TableCell", parent=getSampleStyleSheet()["Normal"], fontSize=font_size,
+                          leading=font_size * 1.2)
+
+
+def fits_plain(text, width, font="Helvetica", font_size=10, padding=2 * PAD_X):
+    """True if text can be drawn as a plain string on one line within width."""
+    return "\n" not in text and stringWidth(text, font, font_size) <= width - padding
+
+
+def _span(start, stop, count):
+    """Cells a style command covers along one axis; negative indices count from the end."""
+    if start < 0:
+        start += count
+    if stop < 0:
+        stop += count
+    return min(max(start, 0), count), min(stop + 1, count)
+
+
+def _set(cell, op, values):
+    # Same rules as ReportLab's _setCellStyle
+    if op == "FONT":
+        cell[0] = values[0]
+        if len(values) > 1:
+            cell[1] = values[1]
+            cell[2] = values[2] if len(values) > 2 else values[1] * 1.2
+    else:
+        cell[_SLOTS[op]] = values[0]
+
+
+class DataTable(Flowable):
+    """
+    A long table that splits page by page in linear time.
+
+    rows: list of rows; cells may be strings (wrapped only if needed) or flowables.
+    col_widths: column widths in points (required, so no measuring pass is needed).
+    style: TableStyle commands; header rows are always rows 0..repeat_rows-1 of
+    each page chunk, so body commands should address whole ranges, e.g. (0, 1)-(-1, -1).
+    With repeat_rows=0, row indices address the whole table, as with Table.
+    """
+
+    _shared = ("col_widths", "style", "repeat_rows", "cell_style", "plain_fast_path", "_rows", "_heights", "_offsets")
+
+    def __init__(self, rows, col_widths, style=(), repeat_rows=1, cell_style=None, plain_fast_path=True):
+        super().__init__()
+        self.col_widths = list(col_widths)
+        self.repeat_rows = repeat_rows
+        self.cell_style = cell_style = cell_style or default_cell_style()
+        # Plain-string cells are drawn in the same font as the wrapped ones
+        self.style = [
+            ("FONTNAME", (0, 0), (-1, -1), cell_style.fontName),
+            ("FONTSIZE", (0, 0), (-1, -1), cell_style.fontSize),
+            ("LEADING", (0, 0), (-1, -1), cell_style.leading),
+            *(style.getCommands() if isinstance(style, TableStyle) else style),
+        ]
+        self.plain_fast_path = plain_fast_path
+        rows = list(rows)
+        styles = self._cell_styles(len(rows))
+        self._rows = [self._cells(row, cells) for row, cells in zip(rows, styles)]
+        self._heights = [self._row_height(row, cells) for row, cells in zip(self._rows, styles)]
+        self._offsets = [0, *accumulate(self._heights[repeat_rows:])]
+        self._start = repeat_rows
+        self._end = len(self._rows)
+
+    def _cell_styles(self, nrows):
+        """
+        Font, size, leading and padding of every cell, from the style commands.
+
+        Rows between the same command boundaries share one list of per-column
+        styles, so this costs O(commands) per boundary rather than per cell.
+        """
+        ncols = len(self.col_widths)
+        commands = []
+        for op, start, stop, *values in self.style:
+            if op in _SIZE_OPS:
+                commands.append((op, _span(start[0], stop[0], ncols), _span(start[1], stop[1], nrows), values))
+        cuts = sorted({0, nrows}.union(*(rows for _, _, rows, _ in commands)))
+        styles = []
+        for lo, hi in zip(cuts, cuts[1:]):
+            cells = [["Helvetica", 10, 12, PAD_X, PAD_X, PAD_Y, PAD_Y] for _ in range(ncols)]
+            for op, (c0, c1), (r0, r1), values in commands:
+                if r0 <= lo and hi <= r1:
+                    for cell in cells[c0:c1]:
+                        _set(cell, op, values)
+            styles.extend([cells] * (hi - lo))
+        return styles
+
+    def _cells(self, row, styles):
+        cells = []
+        for text, width, (font, size, _, left, right, _, _) in zip(row, self.col_widths, styles):
+            if text is None:
+                text = ""
+            if isinstance(text, (int, float)):
+                text = str(text)
+            if isinstance(text, str) and not (self.plain_fast_path and fits_plain(text, width, font, size, left + right)):
+                text = Paragraph(escape(text).replace("\n", "<br/>"), self.cell_style)
+            cells.append(text)
+        return cells
+
+    def _row_height(self, row, styles):
+        # Same per-cell measure as Table: content plus that cell's own vertical padding
+        height = 0
+        for cell, width, (_, size, leading, left, right, top, bottom) in zip(row, self.col_widths, styles):
+            if isinstance(cell, Flowable):
+                content = cell.wrap(width - left - right, 1e6)[1]
+            else:
+                content = leading or 1.2 * size
+            height = max(height, content + top + bottom)
+        return height
+
+    def _header_height(self):
+        return sum(self._heights[:self.repeat_rows])
+
+    def _body_height(self, start, end):
+        base = self.repeat_rows
+        return self._offsets[end - base] - self._offsets[start - base]
+
+    def _copy(self, start, end):
+        # Share the measured rows; don't carry over the frame's layout flags
+        part = object.__new__(DataTable)
+        Flowable.__init__(part)
+        for name in self._shared:
+            setattr(part, name, getattr(self, name))
+        part._start, part._end = start, end
+        return part
+
+    def _build_table(self):
+        head = self.repeat_rows
+        table = LongTable(
+            self._rows[:head] + self._rows[self._start:self._end],
+            colWidths=self.col_widths,
+            rowHeights=self._heights[:head] + self._heights[self._start:self._end],
+            repeatRows=head,
+        )
+        table.setStyle(TableStyle(self._chunk_style()))
+        return table
+
+    def _chunk_style(self):
+        """
+        Style for this chunk. With a repeated header the commands already address
+        each chunk's own rows; without one, row indices are shifted into the chunk
+        like Table.split does, so e.g. a first-row background stays on page one.
+        """
+        if self.repeat_rows or not self._start:
+            return self.style
+        style = []
+        for op, (sc, sr), (ec, er), *values in self.style:
+            if sr >= 0:
+                sr = max(sr - self._start, 0)
+            if er >= 0:
+                er -= self._start
+                if er < 0:
+                    continue  # only covers rows on earlier pages
+            style.append((op, (sc, sr), (ec, er), *values))
+        return style
+
+    def wrap(self, availWidth, availHeight):
+        self.width = sum(self.col_widths)
+        self.height = self._header_height() + self._body_height(self._start, self._end)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        # Number of body rows that fit below the header in the available height
+        base = self.repeat_rows
+        budget = availHeight - self._header_height() + self._offsets[self._start - base]
+        fit = bisect_right(self._offsets, budget) - 1 + base
+        fit = min(fit, self._end)
+        if fit <= self._start:
+            return []
+        return [self._copy(self._start, fit), self._copy(fit, self._end)]
+
+    def draw(self):
+        table = self._build_table()
+        table.wrapOn(self.canv, self.width, self.height)
+        table.drawOn(self.canv, 0, 0)
@@ -0,0 +1,98 @@
+"""
+Command-line entry point for headless tech pack jobs.
+
+    python techpack.py render manifest.json [--workers N] [--force] [--output-dir DIR]
+    python techpack.py template add STYLE VIEW reference.jpg --quad x1,y1,x2,y2,x3,y3,x4,y4
+    python techpack.py template list
+    python techpack.py template match photos/*.jpg [--style STYLE] [--view VIEW]
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def cmd_render(args):
+    from batch_render import load_manifest, run
+
+    try:
+        manifest = load_manifest(args.manifest)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"❌ Invalid manifest {args.manifest}: {e}")
+        return 2
+    if args.output_dir:
+        manifest["output_dir"] = os.path.abspath(args.output_dir)
+    counts = run(manifest, workers=args.workers, force=args.force)
+    return 1 if counts["failed"] else 0
+
+
+def cmd_template(args):
+    from placement_templates import get_store
+
+    store = get_store()
+    if args.action == "add":
+        try:
+            coords = [float(v) for v in args.quad.split(",")]
+            if len(coords) != 8:
+                raise ValueError("--quad needs 8 numbers: x1,y1,...,x4,y4 (TL, TR, BR, BL)")
+            template = store.save(args.style, args.view, args.reference, list(zip(coords[::2], coords[1::2])))
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not save template: {e}")
+            return 2
+        print(f"✅ Saved template {template.name} ({len(template.descriptors)} features)")
+        return 0
+
+    if args.action == "list":
+        for template in store.templates():
+            print(f"{template.name}: {template.size[0]}x{template.size[1]}, {len(template.descriptors)} features")
+        return 0
+
+    # match: one JSON line per photo, ready to paste into a manifest or pipe on
+    unmatched = 0
+    for path in args.photos:
+        try:
+            match = store.match(path, style=args.style, view=args.view)
+        except ValueError as e:
+            match, error = None, str(e)
+        else:
+            error = "no template matched"
+        if match is None:
+            unmatched += 1
+            print(json.dumps({"photo": path, "template": None, "error": error}))
+        else:
+            quad = [[round(x, 1), round(y, 1)] for x, y in match.quad]
+            print(json.dumps({"photo": path, "template": match.template.name, "inliers": match.inliers, "quad": quad}))
+    return 1 if unmatched else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="techpack", description="Headless tech pack tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="render cap views and build one PDF per style from a manifest")
+    render.add_argument("manifest", help="JSON or YAML job manifest")
+    render.add_argument("--workers", type=int, default=None, help="render processes (default: one per core)")
+    render.add_argument("--force", action="store_true", help="rebuild outputs even if their inputs are unchanged")
+    render.add_argument("--output-dir", help="override the manifest's output_dir")
+    render.set_defaults(func=cmd_render)
+
+    template = commands.add_parser("template", help="manage placement templates and match photos against them")
+    actions = template.add_subparsers(dest="action", required=True)
+    add = actions.add_parser("add", help="store a reference photo and its logo quad for a style and view")
+    add.add_argument("style")
+    add.add_argument("view")
+    add.add_argument("reference", help="reference photo of the style/view")
+    add.add_argument("--quad", required=True, help="x1,y1,...,x4,y4 corners in reference pixels (TL, TR, BR, BL)")
+    actions.add_parser("list", help="list stored templates")
+    match = actions.add_parser("match", help="print the matched template and quad for each photo as JSON lines")
+    match.add_argument("photos", nargs="+")
+    match.add_argument("--style", help="only match this style's templates")
+    match.add_argument("--view", help="only match templates of this view")
+    template.set_defaults(func=cmd_template)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Gallery thumbnails for rendered views.
+
+Every output gets downscaled copies at THUMB_WIDTHS, written next to it as
+<name>.thumb<width>.webp (JPEG where OpenCV has no WebP encoder). Render
+workers make them right after the full-resolution render, so the app's
+gallery sends a few KB per view instead of the full image on every rerun;
+full resolution is only loaded when a view is opened. Thumbnails older than
+their output are rebuilt on demand.
+"""
+import os
+
+import cv2
+
+from tracing import span
+
+THUMB_WIDTHS = (256, 512, 1024)
+QUALITY = 80
+
+_format = None
+
+
+def _thumb_format():
+    global _format
+    if _format is None:
+        _format = ".webp" if cv2.haveImageWriter(".webp") else ".jpg"
+    return _format
+
+
+def thumbnail_path(output, width):
+    return f"{os.path.splitext(output)[0]}.thumb{width}{_thumb_format()}"
+
+
+def make_thumbnails(output, image=None, widths=THUMB_WIDTHS):
+    """
+    Writes every thumbnail of output and returns {width: path}. image is the
+    output's BGR array if the caller still has it; otherwise the file is
+    decoded. Images narrower than a width are stored at their own size.
+    """
+    if image is None:
+        image = cv2.imread(output, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not read {output} for thumbnails.")
+    fmt = _thumb_format()
+    params = [cv2.IMWRITE_WEBP_QUALITY if fmt == ".webp" else cv2.IMWRITE_JPEG_QUALITY, QUALITY]
+    paths = {}
+    with span("thumbnails", widths=len(widths), pixels=image.shape[0] * image.shape[1]):
+        # Largest first, each downscaled from the previous one
+        for width in sorted(widths, reverse=True):
+            if image.shape[1] > width:
+                height = max(1, round(image.shape[0] * width / image.shape[1]))
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            path = paths[width] = thumbnail_path(output, width)
+            tmp = path + ".tmp" + fmt
+            if not cv2.imwrite(tmp, image, params):
+                raise IOError(f"Could not write {path}")
+            os.replace(tmp, path)
+    return paths
+
+
+def thumbnail(output, width):
+    """
+    Path of the smallest stored thumbnail at least width wide (the largest
+    if none is), rebuilding the set if it is missing or older than the
+    output. None if the output itself does not exist.
+    """
+    try:
+        output_mtime = os.stat(output).st_mtime_ns
+    except OSError:
+        return None
+    size = next((w for w in sorted(THUMB_WIDTHS) if w >= width), max(THUMB_WIDTHS))
+    path = thumbnail_path(output, size)
+    try:
+        if os.stat(path).st_mtime_ns >= output_mtime:
+            return path
+    except OSError:
+        pass
+    return make_thumbnails(output)[size]
@@ -0,0 +1,248 @@
+"""
+Lightweight per-stage tracing: decode, warp, blend, encode, AI calls, Excel
+parsing, report layout.
+
+    with span("warp", backend="opencv"):
+        ...
+
+Tracing is off unless TECHPACK_TRACE=1 (or enable() is called); span() then
+returns a shared no-op context manager, so instrumented code pays one
+function call. When on, every span records its wall time and RSS delta,
+and the process keeps recent samples per stage for latency percentiles.
+Spans are written as one JSON object per line to TECHPACK_TRACE_LOG
+(default: stderr), shown in the app's sidebar, and served in Prometheus
+text format by start_metrics_server() (TECHPACK_METRICS_PORT).
+
+Samples are per process: render workers log their spans, but the app's
+sidebar and endpoint only aggregate the spans of the app process.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+ENABLED = os.getenv("TECHPACK_TRACE", "") not in ("", "0")
+LOG_PATH = os.getenv("TECHPACK_TRACE_LOG")  # None: stderr
+METRICS_PORT = int(os.getenv("TECHPACK_METRICS_PORT", 0))
+MAX_SAMPLES = 1000  # recent samples kept per stage for percentiles
+QUANTILES = (0.5, 0.9, 0.99)
+
+_parent = contextvars.ContextVar("techpack_span", default=None)
+_recorder = None
+_recorder_lock = threading.Lock()
+_logger = None
+_server = None
+_server_lock = threading.Lock()
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def _rss_bytes():
+    """Current resident set size (Linux /proc; peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Adds attributes known only once the stage has run (e.g. a cache hit)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._token = _parent.set(self.name)
+        self._rss = _rss_bytes()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        rss_delta = _rss_bytes() - self._rss
+        _parent.reset(self._token)
+        get_recorder().record(self.name, seconds, rss_delta)
+        _log({
+            "ts": round(time.time(), 6),
+            "span": self.name,
+            "parent": _parent.get(),
+            "ms": round(seconds * 1000, 3),
+            "rss_delta_mb": round(rss_delta / 2**20, 3),
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "error": exc_type.__name__ if exc_type else None,
+            **self.attrs,
+        })
+        return False
+
+
+def span(name, **attrs):
+    """Context manager timing one stage; a no-op unless tracing is enabled."""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced(name):
+    """Decorator form of span() for whole functions."""
+    def decorate(fn):
+        import functools
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enable(log_path=None):
+    """Turns tracing on for this process (and for workers spawned after it)."""
+    global ENABLED, LOG_PATH
+    ENABLED = True
+    os.environ["TECHPACK_TRACE"] = "1"
+    if log_path:
+        LOG_PATH = os.environ["TECHPACK_TRACE_LOG"] = log_path
+
+
+def _log(record):
+    global _logger
+    if _logger is None:
+        import logging
+
+        logger = logging.getLogger("techpack.trace")
+        if not logger.handlers:
+            handler = logging.FileHandler(LOG_PATH) if LOG_PATH else logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        _logger = logger
+    _logger.info(json.dumps(record, default=str))
+
+
+# ----------------- AGGREGATION -----------------
+class Recorder:
+    """Per-stage counters plus a bounded window of recent samples."""
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._stages = {}  # name -> [count, total seconds, total rss delta, deque of seconds]
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, rss_delta):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = [0, 0.0, 0, deque(maxlen=self.max_samples)]
+            stage[0] += 1
+            stage[1] += seconds
+            stage[2] += rss_delta
+            stage[3].append(seconds)
+
+    def summary(self):
+        """One dict per stage: count, total/mean seconds, latency quantiles, mean RSS delta."""
+        with self._lock:
+            stages = {name: (count, total, rss, sorted(samples)) for name, (count, total, rss, samples) in self._stages.items()}
+        rows = []
+        for name, (count, total, rss, samples) in sorted(stages.items()):
+            row = {"stage": name, "count": count, "total_s": total, "mean_ms": total / count * 1000}
+            for q in QUANTILES:
+                row[f"p{q * 100:g}_ms"] = samples[min(int(q * len(samples)), len(samples) - 1)] * 1000
+            row["mean_rss_delta_mb"] = rss / count / 2**20
+            rows.append(row)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def prometheus(self):
+        """Summary in Prometheus text exposition format."""
+        lines = [
+            "# HELP techpack_stage_seconds Wall time per pipeline stage.",
+            "# TYPE techpack_stage_seconds summary",
+        ]
+        rows = self.summary()
+        for row in rows:
+            label = row["stage"].replace("\\", "\\\\").replace('"', '\\"')
+            for q in QUANTILES:
+                lines.append(f'techpack_stage_seconds{{stage="{label}",quantile="{q:g}"}} {row[f"p{q * 100:g}_ms"] / 1000:.6f}')
+            lines.append(f'techpack_stage_seconds_sum{{stage="{label}"}} {row["total_s"]:.6f}')
+            lines.append(f'techpack_stage_seconds_count{{stage="{label}"}} {row["count"]}')
+        lines += [
+            "# HELP techpack_stage_rss_delta_bytes Mean resident memory change per stage.",
+            "# TYPE techpack_stage_rss_delta_bytes gauge",
+        ]
+        for row in rows:
+            label = row["stage"].replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'techpack_stage_rss_delta_bytes{{stage="{label}"}} {row["mean_rss_delta_mb"] * 2**20:.0f}')
+        return "\n".join(lines) + "\n"
+
+
+def get_recorder():
+    """Process-wide span recorder."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = Recorder()
+        return _recorder
+
+
+# ----------------- METRICS ENDPOINT -----------------
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    """
+    Serves GET /metrics (Prometheus text) from a daemon thread; idempotent.
+    Binds to localhost only. Returns the bound port.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server.server_address[1]
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = get_recorder().prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes are not worth a log line each
+
+        _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server.server_address[1]